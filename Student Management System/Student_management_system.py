@@ -1,51 +1,136 @@
+import time
+_PROCESS_START = time.perf_counter()
+
+import argparse
+import os
+import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import sqlite3
-import csv
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-
-DB_FILE = "app.db"
-
-# ------------------------ DB Bootstrap ------------------------
-def db_connect():
-    return sqlite3.connect(DB_FILE)
-
-def init_db():
-    conn = db_connect()
-    c = conn.cursor()
-
-    # Users table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('admin','staff','student'))
-        )
-    """)
-
-    # Students table (username is UNIQUE so one login links to at most one record)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            roll_no TEXT PRIMARY KEY,
-            name TEXT,
-            email TEXT,
-            gender TEXT,
-            contact TEXT,
-            dob TEXT,
-            address TEXT,
-            username TEXT UNIQUE
-        )
-    """)
-
-    # Seed admin if missing
-    c.execute("SELECT 1 FROM users WHERE username='admin'")
-    if not c.fetchone():
-        c.execute("INSERT INTO users (username, password, role) VALUES (?,?,?)",
-                  ("admin", "admin123", "admin"))
-    conn.commit()
-    conn.close()
+from sms_db import (PAGE_SIZE, MAX_LOADED_PAGES, SEARCH_LIMIT, close_db, init_db, authenticate,
+                    count_students, fetch_student_page, search_available, search_students,
+                    fetch_student, fetch_student_range, STUDENT_COLUMNS, STUDENT_LABELS,
+                    ROLES, role_allows, role_filter, birth_filter, normalize_row, link_username, roster_stats,
+                    db_rebuild_stats, age_bands, db_merge_students, db_add_user, db_apply_writes,
+                    user_campus, sort_key, build_filter, FILTER_OPS)
+from sms_tasks import TaskRunner, WriteQueue
+from sms_theme import Themes
+from sms_metrics import metrics, profile_text
+
+# Search-as-you-type: wait this long after the last keystroke, and for this many characters
+SEARCH_DEBOUNCE_MS = 250
+LIVE_SEARCH_MIN_CHARS = 2
+
+# How often the loaded window of rows is diffed against the database
+RECONCILE_MS = 30000
+
+
+# ------------------------ Data Source ------------------------
+# With --server the data-layer names above are rebound to an sms_server client, so the
+# rest of the module runs unchanged against the shared service instead of app.db.
+# With campuses set up they are rebound to an sms_shards router over the login's campus
+# files instead (every campus for an unrestricted login); logins stay in app.db.
+_remote = None
+_shards = None
+
+def _use_server(url):
+    global _remote
+    from sms_client import ServiceClient
+    _remote = ServiceClient(url)
+    for name in ServiceClient.DATA_API:
+        globals()[name] = getattr(_remote, name)
+
+def _use_campuses(username):
+    global _shards
+    from sms_shards import ShardRouter
+    _shards = ShardRouter.for_login(user_campus(username))
+    if _shards is not None:
+        for name in ShardRouter.DATA_API:
+            globals()[name] = getattr(_shards, name)
+
+def _in_campus(fn, *args, **kwargs):
+    # Work on one database file (imports, scans, backups) goes to the campus chosen for
+    # new students when there are campuses
+    if _shards is None:
+        return fn(*args, **kwargs)
+    with _shards.bound():
+        return fn(*args, **kwargs)
+
+
+# ------------------------ Lazy Subsystems ------------------------
+# CSV and PDF support are imported on first use, on the worker thread that needs them:
+# reportlab alone costs more at launch than the rest of the app put together.
+@metrics.op("import_csv", kind="task")
+def _import_csv(*args, **kwargs):
+    if _remote is not None:
+        return _remote.import_students_csv(*args, **kwargs)
+    from sms_io import import_students_csv
+    if _shards is not None:
+        kwargs["claimed"] = _shards.claimed_elsewhere
+    return _in_campus(import_students_csv, *args, **kwargs)
+
+@metrics.op("export_csv", kind="task")
+def _export_csv(*args, **kwargs):
+    if _remote is not None:
+        return _remote.export_students_csv(*args, **kwargs)
+    from sms_io import export_students_csv
+    return export_students_csv(*args, source=_shards, **kwargs)
+
+@metrics.op("export_pdf", kind="task")
+def _export_pdf(*args, **kwargs):
+    if _remote is not None:
+        return _remote.export_students_pdf(*args, **kwargs)
+    from sms_report import export_students_pdf
+    return export_students_pdf(*args, source=_shards, **kwargs)
+
+@metrics.op("backup", kind="task")
+def _backup(progress=None, cancelled=None):
+    # In --server mode the server snapshots its own database
+    if _remote is not None:
+        return _remote.backup_database(progress=progress, cancelled=cancelled)
+    from sms_backup import backup_database
+    return _in_campus(backup_database, progress=progress, cancelled=cancelled)
+
+@metrics.op("restore_backup", kind="task")
+def _restore_backup(path):
+    from sms_backup import restore_backup
+    return _in_campus(restore_backup, path)
+
+@metrics.op("find_duplicates", kind="task")
+def _find_duplicates(threshold, cancelled=None):
+    # The scan reads the database file in a worker process (local databases only)
+    from sms_db import get_db
+    from sms_dedup import find_duplicates_in_process
+    return _in_campus(lambda: find_duplicates_in_process(get_db().path, threshold, cancelled))
+
+
+# ------------------------ Startup Timing ------------------------
+class StartupTimer:
+    """Milestones from process start to the first rows on the dashboard (--startup-timing)."""
+
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.marks = []
+        self.enabled = False
+        self.done = False
+
+    def mark(self, label):
+        now = time.perf_counter()
+        self.marks.append((label, (now - self.last) * 1000, (now - self.start) * 1000))
+        self.last = now
+
+    def finish(self, label):
+        if self.done:
+            return
+        self.mark(label)
+        self.done = True
+        if self.enabled:
+            for label, step, total in self.marks:
+                print(f"[startup] {label:<20}{step:9.1f} ms   t+{total:.1f} ms", file=sys.stderr)
 
+startup = StartupTimer(_PROCESS_START)
+startup.mark("imports")
 
 # ------------------------ Login Window ------------------------
 class LoginWindow:
@@ -53,39 +138,37 @@ class LoginWindow:
         self.root = root
         self.root.title("Student Management - Login")
         self.root.geometry("1200x600")
-        self.root.config(bg="#ecf0f1")
+        self.theme = Themes(root)
+        self.theme.track(root, "backdrop")
 
         self.username = tk.StringVar()
         self.password = tk.StringVar()
         self.show_password = tk.BooleanVar(value=False)
 
-        login_frame = tk.Frame(root, bg="white", bd=5, relief=tk.RIDGE)
+        login_frame = ttk.Frame(root, style="Card.TFrame")
         login_frame.place(relx=0.5, rely=0.5, anchor="center", width=420, height=380)
 
-        tk.Label(login_frame, text="Login", font=("Helvetica", 22, "bold"),
-                 bg="white", fg="#2c3e50").pack(pady=18)
+        ttk.Label(login_frame, text="Login", font=("Helvetica", 22, "bold")).pack(pady=18)
 
-        tk.Label(login_frame, text="Username", font=("Arial", 12),
-                 bg="white", anchor="w").pack(padx=40, anchor="w")
-        tk.Entry(login_frame, textvariable=self.username,
-                 font=("Arial", 12), width=30).pack(pady=6)
+        ttk.Label(login_frame, text="Username", font=("Arial", 12), anchor="w").pack(padx=40, anchor="w")
+        ttk.Entry(login_frame, textvariable=self.username,
+                  font=("Arial", 12), width=30).pack(pady=6)
 
-        tk.Label(login_frame, text="Password", font=("Arial", 12),
-                 bg="white", anchor="w").pack(padx=40, anchor="w")
-        self.password_entry = tk.Entry(login_frame, textvariable=self.password,
-                                       font=("Arial", 12), width=30, show="*")
+        ttk.Label(login_frame, text="Password", font=("Arial", 12), anchor="w").pack(padx=40, anchor="w")
+        self.password_entry = ttk.Entry(login_frame, textvariable=self.password,
+                                        font=("Arial", 12), width=30, show="*")
         self.password_entry.pack(pady=6)
 
-        tk.Checkbutton(login_frame, text="Show Password", variable=self.show_password,
-                       command=self.toggle_password, bg="white").pack(pady=6)
+        ttk.Checkbutton(login_frame, text="Show Password", variable=self.show_password,
+                        command=self.toggle_password).pack(pady=6)
 
-        row = tk.Frame(login_frame, bg="white")
+        row = ttk.Frame(login_frame)
         row.pack(pady=14)
-        tk.Button(row, text="Login", command=self.login, font=("Arial", 12), width=15,
-                  bg="#3498db", fg="white").grid(row=0, column=0, padx=6)
+        ttk.Button(row, text="Login", command=self.login, width=15,
+                   style="Primary.TButton").grid(row=0, column=0, padx=6)
 
-        tk.Label(login_frame, text="Default admin: admin / admin123",
-                 font=("Arial", 9), bg="white", fg="gray").pack(pady=6)
+        ttk.Label(login_frame, text="Default admin: admin / admin123",
+                  font=("Arial", 9), style="Muted.TLabel").pack(pady=6)
 
     def toggle_password(self):
         self.password_entry.config(show="" if self.show_password.get() else "*")
@@ -98,18 +181,26 @@ class LoginWindow:
             messagebox.showerror("Error", "Enter username and password.")
             return
 
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute("SELECT role FROM users WHERE username=? AND password=?", (user, pwd))
-        row = c.fetchone()
-        conn.close()
-
-        if row:
-            role = row[0]
+        startup.mark("waiting at login")
+        role = authenticate(user, pwd)
+        startup.mark("authenticate")
+
+        if role:
+            if _remote is None:
+                try:
+                    _use_campuses(user)
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
+                    return
             self.root.destroy()
             main_root = tk.Tk()
-            StudentManagementSystem(main_root, user_role=role, username=user)
-            main_root.mainloop()
+            app = StudentManagementSystem(main_root, user_role=role, username=user)
+            startup.mark("dashboard built")
+            try:
+                main_root.mainloop()
+            finally:
+                # No-op after a normal close; otherwise queued edits still get written
+                app.writes.close()
         else:
             messagebox.showerror("Access Denied", "Invalid username or password!")
 
@@ -120,38 +211,47 @@ class StudentManagementSystem:
         self.root = root
         self.role = user_role.lower()
         self.username = username
-        self.dark_mode = False
 
         self.root.title(f"{self.role.capitalize()} Dashboard - Student Management System")
         self.root.geometry("1600x600")
-        self.root.config(bg="white")
+        # Every look is a named ttk style; switching themes is one swap (see sms_theme)
+        self.theme = Themes(self.root)
+        self.theme.track(self.root)
 
         # Title bar
-        self.title_bar = tk.Label(self.root, text="Student Management System",
-                                  font=("Arial", 20, "bold"), bg="#34495e", fg="white")
+        self.title_bar = ttk.Label(self.root, text="Student Management System",
+                                   font=("Arial", 20, "bold"), style="Title.TLabel")
         self.title_bar.pack(side=tk.TOP, fill=tk.X)
 
         # Welcome + theme toggle
-        top_row = tk.Frame(self.root, bg="white")
+        top_row = ttk.Frame(self.root)
         top_row.pack(fill="x")
-        tk.Label(top_row, text=f"Welcome, {self.username} 👋 (Role: {self.role})",
-                 font=("Helvetica", 13, "bold"),
-                 bg="white", fg="#2c3e50").pack(side="left", padx=10, pady=8)
-        self.theme_btn = tk.Button(top_row, text="🌙 Dark Mode", font=("Arial", 10),
-                                   command=self.toggle_theme, bg="#34495e", fg="white")
+        campus = f", Campus: {_shards.names[0]}" if _shards is not None and len(_shards.campuses) == 1 else ""
+        ttk.Label(top_row, text=f"Welcome, {self.username} 👋 (Role: {self.role}{campus})",
+                  font=("Helvetica", 13, "bold")).pack(side="left", padx=10, pady=8)
+        self.theme_btn = ttk.Button(top_row, text="🌙 Dark Mode",
+                                    command=self.toggle_theme, style="Dark.TButton")
         self.theme_btn.pack(side="right", padx=10)
+        # Every campus in one roster: pick where new students, imports, scans and backups go
+        if _shards is not None and len(_shards.campuses) > 1 and self.role != "student":
+            self.campus_var = tk.StringVar()
+            campus_box = ttk.Combobox(top_row, textvariable=self.campus_var, values=_shards.names,
+                                      state="readonly", width=14)
+            campus_box.pack(side="right", padx=(0, 10))
+            campus_box.bind("<<ComboboxSelected>>",
+                            lambda e: setattr(_shards, "insert_campus", self.campus_var.get()))
+            ttk.Label(top_row, text="Campus:").pack(side="right")
 
         # Left: Table (list)
-        self.table_frame = tk.Frame(self.root, bd=4, relief=tk.RIDGE, bg="white")
-        self.table_frame.place(x=20, y=105, width=550, height=470)
+        self.table_frame = ttk.Frame(self.root, style="Card.TFrame")
+        self.table_frame.place(x=20, y=145, width=550, height=430)
 
         # Right: Manage student data panel
-        self.manage_frame = tk.Frame(self.root, bd=4, relief=tk.RIDGE, bg="white")
+        self.manage_frame = ttk.Frame(self.root, style="Card.TFrame")
         self.manage_frame.place(x=590, y=75, width=670, height=500)
 
         # ---- Manage panel contents ----
-        tk.Label(self.manage_frame, text="Manage Students", bg="white",
-                 fg="black", font=("Arial", 15, "bold")).grid(row=0, column=0, columnspan=2, pady=10)
+        ttk.Label(self.manage_frame, text="Manage Students", font=("Arial", 15, "bold")).grid(row=0, column=0, columnspan=2, pady=10)
 
         # Vars
         self.roll_no_var = tk.StringVar()
@@ -163,33 +263,37 @@ class StudentManagementSystem:
         self.username_var = tk.StringVar()  # <-- used to link a student record to a login
         self.search_by = tk.StringVar(value="roll_no")
         self.search_txt = tk.StringVar()
+        self.born_from_var = tk.StringVar()
+        self.born_to_var = tk.StringVar()
+        self.min_age_var = tk.StringVar()
+        self.max_age_var = tk.StringVar()
 
         # Fields
         row_i = 1
         def add_row(label, widget):
             nonlocal row_i
-            tk.Label(self.manage_frame, text=label, bg="white", font=("Arial", 11)).grid(row=row_i, column=0, padx=8, pady=6, sticky="w")
+            ttk.Label(self.manage_frame, text=label, font=("Arial", 11)).grid(row=row_i, column=0, padx=8, pady=6, sticky="w")
             widget.grid(row=row_i, column=1, padx=8, pady=6, sticky="w")
             row_i += 1
 
-        add_row("Roll No", tk.Entry(self.manage_frame, textvariable=self.roll_no_var, width=34))
-        add_row("Name", tk.Entry(self.manage_frame, textvariable=self.name_var, width=34))
-        add_row("Email", tk.Entry(self.manage_frame, textvariable=self.email_var, width=34))
+        add_row("Roll No", ttk.Entry(self.manage_frame, textvariable=self.roll_no_var, width=34))
+        add_row("Name", ttk.Entry(self.manage_frame, textvariable=self.name_var, width=34))
+        add_row("Email", ttk.Entry(self.manage_frame, textvariable=self.email_var, width=34))
 
         gender_combo = ttk.Combobox(self.manage_frame, textvariable=self.gender_var,
                                     values=("Male", "Female", "Other"), state="readonly", width=31)
         gender_combo.current(0)
         add_row("Gender", gender_combo)
 
-        add_row("Contact", tk.Entry(self.manage_frame, textvariable=self.contact_var, width=34))
-        add_row("D.O.B", tk.Entry(self.manage_frame, textvariable=self.dob_var, width=34))
+        add_row("Contact", ttk.Entry(self.manage_frame, textvariable=self.contact_var, width=34))
+        add_row("D.O.B", ttk.Entry(self.manage_frame, textvariable=self.dob_var, width=34))
 
         # Username link (admin/staff can set; students fixed to their own)
-        uname_entry = tk.Entry(self.manage_frame, textvariable=self.username_var, width=34)
+        uname_entry = ttk.Entry(self.manage_frame, textvariable=self.username_var, width=34)
         add_row("Username (link)", uname_entry)
 
-        tk.Label(self.manage_frame, text="Address", bg="white", font=("Arial", 11)).grid(row=row_i, column=0, padx=8, pady=6, sticky="nw")
-        self.address_txt = tk.Text(self.manage_frame, width=33, height=4)
+        ttk.Label(self.manage_frame, text="Address", font=("Arial", 11)).grid(row=row_i, column=0, padx=8, pady=6, sticky="nw")
+        self.address_txt = self.theme.track(tk.Text(self.manage_frame, width=33, height=4), "text")
         self.address_txt.grid(row=row_i, column=1, padx=8, pady=6, sticky="w")
         row_i += 1
 
@@ -199,61 +303,136 @@ class StudentManagementSystem:
             uname_entry.config(state="disabled")
 
         # Buttons row inside manage panel
-        btn_frame = tk.Frame(self.manage_frame, bg="white")
+        btn_frame = ttk.Frame(self.manage_frame)
         btn_frame.grid(row=row_i, column=0, columnspan=2, pady=10)
         if self.role in ("admin", "staff"):
-            self.btn_add = tk.Button(btn_frame, text="Add", width=10, command=self.add_student,
-                                     bg="#27ae60", fg="white", font=("Arial", 11))
+            self.btn_add = ttk.Button(btn_frame, text="Add", width=10, command=self.add_student,
+                                      style="Success.TButton")
             self.btn_add.grid(row=0, column=0, padx=6)
 
-            self.btn_update = tk.Button(btn_frame, text="Update", width=10, command=self.update_student,
-                                        bg="#2980b9", fg="white", font=("Arial", 11))
+            self.btn_update = ttk.Button(btn_frame, text="Update", width=10, command=self.update_student,
+                                         style="Primary.TButton")
             self.btn_update.grid(row=0, column=1, padx=6)
 
-            self.btn_delete = tk.Button(btn_frame, text="Delete", width=10, command=self.delete_student,
-                                        bg="#c0392b", fg="white", font=("Arial", 11))
+            self.btn_delete = ttk.Button(btn_frame, text="Delete", width=10, command=self.delete_student,
+                                         style="Danger.TButton")
             self.btn_delete.grid(row=0, column=2, padx=6)
 
-        self.btn_csv = tk.Button(btn_frame, text="Export CSV", width=10, command=self.export_csv,
-                                 bg="#f39c12", fg="white", font=("Arial", 11))
+        self.btn_csv = ttk.Button(btn_frame, text="Export CSV", width=10, command=self.export_csv,
+                                  style="Warning.TButton")
         self.btn_csv.grid(row=0, column=3, padx=6)
 
-        self.btn_pdf = tk.Button(btn_frame, text="Export PDF", width=10, command=self.export_pdf,
-                                 bg="#d35400", fg="white", font=("Arial", 11))
+        self.btn_pdf = ttk.Button(btn_frame, text="Export PDF", width=10, command=self.export_pdf,
+                                  style="Warning.TButton")
         self.btn_pdf.grid(row=0, column=4, padx=6)
 
         # Admin-only: Add User (popup)
         if self.role == "admin":
-            self.btn_add_user = tk.Button(btn_frame, text="Add User", width=10,
-                                          command=self.open_add_user_popup, bg="#6c5ce7", fg="white",
-                                          font=("Arial", 11))
+            self.btn_add_user = ttk.Button(btn_frame, text="Add User", width=10,
+                                           command=self.open_add_user_popup, style="Accent.TButton")
             self.btn_add_user.grid(row=0, column=5, padx=6)
 
+        # Bulk import (admin/staff)
+        if self.role in ("admin", "staff"):
+            self.btn_import = ttk.Button(btn_frame, text="Import CSV", width=10,
+                                         command=self.open_import_popup, style="Info.TButton")
+            self.btn_import.grid(row=1, column=0, padx=6, pady=(8, 0))
+
+        # Admin-only: timings of recent operations
+        if self.role == "admin":
+            self.btn_perf = ttk.Button(btn_frame, text="Performance", width=10,
+                                       command=self.open_perf_panel, style="Dark.TButton")
+            self.btn_perf.grid(row=1, column=1, padx=6, pady=(8, 0))
+
+        # Roster statistics (admin/staff)
+        if self.role in ("admin", "staff"):
+            self.btn_stats = ttk.Button(btn_frame, text="Statistics", width=10,
+                                        command=self.open_stats_panel, style="Dark.TButton")
+            self.btn_stats.grid(row=1, column=2, padx=6, pady=(8, 0))
+
+        # Admin-only: duplicate detection (needs the database file, so not in --server mode)
+        if self.role == "admin" and _remote is None:
+            self.btn_dedup = ttk.Button(btn_frame, text="Duplicates", width=10,
+                                        command=self.open_dedup_panel, style="Danger.TButton")
+            self.btn_dedup.grid(row=1, column=3, padx=6, pady=(8, 0))
+
+        # Admin-only: online snapshots of the database
+        if self.role == "admin":
+            self.btn_backup = ttk.Button(btn_frame, text="Backups", width=10,
+                                         command=self.open_backup_panel, style="Success.TButton")
+            self.btn_backup.grid(row=1, column=4, padx=6, pady=(8, 0))
+
         # Search area above table (left side)
-        search_frame = tk.Frame(self.root, bd=4, relief=tk.RIDGE, bg="white")
-        search_frame.place(x=20, y=75, width=550, height=36)
+        search_frame = ttk.Frame(self.root, style="Card.TFrame")
+        search_frame.place(x=20, y=75, width=550, height=66)
 
         ttk.Combobox(search_frame, textvariable=self.search_by,
-                     values=("roll_no", "name", "contact", "username"),
+                     values=("roll_no", "name", "contact", "username", "email"),
                      state="readonly", width=14).grid(row=0, column=0, padx=6, pady=3)
 
-        tk.Entry(search_frame, textvariable=self.search_txt, width=30).grid(row=0, column=1, padx=6)
-        tk.Button(search_frame, text="Search", command=self.search_student, width=10,
-                  bg="#8e44ad", fg="white").grid(row=0, column=2, padx=4)
-        tk.Button(search_frame, text="Reset", command=self.fetch_data, width=10,
-                  bg="#95a5a6", fg="black").grid(row=0, column=3, padx=4)
-
-        # Table
-        self.student_table = ttk.Treeview(self.table_frame,
-                                          columns=("roll", "name", "email", "gender", "contact", "dob", "address", "username"),
-                                          show="headings")
-        for col, w in zip(("roll", "name", "email", "gender", "contact", "dob", "address", "username"),
-                          (80, 140, 180, 100, 120, 110, 220, 130)):
-            self.student_table.heading(col, text=col.title())
+        ttk.Entry(search_frame, textvariable=self.search_txt, width=30).grid(row=0, column=1, padx=6)
+        ttk.Button(search_frame, text="Search", command=self.search_student, width=10,
+                   style="Accent.TButton").grid(row=0, column=2, padx=4)
+        ttk.Button(search_frame, text="Reset", command=self.reset_filters, width=10).grid(row=0, column=3, padx=4)
+
+        # Birth-date / age filter, applied together with the search
+        birth_row = ttk.Frame(search_frame)
+        birth_row.grid(row=1, column=0, columnspan=4, sticky="w", padx=6, pady=(0, 3))
+        for text, var, width in (("Born", self.born_from_var, 11), ("to", self.born_to_var, 11),
+                                 ("Age", self.min_age_var, 4), ("to", self.max_age_var, 4)):
+            ttk.Label(birth_row, text=text).pack(side=tk.LEFT, padx=(6, 2))
+            ttk.Entry(birth_row, textvariable=var, width=width).pack(side=tk.LEFT)
+        ttk.Button(birth_row, text="Filter", command=self.apply_filters, width=8,
+                   style="Accent.TButton").pack(side=tk.LEFT, padx=(12, 0))
+        self.filter_btn = ttk.Button(birth_row, text="More filters…", command=self.open_filter_builder)
+        self.filter_btn.pack(side=tk.LEFT, padx=(6, 0))
+
+        # Table (click a heading to sort by that column, again to reverse)
+        self._table_cols = ("roll", "name", "email", "gender", "contact", "dob", "address", "username")
+        self.student_table = ttk.Treeview(self.table_frame, columns=self._table_cols, show="headings")
+        for col, field, w in zip(self._table_cols, STUDENT_COLUMNS, (80, 140, 180, 100, 120, 110, 220, 130)):
+            self.student_table.heading(col, text=col.title(), command=lambda f=field: self.sort_by(f))
             self.student_table.column(col, width=w, anchor="w")
+        status_row = ttk.Frame(self.table_frame)
+        status_row.pack(side=tk.BOTTOM, fill=tk.X)
+        self.count_lbl = ttk.Label(status_row, text="", anchor="w", font=("Arial", 9))
+        self.count_lbl.pack(side=tk.LEFT, fill=tk.X, expand=1)
+        self.save_lbl = ttk.Label(status_row, text="", anchor="e", style="Muted.TLabel", font=("Arial", 9))
+        self.save_lbl.pack(side=tk.RIGHT, padx=4)
+        self.busy_bar = ttk.Progressbar(status_row, mode="indeterminate", length=100)
+        self.busy_bar.pack(side=tk.RIGHT, padx=4)
+        self.table_scroll = ttk.Scrollbar(self.table_frame, orient=tk.VERTICAL,
+                                          command=self.student_table.yview)
+        self.table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.student_table.config(yscrollcommand=self._on_table_scroll)
         self.student_table.pack(fill=tk.BOTH, expand=1)
         self.student_table.bind("<ButtonRelease-1>", self.get_cursor)
 
+        # Virtualized view state: current filter + the window of rows held in the Treeview
+        self._view_where = ""
+        self._view_params = ()
+        self._view_mode = "page"   # "page" = keyset-paged roster, "search" = ranked hits
+        self._view_search = None   # (text, field) of the ranked search being shown
+        self._view_sort = None     # (column, descending) the loaded rows are in; None = default
+        self._sort = None          # the order picked by a heading click
+        self._filters = []         # [(column, op, value)] from the filter builder
+        self._view_total = 0
+        self._rows = []
+        self._has_before = False
+        self._has_after = False
+        self._page_pending = False
+
+        # Search-as-you-type: pending debounce timer
+        self._search_after = None
+        self.search_txt.trace_add("write", self._on_search_typed)
+
+        # All database work runs on worker threads; results come back through root.after
+        self.tasks = TaskRunner(self.root, on_busy=self._set_busy)
+        # Student edits are write-behind: shown at once, committed in groups
+        self.writes = WriteQueue(self.root, lambda ops: db_apply_writes(ops),
+                                 on_change=self._show_unsaved)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
         # Role restrictions (student = read-only + own records only)
         if self.role == "student":
             # Only disable if buttons exist (they don't for student)
@@ -264,44 +443,82 @@ class StudentManagementSystem:
         # Staff can manage students but not add users
         if self.role == "staff" and hasattr(self, "btn_add_user"):
             self.btn_add_user.config(state="disabled")
+        # A shared server renders PDFs in its own processes, for roles allowed reports only
+        if _remote is not None and not role_allows(self.role, "report"):
+            self.btn_pdf.config(state="disabled")
 
+        # Show the empty shell first; the roster is loaded once the window has painted
+        self.root.after_idle(self._after_first_paint)
+        self.root.after(RECONCILE_MS, self._reconcile)
+
+    def _after_first_paint(self):
+        startup.mark("dashboard paint")
         self.fetch_data()
 
+    # ------------------------ Background Work ------------------------
+    def _set_busy(self, busy):
+        if busy:
+            self.busy_bar.start(12)
+            self.root.config(cursor="watch")
+        else:
+            self.busy_bar.stop()
+            self.root.config(cursor="")
+
+    def _show_db_error(self, exc):
+        messagebox.showerror("Database Error", str(exc))
+
+    def _show_unsaved(self, pending):
+        self.save_lbl.config(text=f"Saving {pending} edit{'s' if pending != 1 else ''}…" if pending
+                             else "All changes saved")
+
+    def _on_close(self):
+        # Write everything accepted so far; failures are reported while the window still exists
+        self.writes.close()
+        self.tasks.shutdown()
+        self.root.destroy()
+
     # ------------------------ CRUD ------------------------
+    def _form_row(self):
+        address = self.address_txt.get("1.0", tk.END).strip()
+        row = (self.roll_no_var.get().strip(),
+               self.name_var.get().strip(),
+               self.email_var.get().strip(),
+               self.gender_var.get().strip(),
+               self.contact_var.get().strip(),
+               self.dob_var.get().strip(),
+               address,
+               link_username(self.username_var.get()))
+        # D.O.B is checked here and stored as YYYY-MM-DD; None = the form has an error
+        try:
+            return normalize_row(row)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+
     def add_student(self):
         if not self.roll_no_var.get() or not self.name_var.get():
             messagebox.showerror("Error", "Roll No and Name are required.")
             return
 
-        # Map empty username to None so SQLite stores NULL (UNIQUE allows multiple NULLs)
-        link_username = self.username_var.get().strip()
-        link_username = link_username if link_username else None
+        row = self._form_row()
+        if row is None:
+            return
+        if _shards is not None and _shards.insert_campus is None:
+            messagebox.showerror("Error", "Choose the campus for new students first.")
+            return
 
-        address = self.address_txt.get("1.0", tk.END).strip()
-        conn = db_connect()
-        c = conn.cursor()
-        try:
-            c.execute("""
-                INSERT INTO students (roll_no, name, email, gender, contact, dob, address, username)
-                VALUES (?,?,?,?,?,?,?,?)
-            """, (
-                self.roll_no_var.get().strip(),
-                self.name_var.get().strip(),
-                self.email_var.get().strip(),
-                self.gender_var.get().strip(),
-                self.contact_var.get().strip(),
-                self.dob_var.get().strip(),
-                address,
-                link_username
-            ))
-            conn.commit()
-            messagebox.showinfo("Success", "Student added successfully.")
-            self.clear_fields()
-            self.fetch_data()
-        except sqlite3.IntegrityError as e:
-            messagebox.showerror("Error", f"Duplicate Roll No / Username conflict.\n{e}")
-        finally:
-            conn.close()
+        def done():
+            self._refresh_row(row[0], added=True)
+
+        def failed(e):
+            # Take the optimistic row back out; the refresh restores any real one
+            self._apply_row(row[0], None)
+            self._refresh_row(row[0])
+            self._write_failed(row, e, "Duplicate Roll No / Username conflict.")
+
+        self.writes.submit("insert", row, on_done=done, on_error=failed)
+        self._apply_row(row[0], row)
+        self.clear_fields()
 
     def update_student(self):
         if not self.roll_no_var.get():
@@ -309,28 +526,21 @@ class StudentManagementSystem:
             return
 
         # Allow updating the link (admin/staff); students can't edit (field is disabled)
-        link_username = self.username_var.get().strip()
-        link_username = link_username if link_username else None
+        row = self._form_row()
+        if row is None:
+            return
 
-        address = self.address_txt.get("1.0", tk.END).strip()
-        conn = db_connect()
-        c = conn.cursor()
-        try:
-            c.execute("""
-                UPDATE students SET
-                    name=?, email=?, gender=?, contact=?, dob=?, address=?, username=?
-                WHERE roll_no=?
-            """, (self.name_var.get().strip(), self.email_var.get().strip(), self.gender_var.get().strip(),
-                  self.contact_var.get().strip(), self.dob_var.get().strip(), address, link_username,
-                  self.roll_no_var.get().strip()))
-            conn.commit()
-            messagebox.showinfo("Updated", "Student record updated.")
-            self.fetch_data()
-            self.clear_fields()
-        except sqlite3.IntegrityError as e:
-            messagebox.showerror("Error", f"Username is already linked to another student.\n{e}")
-        finally:
-            conn.close()
+        def done():
+            self._refresh_row(row[0])
+
+        def failed(e):
+            self._refresh_row(row[0])
+            self._write_failed(row, e, "Username is already linked to another student.")
+
+        self.writes.submit("update", row, on_done=done, on_error=failed)
+        if self.student_table.exists(row[0]):
+            self._apply_row(row[0], row)
+        self.clear_fields()
 
     def delete_student(self):
         if not self.roll_no_var.get():
@@ -339,20 +549,35 @@ class StudentManagementSystem:
         if not messagebox.askyesno("Confirm", "Delete this student?"):
             return
 
-        conn = db_connect()
-        c = conn.cursor()
-        c.execute("DELETE FROM students WHERE roll_no=?", (self.roll_no_var.get().strip(),))
-        conn.commit()
-        conn.close()
-        messagebox.showinfo("Deleted", "Student record deleted.")
-        self.fetch_data()
+        roll_no = self.roll_no_var.get().strip()
+
+        def failed(e):
+            self._refresh_row(roll_no)
+            self._show_db_error(e)
+
+        # The roll number may be gone already or outside the view: count what is left
+        self.writes.submit("delete", roll_no, on_done=self._recount, on_error=failed)
+        self._apply_row(roll_no, None)
         self.clear_fields()
 
+    def _write_failed(self, row, exc, conflict_text):
+        # A queued edit was rejected: name the row, and put its values back in the form
+        # (unless the user is already editing something else) so it can be fixed
+        if not self.roll_no_var.get() and not self.name_var.get():
+            self._fill_form(row)
+        if isinstance(exc, sqlite3.IntegrityError):
+            messagebox.showerror("Not saved", f"Roll No {row[0]} ({row[1]}): {conflict_text}\n{exc}")
+        else:
+            messagebox.showerror("Not saved", f"Roll No {row[0]} ({row[1]}):\n{exc}")
+
     def get_cursor(self, _event):
         sel = self.student_table.focus()
         vals = self.student_table.item(sel, "values")
         if not vals:
             return
+        self._fill_form(vals)
+
+    def _fill_form(self, vals):
         self.roll_no_var.set(vals[0])
         self.name_var.set(vals[1])
         self.email_var.set(vals[2])
@@ -360,8 +585,8 @@ class StudentManagementSystem:
         self.contact_var.set(vals[4])
         self.dob_var.set(vals[5])
         self.address_txt.delete("1.0", tk.END)
-        self.address_txt.insert(tk.END, vals[6])
-        self.username_var.set(vals[7] if len(vals) > 7 else "")
+        self.address_txt.insert(tk.END, vals[6] or "")
+        self.username_var.set((vals[7] or "") if len(vals) > 7 else "")
 
     def clear_fields(self):
         self.roll_no_var.set("")
@@ -374,73 +599,540 @@ class StudentManagementSystem:
         self.address_txt.delete("1.0", tk.END)
 
     # ------------------------ Search & Load ------------------------
+    def _role_filter(self):
+        # Students only ever see their own record
+        return role_filter(self.role, self.username)
+
+    def _view_filter(self):
+        # Role filter plus the birth/age bounds; None if a bound can't be read
+        where, params = self._role_filter()
+        try:
+            born, born_params = birth_filter(self.born_from_var.get().strip(), self.born_to_var.get().strip(),
+                                             self.min_age_var.get().strip(), self.max_age_var.get().strip())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+        if born:
+            where = f"{where} AND {born}" if where else born
+            params += born_params
+        if self._filters:
+            extra, extra_params = build_filter(self._filters)
+            where = f"{where} AND {extra}" if where else extra
+            params += extra_params
+        return where, params
+
     def fetch_data(self):
-        conn = db_connect()
-        c = conn.cursor()
-        if self.role == "student":
-            # Only show the logged-in student's record
-            c.execute("SELECT roll_no, name, email, gender, contact, dob, address, username "
-                      "FROM students WHERE username=? ORDER BY name", (self.username,))
+        view = self._view_filter()
+        if view is None:
+            return
+        self._load_view(*view, op="fetch_data")
+
+    def apply_filters(self):
+        if self.search_txt.get().strip():
+            self.search_student()
         else:
-            c.execute("SELECT roll_no, name, email, gender, contact, dob, address, username "
-                      "FROM students ORDER BY name")
-        rows = c.fetchall()
-        conn.close()
+            self.fetch_data()
 
-        self.student_table.delete(*self.student_table.get_children())
-        for r in rows:
-            self.student_table.insert("", tk.END, values=r)
+    def reset_filters(self):
+        for var in (self.born_from_var, self.born_to_var, self.min_age_var, self.max_age_var):
+            var.set("")
+        self._set_filters([])
+        self.fetch_data()
+
+    def _set_filters(self, filters):
+        self._filters = filters
+        self.filter_btn.config(text=f"More filters ({len(filters)})…" if filters else "More filters…")
+
+    def sort_by(self, column):
+        # The database sorts and pages the roster and, once a heading is clicked, search
+        # hits too (the whole match set in that order, not just the best-ranked batch)
+        descending = self._sort is not None and self._sort[0] == column and not self._sort[1]
+        self._sort = (column, descending)
+        for col, field in zip(self._table_cols, STUDENT_COLUMNS):
+            mark = (" ▼" if descending else " ▲") if field == column else ""
+            self.student_table.heading(col, text=col.title() + mark)
+        if self._view_mode == "search":
+            self._load_search(*self._view_search, self._view_where, self._view_params)
+        else:
+            self._load_view(self._view_where, self._view_params, op="sort")
 
-    def search_student(self):
+    def search_student(self, live=False):
         field = self.search_by.get()
         val = self.search_txt.get().strip()
         if not val:
-            messagebox.showerror("Error", "Enter a value to search.")
+            if live:
+                self.fetch_data()
+            else:
+                messagebox.showerror("Error", "Enter a value to search.")
+            return
+        if live and len(val) < LIVE_SEARCH_MIN_CHARS:
             return
 
-        valid = {"roll_no","name","contact","username"}
+        valid = {"roll_no","name","contact","username","email"}
         if field not in valid:
             field = "name"
 
-        conn = db_connect()
-        c = conn.cursor()
-        if self.role == "student":
-            c.execute(f"SELECT roll_no, name, email, gender, contact, dob, address, username "
-                      f"FROM students WHERE username=? AND {field} LIKE ?",
-                      (self.username, f"%{val}%"))
-        else:
-            c.execute(f"SELECT roll_no, name, email, gender, contact, dob, address, username "
-                      f"FROM students WHERE {field} LIKE ?", (f"%{val}%",))
-        rows = c.fetchall()
-        conn.close()
+        view = self._view_filter()
+        if view is None:
+            return
+        where, params = view
+        if search_available():
+            self._load_search(val, field, where, params)
+            return
+
+        clause = f"{field} LIKE ?"
+        where = f"{where} AND {clause}" if where else clause
+        self._load_view(where, params + (f"%{val}%",), op="search_student")
+
+    def _on_search_typed(self, *_args):
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+        self._search_after = self.root.after(SEARCH_DEBOUNCE_MS, self._run_live_search)
+
+    def _run_live_search(self):
+        self._search_after = None
+        self.search_student(live=True)
+
+    def open_filter_builder(self):
+        # Conditions on any column, all of which must hold; they run as one query on the
+        # columns' indexes together with the search and birth-date filters
+        win = tk.Toplevel(self.root)
+        win.title("Filters")
+        win.geometry("620x360")
+        self.theme.track(win)
+        win.transient(self.root)
 
-        self.student_table.delete(*self.student_table.get_children())
+        ttk.Label(win, text="Show students where all of these hold:",
+                  font=("Arial", 12, "bold")).pack(pady=(10, 6))
+        body = ttk.Frame(win)
+        body.pack(fill=tk.BOTH, expand=1, padx=10)
+        col_by_label = {STUDENT_LABELS[c]: c for c in STUDENT_COLUMNS}
+        op_by_label = {label: op for op, label in FILTER_OPS.items()}
+        lines = []
+
+        def add_line(column="name", op="equals", value=""):
+            frame = ttk.Frame(body)
+            frame.pack(fill=tk.X, pady=2)
+            col_var = tk.StringVar(value=STUDENT_LABELS[column])
+            op_var = tk.StringVar(value=FILTER_OPS[op])
+            low_var = tk.StringVar(value=value[0] if op == "range" else (value or ""))
+            high_var = tk.StringVar(value=value[1] if op == "range" else "")
+            ttk.Combobox(frame, textvariable=col_var, values=list(col_by_label), state="readonly",
+                         width=10).pack(side=tk.LEFT, padx=2)
+            ttk.Combobox(frame, textvariable=op_var, values=list(op_by_label), state="readonly",
+                         width=11).pack(side=tk.LEFT, padx=2)
+            low = ttk.Entry(frame, textvariable=low_var, width=18)
+            low.pack(side=tk.LEFT, padx=2)
+            and_lbl = ttk.Label(frame, text="and")
+            high = ttk.Entry(frame, textvariable=high_var, width=18)
+            line = (frame, col_var, op_var, low_var, high_var)
+
+            def shape(*_args):
+                # a range takes two values, "is empty" none
+                op_now = op_by_label[op_var.get()]
+                low.config(state="disabled" if op_now in ("empty", "not_empty") else "normal")
+                if op_now == "range":
+                    and_lbl.pack(side=tk.LEFT, before=remove)
+                    high.pack(side=tk.LEFT, padx=2, before=remove)
+                else:
+                    and_lbl.pack_forget()
+                    high.pack_forget()
+
+            def drop():
+                frame.destroy()
+                lines.remove(line)
+
+            remove = ttk.Button(frame, text="✕", command=drop, width=2)
+            remove.pack(side=tk.RIGHT, padx=2)
+            op_var.trace_add("write", shape)
+            shape()
+            lines.append(line)
+
+        for column, op, value in self._filters:
+            add_line(column, op, value)
+        if not lines:
+            add_line()
+
+        def collect():
+            filters = []
+            for _, col_var, op_var, low_var, high_var in lines:
+                op = op_by_label[op_var.get()]
+                value = ((low_var.get(), high_var.get()) if op == "range"
+                         else None if op in ("empty", "not_empty") else low_var.get())
+                filters.append((col_by_label[col_var.get()], op, value))
+            return filters
+
+        def apply():
+            filters = collect()
+            try:
+                build_filter(filters)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=win)
+                return
+            self._set_filters(filters)
+            win.destroy()
+            self.apply_filters()
+
+        def clear():
+            self._set_filters([])
+            win.destroy()
+            self.apply_filters()
+
+        bar = ttk.Frame(win)
+        bar.pack(pady=10)
+        ttk.Button(bar, text="+ Condition", width=12, command=add_line).pack(side="left", padx=6)
+        ttk.Button(bar, text="Apply", width=10, style="Accent.TButton", command=apply).pack(side="left", padx=6)
+        ttk.Button(bar, text="Clear all", width=10, command=clear).pack(side="left", padx=6)
+
+    # ------------------------ Virtualized Table ------------------------
+    def _load_view(self, where, params, op="load_view"):
+        sort = self._sort
+
+        def load(task):
+            with metrics.timed("task", op):
+                total = count_students(where, params)
+                return total, fetch_student_page(where, params, limit=PAGE_SIZE + 1, sort=sort)
+
+        def done(result):
+            total, rows = result
+            self._view_where = where
+            self._view_params = params
+            self._view_mode = "page"
+            self._view_search = None
+            self._view_sort = sort
+            self._view_total = total
+            self._update_count_label()
+            self._has_after = len(rows) > PAGE_SIZE
+            self._has_before = False
+            self._fill_table(rows[:PAGE_SIZE])
+            startup.finish("first rows")
+
+        self._page_pending = False
+        self.tasks.submit(load, on_done=done, on_error=self._show_db_error, key="view")
+
+    def _load_search(self, val, field, where, params):
+        # Ranked hits are one bounded batch; sorted ones page by keyset like the roster
+        sort = self._sort
+
+        def search(task):
+            with metrics.timed("task", "search_student", field=field):
+                return search_students(val, field, where, params, PAGE_SIZE + 1 if sort else SEARCH_LIMIT,
+                                       cancelled=task.cancelled, sort=sort)
+
+        # Submitting under the "view" key cancels whatever search/load is still running
+        self._page_pending = False
+        self.tasks.submit(search,
+                          on_done=lambda result: self._show_results(result, (val, field, where, params, sort)),
+                          on_error=self._show_db_error, key="view")
+
+    def _show_results(self, result, spec):
+        # None = superseded
+        if result is None:
+            return
+        rows, total = result
+        val, field, self._view_where, self._view_params, self._view_sort = spec
+        self._view_search = (val, field)
+        self._has_after = self._view_sort is not None and len(rows) > PAGE_SIZE
+        self._has_before = False
+        self._view_mode = "search"
+        self._view_total = total
+        self._fill_table(rows[:PAGE_SIZE] if self._view_sort else rows)
+        self._update_count_label()
+
+    def _fetch_page(self, where, params, sort, after=None, before=None):
+        # The next page of the view on either side of a key, searched or not
+        if self._view_search is None:
+            return lambda task: fetch_student_page(where, params, after, before, PAGE_SIZE + 1, sort)
+        val, field = self._view_search
+        return lambda task: search_students(val, field, where, params, PAGE_SIZE + 1,
+                                            sort=sort, after=after, before=before)[0]
+
+    def _update_count_label(self):
+        total = self._view_total
+        if self._view_mode == "search":
+            ranked = self._view_sort is None
+            shown = f" (top {len(self._rows)} shown)" if ranked and total > len(self._rows) else ""
+            text = f"{total} match{'es' if total != 1 else ''}{shown}"
+        else:
+            text = f"{total} student{'s' if total != 1 else ''}"
+        if self._filters:
+            text += f" · {len(self._filters)} filter{'s' if len(self._filters) != 1 else ''}"
+        self.count_lbl.config(text=text)
+
+    def _fill_table(self, rows):
+        with metrics.timed("ui", "fill_table", rows=len(rows)):
+            self._rows = list(rows)
+            self.student_table.delete(*self.student_table.get_children())
+            for r in self._rows:
+                self.student_table.insert("", tk.END, iid=r[0], values=r)
+            self.student_table.yview_moveto(0)
+
+    def _on_table_scroll(self, first, last):
+        self.table_scroll.set(first, last)
+        if self._page_pending or not self._rows:
+            return
+        first, last = float(first), float(last)
+        where, params, sort = self._view_where, self._view_params, self._view_sort
+        if last >= 0.95 and self._has_after:
+            self._page_pending = True
+            key = sort_key(sort)(self._rows[-1])
+            self.tasks.submit(self._fetch_page(where, params, sort, after=key),
+                              on_done=self._append_page, on_error=self._page_failed, key="view")
+        elif first <= 0.05 and self._has_before:
+            self._page_pending = True
+            key = sort_key(sort)(self._rows[0])
+            self.tasks.submit(self._fetch_page(where, params, sort, before=key),
+                              on_done=self._prepend_page, on_error=self._page_failed, key="view")
+
+    def _page_failed(self, exc):
+        self._page_pending = False
+        self._show_db_error(exc)
+
+    def _top_index(self):
+        return round(self.student_table.yview()[0] * len(self._rows))
+
+    def _append_page(self, rows):
+        self._page_pending = False
+        self._has_after = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
+        top = self._top_index()
         for r in rows:
-            self.student_table.insert("", tk.END, values=r)
+            self.student_table.insert("", tk.END, iid=r[0], values=r)
+        self._rows.extend(rows)
+
+        # Drop rows that scrolled far out of view at the top
+        excess = len(self._rows) - PAGE_SIZE * MAX_LOADED_PAGES
+        if excess > 0:
+            self.student_table.delete(*(r[0] for r in self._rows[:excess]))
+            del self._rows[:excess]
+            self._has_before = True
+            self.student_table.yview_moveto(max(top - excess, 0) / len(self._rows))
+
+    def _prepend_page(self, rows):
+        self._page_pending = False
+        self._has_before = len(rows) > PAGE_SIZE
+        rows = rows[-PAGE_SIZE:]
+        top = self._top_index()
+        for i, r in enumerate(rows):
+            self.student_table.insert("", i, iid=r[0], values=r)
+        self._rows[:0] = rows
+
+        # Drop rows that scrolled far out of view at the bottom
+        excess = len(self._rows) - PAGE_SIZE * MAX_LOADED_PAGES
+        if excess > 0:
+            self.student_table.delete(*(r[0] for r in self._rows[-excess:]))
+            del self._rows[-excess:]
+            self._has_after = True
+        self.student_table.yview_moveto((top + len(rows)) / len(self._rows))
+
+    # ------------------------ Incremental Updates ------------------------
+    def _refresh_row(self, roll_no, added=False):
+        # Re-read one row after a write and patch it into the table in place
+        # (in search mode the view's filter holds everything but the search text)
+        where, params = self._view_where, self._view_params
+        was_listed = self.student_table.exists(roll_no)
+
+        def done(row):
+            if added and row is not None:
+                self._view_total += 1
+            elif not added and was_listed and row is None:
+                self._view_total -= 1
+            self._apply_row(roll_no, row)
+            self._update_count_label()
+
+        self.tasks.submit(lambda task: fetch_student(roll_no, where, params),
+                          on_done=done, on_error=self._show_db_error)
+
+    def _recount(self):
+        # Re-count the view after a write whose effect on it isn't known here
+        view = (self._view_where, self._view_params, self._view_search)
+        where, params, search = view
+
+        def count(task):
+            if search is None:
+                return count_students(where, params)
+            return search_students(*search, where, params, 1)[1]
+
+        def done(total):
+            if view == (self._view_where, self._view_params, self._view_search):
+                self._view_total = total
+                self._update_count_label()
+
+        self.tasks.submit(count, on_done=done, on_error=self._show_db_error)
+
+    def _apply_row(self, roll_no, row):
+        # row is the current record, or None if it was deleted / no longer matches the view.
+        # Only the loaded window (a few pages) is touched, whatever the roster size.
+        listed = self.student_table.exists(roll_no)
+        if self._view_mode == "search":
+            # Whether a row matches the search text isn't known here, so only listed rows
+            # are patched or dropped; ranked hits have no sort key to move them by
+            if not listed:
+                return
+            if row is None or self._view_sort is None:
+                i = self.student_table.index(roll_no)
+                if row is None:
+                    self.student_table.delete(roll_no)
+                    del self._rows[i]
+                else:
+                    self.student_table.item(roll_no, values=row)
+                    self._rows[i] = row
+                return
+
+        if listed:
+            i = self.student_table.index(roll_no)
+            self.student_table.delete(roll_no)
+            del self._rows[i]
+        if row is None:
+            return
+        i = self._position(row)
+        if (i == 0 and self._has_before) or (i == len(self._rows) and self._has_after):
+            return  # sorts outside the loaded window; it shows up when that page is scrolled in
+        self._rows.insert(i, row)
+        self.student_table.insert("", i, iid=roll_no, values=row)
+
+    def _position(self, row):
+        # Where row belongs among the loaded rows in the view's order (binary search)
+        key = sort_key(self._view_sort)
+        descending = bool(self._view_sort and self._view_sort[1])
+        k = key(row)
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = key(self._rows[mid])
+            if (other > k) if descending else (other < k):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _reconcile(self):
+        # Diff the loaded window against the database (other users, other instances)
+        self.root.after(RECONCILE_MS, self._reconcile)
+        if self._view_mode != "page" or self._page_pending or self.tasks.pending or self.writes.pending:
+            return
+        where, params, sort = self._view_where, self._view_params, self._view_sort
+        key = sort_key(sort)
+        first, last = (self._rows[0], self._rows[-1]) if self._rows else (None, None)
+        low = key(first) if first and self._has_before else None
+        high = key(last) if last and self._has_after else None
+
+        def load(task):
+            return count_students(where, params), fetch_student_range(where, params, low, high, sort=sort)
+
+        self.tasks.submit(load, on_done=self._apply_reconcile, key="view")
+
+    def _apply_reconcile(self, result):
+        total, rows = result
+        old = {r[0]: r for r in self._rows}
+        fresh = {r[0] for r in rows}
+        for r in self._rows:
+            if r[0] not in fresh:
+                self.student_table.delete(r[0])
+        for i, r in enumerate(rows):
+            prev = old.get(r[0])
+            if prev is None:
+                self.student_table.insert("", i, iid=r[0], values=r)
+                continue
+            if self.student_table.index(r[0]) != i:
+                self.student_table.move(r[0], "", i)
+            if tuple(prev) != tuple(r):
+                self.student_table.item(r[0], values=r)
+        self._rows = list(rows)
+        self._view_total = total
+        self._update_count_label()
 
     # ------------------------ Export ------------------------
     def export_csv(self):
-        rows = self.student_table.get_children()
-        if not rows:
+        if not self._rows:
             messagebox.showwarning("No Data", "No data to export.")
             return
 
-        path = filedialog.asksaveasfilename(defaultextension=".csv",
-                                            filetypes=[("CSV files", "*.csv")],
-                                            title="Save CSV")
-        if not path:
-            return
+        # Exports the whole current view (filter / search, in its order) straight from the database
+        where, params, search, sort = self._view_where, self._view_params, self._view_search, self._view_sort
 
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            wr = csv.writer(f)
-            wr.writerow(["Roll No", "Name", "Email", "Gender", "Contact", "D.O.B", "Address", "Username"])
-            for r in rows:
-                wr.writerow(self.student_table.item(r)["values"])
-        messagebox.showinfo("Exported", f"CSV saved to:\n{path}")
+        win = tk.Toplevel(self.root)
+        win.title("Export CSV")
+        win.geometry("420x330")
+        win.resizable(False, False)
+        self.theme.track(win)
+        win.transient(self.root)
+
+        ttk.Label(win, text="Export CSV", font=("Arial", 14, "bold")).pack(pady=10)
+        ttk.Label(win, text=f"{self._view_total} rows in the current view", style="Muted.TLabel").pack()
+
+        frm = ttk.Frame(win)
+        frm.pack(pady=6)
+        col_vars = {}
+        for i, col in enumerate(STUDENT_COLUMNS):
+            col_vars[col] = tk.BooleanVar(value=True)
+            ttk.Checkbutton(frm, text=STUDENT_LABELS[col],
+                            variable=col_vars[col]).grid(row=i // 4, column=i % 4, sticky="w", padx=4)
+        gz_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(win, text="Compress (gzip)", variable=gz_var).pack()
+
+        bar = ttk.Progressbar(win, mode="determinate", maximum=1.0, length=360)
+        bar.pack(pady=8)
+        status = ttk.Label(win, text="", font=("Arial", 10))
+        status.pack()
+
+        row = ttk.Frame(win)
+        row.pack(pady=8)
+        start_btn = ttk.Button(row, text="Export", width=12, style="Warning.TButton")
+        start_btn.grid(row=0, column=0, padx=6)
+        cancel_btn = ttk.Button(row, text="Cancel", width=12, style="Danger.TButton",
+                                state="disabled")
+        cancel_btn.grid(row=0, column=1, padx=6)
+
+        def progress(done_rows, fraction):
+            bar["value"] = fraction
+            status.config(text=f"{done_rows:,} rows written")
+
+        def done(count):
+            cancel_btn.config(state="disabled")
+            if count is None:
+                status.config(text="Cancelled")
+                return
+            messagebox.showinfo("Exported", f"CSV saved to:\n{path}", parent=win)
+            win.destroy()
+
+        def failed(e):
+            cancel_btn.config(state="disabled")
+            start_btn.config(state="normal")
+            messagebox.showerror("Export Failed", str(e), parent=win)
+
+        def start():
+            nonlocal path
+            columns = tuple(c for c in STUDENT_COLUMNS if col_vars[c].get())
+            if not columns:
+                messagebox.showerror("Error", "Select at least one column.", parent=win)
+                return
+            compress = gz_var.get()
+            ext = ".csv.gz" if compress else ".csv"
+            path = filedialog.asksaveasfilename(defaultextension=ext, parent=win,
+                                                filetypes=[("CSV files", "*" + ext)],
+                                                title="Save CSV")
+            if not path:
+                return
+            start_btn.config(state="disabled")
+            cancel_btn.config(state="normal")
+            self.tasks.submit(lambda task: _export_csv(path, where, params, search, columns,
+                                                       compress, progress=task.report,
+                                                       cancelled=task.cancelled, sort=sort),
+                              on_done=done, on_error=failed, on_progress=progress, key="export_csv")
+
+        def cancel():
+            self.tasks.cancel("export_csv")
+            cancel_btn.config(state="disabled")
+            start_btn.config(state="normal")
+            status.config(text="Cancelled")
+
+        path = None
+        start_btn.config(command=start)
+        cancel_btn.config(command=cancel)
 
     def export_pdf(self):
-        rows = self.student_table.get_children()
-        if not rows:
+        if not self._rows:
             messagebox.showwarning("No Data", "No data to export.")
             return
 
@@ -450,41 +1142,126 @@ class StudentManagementSystem:
         if not path:
             return
 
-        pdf = canvas.Canvas(path, pagesize=A4)
-        w, h = A4
-        y = h - 50
+        where, params, search, sort = self._view_where, self._view_params, self._view_search, self._view_sort
 
-        pdf.setTitle("Student Records")
-        pdf.setFont("Helvetica-Bold", 14)
-        pdf.drawCentredString(w / 2, y, "Student Records")
-        y -= 24
-        pdf.setFont("Helvetica", 9)
+        win = tk.Toplevel(self.root)
+        win.title("Export PDF")
+        win.geometry("400x170")
+        win.resizable(False, False)
+        self.theme.track(win)
+        win.transient(self.root)
 
-        headers = ["Roll No", "Name", "Email", "Gender", "Contact", "D.O.B", "Address", "Username"]
-        x = [20, 80, 150, 270, 320, 380, 440, 515]
+        ttk.Label(win, text="Rendering PDF report...", font=("Arial", 12, "bold")).pack(pady=10)
+        bar = ttk.Progressbar(win, mode="determinate", maximum=1.0, length=340)
+        bar.pack(pady=6)
+        status = ttk.Label(win, text="", font=("Arial", 10))
+        status.pack()
 
-        for i, hdr in enumerate(headers):
-            pdf.drawString(x[i], y, hdr)
-        y -= 16
+        def progress(pages, fraction):
+            bar["value"] = fraction
+            status.config(text=f"{pages:,} pages rendered")
 
-        for r in rows:
-            data = list(map(str, self.student_table.item(r)["values"]))
-            for i, val in enumerate(data):
-                pdf.drawString(x[i], y, val[:35])
-            y -= 14
-            if y < 40:
-                pdf.showPage()
-                y = h - 50
-                pdf.setFont("Helvetica-Bold", 14)
-                pdf.drawCentredString(w / 2, y, "Student Records (cont.)")
-                y -= 24
-                pdf.setFont("Helvetica", 9)
-                for i, hdr in enumerate(headers):
-                    pdf.drawString(x[i], y, hdr)
-                y -= 16
-
-        pdf.save()
-        messagebox.showinfo("Exported", f"PDF saved to:\n{path}")
+        def done(pages):
+            win.destroy()
+            if pages is not None:
+                messagebox.showinfo("Exported", f"PDF saved to:\n{path}")
+
+        def failed(e):
+            win.destroy()
+            messagebox.showerror("Export Failed", str(e))
+
+        def cancel():
+            self.tasks.cancel("export_pdf")
+            win.destroy()
+
+        ttk.Button(win, text="Cancel", width=12, command=cancel, style="Danger.TButton").pack(pady=8)
+        win.protocol("WM_DELETE_WINDOW", cancel)
+
+        self.tasks.submit(lambda task: _export_pdf(path, where, params, search,
+                                                   progress=task.report,
+                                                   cancelled=task.cancelled, sort=sort),
+                          on_done=done, on_error=failed, on_progress=progress, key="export_pdf")
+
+    # ------------------------ Import (Popup) ------------------------
+    def open_import_popup(self):
+        path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")], title="Import CSV")
+        if not path:
+            return
+
+        win = tk.Toplevel(self.root)
+        win.title("Import Students")
+        win.geometry("520x380")
+        win.resizable(False, False)
+        self.theme.track(win)
+        win.transient(self.root)
+
+        ttk.Label(win, text="Import Students", font=("Arial", 14, "bold")).pack(pady=10)
+        ttk.Label(win, text=path, style="Muted.TLabel", wraplength=480).pack()
+
+        mode_var = tk.StringVar(value="skip")
+        frm = ttk.Frame(win)
+        frm.pack(pady=6)
+        ttk.Radiobutton(frm, text="Skip existing roll numbers", variable=mode_var,
+                        value="skip").grid(row=0, column=0, padx=8)
+        ttk.Radiobutton(frm, text="Update existing (upsert)", variable=mode_var,
+                        value="upsert").grid(row=0, column=1, padx=8)
+
+        bar = ttk.Progressbar(win, mode="determinate", maximum=1.0, length=460)
+        bar.pack(pady=6)
+        status = ttk.Label(win, text="", font=("Arial", 10))
+        status.pack()
+        log = self.theme.track(tk.Text(win, width=62, height=8, font=("Courier", 9)), "text")
+        log.pack(pady=6)
+
+        row = ttk.Frame(win)
+        row.pack(pady=4)
+        start_btn = ttk.Button(row, text="Start", width=12, style="Success.TButton")
+        start_btn.grid(row=0, column=0, padx=6)
+        cancel_btn = ttk.Button(row, text="Cancel", width=12, style="Danger.TButton",
+                                state="disabled")
+        cancel_btn.grid(row=0, column=1, padx=6)
+
+        started = [0.0]
+
+        def progress(read, fraction):
+            bar["value"] = fraction
+            elapsed = max(time.perf_counter() - started[0], 1e-6)
+            status.config(text=f"{read:,} rows read  ({read / elapsed:,.0f} rows/s)")
+
+        def done(report):
+            cancel_btn.config(state="disabled")
+            status.config(text="Finished" if not report.cancelled else "Cancelled")
+            log.insert(tk.END, report.summary() + "\n")
+            for line, roll_no, reason in report.issues:
+                log.insert(tk.END, f"line {line}: {roll_no}: {reason}\n")
+            hidden = report.skipped + report.invalid - len(report.issues)
+            if hidden > 0:
+                log.insert(tk.END, f"... and {hidden} more\n")
+            self.fetch_data()
+
+        def failed(e):
+            cancel_btn.config(state="disabled")
+            start_btn.config(state="normal")
+            messagebox.showerror("Import Failed", str(e), parent=win)
+
+        def start():
+            start_btn.config(state="disabled")
+            cancel_btn.config(state="normal")
+            started[0] = time.perf_counter()
+            mode = mode_var.get()
+            self.tasks.submit(lambda task: _import_csv(path, mode, progress=task.report,
+                                                       cancelled=task.cancelled),
+                              on_done=done, on_error=failed, on_progress=progress, key="import")
+
+        def cancel():
+            # Stops after the batch in flight; committed batches stay
+            self.tasks.cancel("import")
+            cancel_btn.config(state="disabled")
+            status.config(text="Cancelled")
+            self.fetch_data()
+
+        start_btn.config(command=start)
+        cancel_btn.config(command=cancel)
 
     # ------------------------ Admin: Add User (Popup) ------------------------
     def open_add_user_popup(self):
@@ -492,27 +1269,26 @@ class StudentManagementSystem:
         win.title("Add New User")
         win.geometry("360x260")
         win.resizable(False, False)
-        win.config(bg="white")
+        self.theme.track(win)
         win.transient(self.root)
         win.grab_set()
 
-        tk.Label(win, text="Add New User", font=("Arial", 14, "bold"),
-                 bg="white").pack(pady=10)
+        ttk.Label(win, text="Add New User", font=("Arial", 14, "bold")).pack(pady=10)
 
-        frm = tk.Frame(win, bg="white")
+        frm = ttk.Frame(win)
         frm.pack(pady=6)
 
-        tk.Label(frm, text="Username:", bg="white").grid(row=0, column=0, sticky="w", padx=8, pady=6)
-        uname = tk.Entry(frm, width=24)
+        ttk.Label(frm, text="Username:").grid(row=0, column=0, sticky="w", padx=8, pady=6)
+        uname = ttk.Entry(frm, width=24)
         uname.grid(row=0, column=1, padx=8)
 
-        tk.Label(frm, text="Password:", bg="white").grid(row=1, column=0, sticky="w", padx=8, pady=6)
-        pwd = tk.Entry(frm, width=24, show="*")
+        ttk.Label(frm, text="Password:").grid(row=1, column=0, sticky="w", padx=8, pady=6)
+        pwd = ttk.Entry(frm, width=24, show="*")
         pwd.grid(row=1, column=1, padx=8)
 
-        tk.Label(frm, text="Role:", bg="white").grid(row=2, column=0, sticky="w", padx=8, pady=6)
+        ttk.Label(frm, text="Role:").grid(row=2, column=0, sticky="w", padx=8, pady=6)
         role_var = tk.StringVar(value="student")
-        ttk.Combobox(frm, textvariable=role_var, values=["admin", "staff", "student"],
+        ttk.Combobox(frm, textvariable=role_var, values=list(ROLES),
                      state="readonly", width=21).grid(row=2, column=1, padx=8)
 
         def save_user():
@@ -523,104 +1299,450 @@ class StudentManagementSystem:
                 messagebox.showerror("Error", "All fields are required.", parent=win)
                 return
 
-            conn = db_connect()
-            c = conn.cursor()
+            # The write runs on a worker; the popup may be closed by the time it finishes
+            def done(_result):
+                parent = win if win.winfo_exists() else self.root
+                messagebox.showinfo("Success", f"User '{u}' added as {r}.", parent=parent)
+                if parent is win:
+                    win.destroy()
+
+            def failed(exc):
+                if not win.winfo_exists():
+                    self._show_db_error(exc)
+                    return
+                add_btn.config(state="normal")
+                if isinstance(exc, sqlite3.IntegrityError):
+                    messagebox.showerror("Error", "Username already exists.", parent=win)
+                else:
+                    messagebox.showerror("Database Error", str(exc), parent=win)
+
+            add_btn.config(state="disabled")
+            self.tasks.submit(lambda task: db_add_user(u, p, r), on_done=done, on_error=failed)
+
+        add_btn = ttk.Button(win, text="Add User", command=save_user, width=12, style="Success.TButton")
+        add_btn.pack(pady=12)
+
+    # ------------------------ Performance (Popup) ------------------------
+    def open_perf_panel(self):
+        win = tk.Toplevel(self.root)
+        win.title("Performance")
+        win.geometry("900x620")
+        self.theme.track(win)
+        win.transient(self.root)
+
+        ttk.Label(win, text="Operation timings (ms)", font=("Arial", 14, "bold")).pack(pady=(10, 4))
+
+        cols = ("op", "count", "p50", "p95", "p99", "max")
+        summary = ttk.Treeview(win, columns=cols, show="headings", height=8)
+        for c in cols:
+            summary.heading(c, text=c.upper() if c != "op" else "Operation")
+            summary.column(c, width=300 if c == "op" else 90, anchor="w" if c == "op" else "e")
+        summary.pack(fill=tk.X, padx=10)
+
+        ttk.Label(win, text="Slowest operations", font=("Arial", 11, "bold")).pack(pady=(10, 2))
+        cols = ("ms", "op", "rows", "sql", "when")
+        slowest = ttk.Treeview(win, columns=cols, show="headings", height=8)
+        for c, w in zip(cols, (90, 300, 80, 80, 160)):
+            slowest.heading(c, text={"sql": "Statements"}.get(c, c.capitalize()))
+            slowest.column(c, width=w, anchor="e" if c in ("ms", "rows", "sql") else "w")
+        slowest.pack(fill=tk.X, padx=10)
+
+        detail = self.theme.track(tk.Text(win, height=10, wrap="none", font=("Courier", 9)), "text")
+        detail.pack(fill=tk.BOTH, expand=1, padx=10, pady=6)
+
+        records = {}
+
+        def refresh():
+            summary.delete(*summary.get_children())
+            stats = metrics.summary()
+            for op, h in sorted(stats.items(), key=lambda kv: kv[1]["p95"], reverse=True):
+                summary.insert("", tk.END, values=(op, h["count"], h["p50"], h["p95"], h["p99"], h["max"]))
+            slowest.delete(*slowest.get_children())
+            records.clear()
+            for rec in metrics.slowest():
+                iid = slowest.insert("", tk.END, values=(
+                    rec["ms"], f"{rec['type']}:{rec['op']}", rec.get("rows", ""), rec.get("sql_count", ""),
+                    time.strftime("%H:%M:%S", time.localtime(rec["ts"]))))
+                records[iid] = rec
+            profile_op["values"] = sorted({op.split(":", 1)[1] for op in stats})
+
+        def show_record(_event):
+            sel = slowest.focus()
+            rec = records.get(sel)
+            if rec is None:
+                return
+            lines = [f"{rec['type']}:{rec['op']}  {rec['ms']} ms"
+                     + (f"  ({rec['error']})" if "error" in rec else "")]
+            for st in rec.get("statements", []):
+                lines.append(f"{st['ms']:>9} ms  {st['params']:<14} {st['sql']}")
+            if rec.get("sql_count", 0) > len(rec.get("statements", [])):
+                lines.append(f"... {rec['sql_count']} statements, {rec['sql_ms']} ms in SQL")
+            if "profile" in rec:
+                lines.append("")
+                lines.append(profile_text(rec["profile"]))
+            detail.delete("1.0", tk.END)
+            detail.insert(tk.END, "\n".join(lines))
+
+        slowest.bind("<<TreeviewSelect>>", show_record)
+
+        bar = ttk.Frame(win)
+        bar.pack(pady=(0, 10))
+        ttk.Button(bar, text="Refresh", width=10, command=refresh).pack(side="left", padx=6)
+
+        def reset():
+            metrics.reset()
+            refresh()
+
+        ttk.Button(bar, text="Reset", width=10, command=reset).pack(side="left", padx=6)
+
+        ttk.Label(bar, text="Profile next run of:").pack(side="left", padx=(24, 4))
+        profile_var = tk.StringVar()
+        profile_op = ttk.Combobox(bar, textvariable=profile_var, width=22)
+        profile_op.pack(side="left")
+
+        def arm():
+            op = profile_var.get().strip()
+            if op:
+                metrics.profile_next(op)
+                messagebox.showinfo("Profiling", f"The next '{op}' will be profiled.\n"
+                                    "Use 'Last profile' once it has run.", parent=win)
+
+        def show_profile():
+            rec = metrics.last_profile
+            detail.delete("1.0", tk.END)
+            if rec is None:
+                detail.insert(tk.END, "No profile captured yet.")
+                return
+            detail.insert(tk.END, f"{rec['type']}:{rec['op']}  {rec['ms']} ms  ({rec['profile']})\n\n"
+                          + profile_text(rec["profile"]))
+
+        ttk.Button(bar, text="Arm", width=8, command=arm).pack(side="left", padx=6)
+        ttk.Button(bar, text="Last profile", width=10, command=show_profile).pack(side="left", padx=6)
+
+        refresh()
+
+    # ------------------------ Statistics ------------------------
+    def open_stats_panel(self):
+        # Counters kept current by triggers: one small read whatever the roster size
+        win = tk.Toplevel(self.root)
+        win.title("Roster Statistics")
+        win.geometry("420x520")
+        self.theme.track(win)
+        win.transient(self.root)
+
+        ttk.Label(win, text="Roster statistics", font=("Arial", 14, "bold")).pack(pady=(10, 4))
+        table = ttk.Treeview(win, columns=("count", "share"), show="tree headings", height=18)
+        table.heading("#0", text="")
+        table.heading("count", text="Students")
+        table.heading("share", text="%")
+        table.column("#0", width=200, anchor="w")
+        table.column("count", width=90, anchor="e")
+        table.column("share", width=70, anchor="e")
+        table.pack(fill=tk.BOTH, expand=1, padx=10)
+
+        def show(stats):
+            table.delete(*table.get_children())
+            total = stats.get("total", {}).get("", 0)
+
+            def line(parent, label, n):
+                share = f"{100 * n / total:.1f}" if total else ""
+                table.insert(parent, tk.END, text=label, values=(f"{n:,}", share))
+
+            line("", "All students", total)
+            sections = (
+                ("Gender", sorted((g or "Not set", n) for g, n in stats.get("gender", {}).items())),
+                (f"Age in {time.localtime().tm_year}", age_bands(stats.get("birth_year", {}))),
+                ("Missing", [("Email", stats.get("missing", {}).get("email", 0)),
+                             ("Contact", stats.get("missing", {}).get("contact", 0)),
+                             ("Linked login", stats.get("unlinked", {}).get("", 0))]),
+            )
+            for title, items in sections:
+                node = table.insert("", tk.END, text=title, open=True)
+                for label, n in items:
+                    line(node, label, n)
+
+        def refresh():
+            self.tasks.submit(lambda task: roster_stats(), on_done=show, on_error=self._show_db_error)
+
+        def rebuild():
+            def run(task):
+                db_rebuild_stats()
+                return roster_stats()
+            self.tasks.submit(run, on_done=show, on_error=self._show_db_error)
+
+        bar = ttk.Frame(win)
+        bar.pack(pady=10)
+        ttk.Button(bar, text="Refresh", width=10, command=refresh).pack(side="left", padx=6)
+        if self.role == "admin":
+            ttk.Button(bar, text="Rebuild", width=10, command=rebuild).pack(side="left", padx=6)
+
+        refresh()
+
+    # ------------------------ Duplicates ------------------------
+    def open_dedup_panel(self):
+        win = tk.Toplevel(self.root)
+        win.title("Possible Duplicates")
+        win.geometry("900x520")
+        self.theme.track(win)
+        win.transient(self.root)
+
+        bar = ttk.Frame(win)
+        bar.pack(fill=tk.X, padx=10, pady=(10, 4))
+        ttk.Label(bar, text="Minimum score:").pack(side="left")
+        threshold_var = tk.StringVar(value="0.85")
+        ttk.Entry(bar, textvariable=threshold_var, width=6).pack(side="left", padx=4)
+        scan_btn = ttk.Button(bar, text="Scan", width=10, style="Accent.TButton")
+        scan_btn.pack(side="left", padx=6)
+        status = ttk.Label(bar, text="", anchor="w")
+        status.pack(side="left", fill=tk.X, expand=1, padx=6)
+
+        cols = ("score", "roll_a", "name_a", "roll_b", "name_b", "matching")
+        table = ttk.Treeview(win, columns=cols, show="headings")
+        for c, text, w in zip(cols, ("Score", "Roll No", "Name", "Roll No", "Name", "Matching"),
+                              (60, 110, 180, 110, 180, 200)):
+            table.heading(c, text=text)
+            table.column(c, width=w, anchor="e" if c == "score" else "w")
+        table.pack(fill=tk.BOTH, expand=1, padx=10)
+        pairs = {}
+
+        def show(report):
+            scan_btn.config(state="normal")
+            if report is None:
+                status.config(text="Scan cancelled.")
+                return
+            table.delete(*table.get_children())
+            pairs.clear()
+            for score, a, b, agree in report.suggestions:
+                iid = table.insert("", tk.END, values=(score, a[0], a[1], b[0], b[1], ", ".join(agree)))
+                pairs[iid] = (a[0], b[0])
+            status.config(text=report.summary())
+
+        def failed(exc):
+            scan_btn.config(state="normal")
+            status.config(text="")
+            self._show_db_error(exc)
+
+        def scan():
             try:
-                c.execute("INSERT INTO users (username, password, role) VALUES (?,?,?)", (u, p, r))
-                conn.commit()
-                messagebox.showinfo("Success", f"User '{u}' added as {r}.", parent=win)
-                win.destroy()
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Username already exists.", parent=win)
-            finally:
-                conn.close()
+                threshold = float(threshold_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "Minimum score is a number between 0 and 1.", parent=win)
+                return
+            scan_btn.config(state="disabled")
+            status.config(text="Scanning…")
+            self.tasks.submit(lambda task: _find_duplicates(threshold, task.cancelled),
+                              on_done=show, on_error=failed, key="dedup")
+
+        scan_btn.config(command=scan)
+
+        def selected():
+            iid = table.focus()
+            if iid not in pairs:
+                messagebox.showerror("Error", "Select a pair first.", parent=win)
+                return None
+            return iid
+
+        def merge(keep_left):
+            iid = selected()
+            if iid is None:
+                return
+            keep, drop = pairs[iid] if keep_left else pairs[iid][::-1]
+            if not messagebox.askyesno("Merge", f"Keep {keep}, fill its blank fields from {drop} "
+                                                f"and delete {drop}?", parent=win):
+                return
+
+            def done(_merged):
+                # Pairs that mention the deleted record are moot now
+                for other, (a, b) in list(pairs.items()):
+                    if drop in (a, b):
+                        table.delete(other)
+                        del pairs[other]
+                self._refresh_row(keep)
+                self._refresh_row(drop)
+
+            self.tasks.submit(lambda task: db_merge_students(keep, drop), on_done=done,
+                              on_error=self._show_db_error)
+
+        def ignore():
+            iid = selected()
+            if iid is not None:
+                table.delete(iid)
+                del pairs[iid]
+
+        actions = ttk.Frame(win)
+        actions.pack(pady=10)
+        ttk.Button(actions, text="Keep left, merge right", width=20,
+                   command=lambda: merge(True)).pack(side="left", padx=6)
+        ttk.Button(actions, text="Keep right, merge left", width=20,
+                   command=lambda: merge(False)).pack(side="left", padx=6)
+        ttk.Button(actions, text="Not duplicates", width=14, command=ignore).pack(side="left", padx=6)
+
+    # ------------------------ Backups ------------------------
+    def open_backup_panel(self):
+        win = tk.Toplevel(self.root)
+        win.title("Backups")
+        win.geometry("640x440")
+        self.theme.track(win)
+        win.transient(self.root)
+
+        ttk.Label(win, text="Database snapshots", font=("Arial", 14, "bold")).pack(pady=(10, 2))
+        ttk.Label(win, text="Taken while everyone keeps working; each one is integrity-checked "
+                            "before it is kept.", style="Muted.TLabel").pack()
+
+        table = ttk.Treeview(win, columns=("taken", "size", "file"), show="headings", height=10)
+        for c, text, w in (("taken", "Taken", 150), ("size", "Size", 80), ("file", "File", 360)):
+            table.heading(c, text=text)
+            table.column(c, width=w, anchor="e" if c == "size" else "w")
+        table.pack(fill=tk.BOTH, expand=1, padx=10, pady=6)
+
+        bar = ttk.Progressbar(win, mode="determinate", maximum=1.0, length=600)
+        bar.pack(padx=10)
+        status = ttk.Label(win, text="", anchor="w")
+        status.pack(fill=tk.X, padx=10)
+        stages = {"copy": "Copying pages…", "verify": "Checking integrity…", "compress": "Compressing…"}
+
+        def load():
+            if _remote is not None:
+                status.config(text="Snapshots are kept in the server's backups folder.")
+                return
+            if _shards is not None and _shards.insert_campus is None:
+                status.config(text="Choose a campus at the top to see its snapshots.")
+                return
+            from sms_backup import list_backups
+
+            def show(found):
+                table.delete(*table.get_children())
+                for path, size, mtime in found:
+                    table.insert("", tk.END, iid=path, values=(
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(mtime)),
+                        f"{size / 2 ** 20:.1f} MB", path))
+
+            self.tasks.submit(lambda task: _in_campus(list_backups), on_done=show, on_error=self._show_db_error)
+
+        def busy(on):
+            for b in controls:
+                b.config(state="disabled" if on else "normal")
+            cancel_btn.config(state="normal" if on else "disabled")
+
+        def progress(stage, fraction):
+            bar["value"] = fraction
+            status.config(text=stages.get(stage, ""))
+
+        def finished(report):
+            busy(False)
+            bar["value"] = 0
+            status.config(text="Backup cancelled." if report is None else report.summary())
+            load()
+
+        def failed(exc):
+            busy(False)
+            bar["value"] = 0
+            status.config(text="")
+            self._show_db_error(exc)
+
+        def backup():
+            busy(True)
+            status.config(text="Starting…")
+            self.tasks.submit(lambda task: _backup(task.report, task.cancelled), on_done=finished,
+                              on_error=failed, on_progress=progress, key="backup")
+
+        def cancel():
+            self.tasks.cancel("backup")
+            cancel_btn.config(state="disabled")
+
+        def selected():
+            path = table.focus()
+            if not path:
+                messagebox.showerror("Error", "Select a snapshot first.", parent=win)
+            return path or None
+
+        def verify():
+            path = selected()
+            if path is None:
+                return
+            from sms_backup import verify_backup
 
-        tk.Button(win, text="Add User", command=save_user, width=12,
-                  bg="#2ecc71", fg="white").pack(pady=12)
+            def done(problems):
+                busy(False)
+                result = problems[0] if problems else "integrity check passed"
+                status.config(text=f"{os.path.basename(path)}: {result}")
 
-        if self.dark_mode:
-            self._apply_popup_theme(win)
+            busy(True)
+            status.config(text="Checking integrity…")
+            self.tasks.submit(lambda task: verify_backup(path), on_done=done, on_error=failed)
+
+        def restore():
+            path = selected()
+            if path is None:
+                return
+            if not messagebox.askyesno("Restore", f"Replace the whole database with {os.path.basename(path)}?\n"
+                                                  "The current database is backed up first.", parent=win):
+                return
+            def done(saved):
+                busy(False)
+                status.config(text="Restored. Previous database saved as "
+                                   f"{os.path.basename(saved.path)}." if saved else "Restored.")
+                self.fetch_data()
+                load()
+
+            busy(True)
+            status.config(text="Restoring…")
+            # Queued edits belong to the database being replaced; land them before it's saved.
+            # The wait happens on the worker, so a slow write doesn't freeze the window.
+            self.tasks.submit(lambda task: (self.writes.wait(), _restore_backup(path))[1],
+                              on_done=done, on_error=failed)
+
+        actions = ttk.Frame(win)
+        actions.pack(pady=10)
+        backup_btn = ttk.Button(actions, text="Back up now", width=12, style="Success.TButton", command=backup)
+        backup_btn.pack(side="left", padx=6)
+        cancel_btn = ttk.Button(actions, text="Cancel", width=10, state="disabled", command=cancel)
+        cancel_btn.pack(side="left", padx=6)
+        verify_btn = ttk.Button(actions, text="Verify", width=10, command=verify)
+        verify_btn.pack(side="left", padx=6)
+        restore_btn = ttk.Button(actions, text="Restore…", width=10, style="Danger.TButton", command=restore)
+        restore_btn.pack(side="left", padx=6)
+        controls = [backup_btn, verify_btn, restore_btn]
+        if _remote is not None:
+            # Restoring replaces the server's file under every client: done on the server host
+            verify_btn.config(state="disabled")
+            restore_btn.config(state="disabled")
+            cancel_btn.pack_forget()
+            controls = [backup_btn]
+
+        load()
 
     # ------------------------ Theme ------------------------
     def toggle_theme(self):
-        self.dark_mode = not self.dark_mode
-        if self.dark_mode:
-            bg = "#1f2937"   # dark slate
-            fg = "white"
-            card = "#111827"
-            btn = "#374151"
-            self.theme_btn.config(text="☀️ Light Mode")
-        else:
-            bg = "white"
-            fg = "black"
-            card = "white"
-            btn = "#f5f5f5"
-            self.theme_btn.config(text="🌙 Dark Mode")
-
-        # Root + title
-        self.root.config(bg=bg)
-        self.title_bar.config(bg="#0f172a" if self.dark_mode else "#34495e", fg="white")
-
-        # Walk and recolor
-        def paint(widget):
-            try:
-                if isinstance(widget, (tk.Frame, tk.LabelFrame)):
-                    widget.config(bg=card)
-                elif isinstance(widget, tk.Label):
-                    widget.config(bg=card, fg=fg)
-                elif isinstance(widget, tk.Button):
-                    widget.config(bg=btn, fg=fg, activebackground=btn, activeforeground=fg)
-                elif isinstance(widget, (tk.Entry, tk.Text)):
-                    widget.config(bg="#111827" if self.dark_mode else "white",
-                                  fg=fg, insertbackground=fg)
-            except Exception:
-                pass
-            for ch in widget.winfo_children():
-                paint(ch)
-
-        paint(self.root)
-
-        # ttk styles (Treeview/Combobox)
-        style = ttk.Style(self.root)
-        if self.dark_mode:
-            style.theme_use("clam")
-            style.configure("Treeview",
-                            background="#0b1220", fieldbackground="#0b1220",
-                            foreground="white")
-            style.configure("TCombobox",
-                            fieldbackground="#111827",
-                            foreground="white")
-        else:
-            style.theme_use("default")
-            style.configure("Treeview",
-                            background="white", fieldbackground="white",
-                            foreground="black")
-            style.configure("TCombobox",
-                            fieldbackground="white",
-                            foreground="black")
-
-    def _apply_popup_theme(self, win):
-        if not self.dark_mode:
-            return
-        def paint(widget):
-            try:
-                if isinstance(widget, (tk.Frame, tk.LabelFrame, tk.Toplevel)):
-                    widget.config(bg="#111827")
-                elif isinstance(widget, tk.Label):
-                    widget.config(bg="#111827", fg="white")
-                elif isinstance(widget, tk.Entry):
-                    widget.config(bg="#0b1220", fg="white", insertbackground="white")
-                elif isinstance(widget, tk.Button):
-                    widget.config(bg="#374151", fg="white", activebackground="#374151", activeforeground="white")
-            except Exception:
-                pass
-            for ch in widget.winfo_children():
-                paint(ch)
-        paint(win)
+        with metrics.timed("ui", "toggle_theme"):
+            dark = not self.theme.dark
+            self.theme.use("dark" if dark else "light")
+            self.theme_btn.config(text="☀️ Light Mode" if dark else "🌙 Dark Mode")
 
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="Student Management System")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="print launch milestones (imports, init_db, windows, first paint) to stderr")
+    parser.add_argument("--server", metavar="URL",
+                        help="use a shared sms_server (e.g. http://127.0.0.1:8765) instead of app.db")
+    args = parser.parse_args()
+    startup.enabled = args.startup_timing
+
+    metrics.open_log()
+    if args.server:
+        _use_server(args.server)
+    else:
+        init_db()
+    startup.mark("init_db")
     root = tk.Tk()
     LoginWindow(root)
-    root.mainloop()
+    startup.mark("login window built")
+    root.after_idle(lambda: startup.mark("login paint"))
+    try:
+        root.mainloop()
+    finally:
+        if _shards is not None:
+            _shards.close()
+        close_db()
+        metrics.close_log()
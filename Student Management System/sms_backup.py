@@ -0,0 +1,239 @@
+"""Online backups of the live database with SQLite's backup API.
+
+    python sms_cli.py backup --keep 14
+    python sms_cli.py restore backups/app-20261018-020700.db.gz
+
+A snapshot is copied page by page from one read transaction: under WAL that is a fixed
+view of the database, so everyone else keeps reading and writing while it runs and the
+file is the database as it was when the backup started. Every snapshot passes PRAGMA
+integrity_check before it is kept, and only then are the oldest ones rotated out.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import sms_db
+
+# Snapshots go to this folder next to the database file; the newest BACKUP_KEEP are kept
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 7
+# Pages (4 KB each) copied per backup step; progress and cancellation are checked between steps
+BACKUP_STEP_PAGES = 256
+# gzip level 1: about 3x faster than 6 on a database file and only ~15% larger
+GZIP_LEVEL = 1
+COPY_CHUNK = 1024 * 1024
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+# ------------------------ Snapshots ------------------------
+class BackupReport:
+    __slots__ = ("path", "pages", "size", "seconds")
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = 0
+        self.size = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        return (f"Saved {os.path.basename(self.path)}: {self.pages:,} pages, "
+                f"{self.size / 2 ** 20:.1f} MB in {self.seconds:.1f}s (integrity check passed)")
+
+
+def backup_dir(directory=None):
+    return directory or os.path.join(os.path.dirname(os.path.abspath(sms_db.get_db().path)), BACKUP_DIR)
+
+
+def _stem():
+    return os.path.splitext(os.path.basename(sms_db.get_db().path))[0]
+
+
+def list_backups(directory=None):
+    # -> [(path, bytes, mtime)] of this database's snapshots, newest first
+    directory = backup_dir(directory)
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(re.escape(_stem()) + r"-\d{8}-\d{6}(-\d+)?\.db(\.gz)?$")
+    found = []
+    for name in os.listdir(directory):
+        if pattern.match(name):
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            found.append((path, st.st_size, st.st_mtime))
+    found.sort(key=lambda b: (b[2], b[0]), reverse=True)
+    return found
+
+
+def prune_backups(directory=None, keep=BACKUP_KEEP):
+    # Delete all but the newest keep snapshots; returns the paths removed
+    removed = []
+    for path, _, _ in list_backups(directory)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def _new_path(directory, compress):
+    base = os.path.join(directory, f"{_stem()}-{time.strftime('%Y%m%d-%H%M%S')}")
+    suffix = ".db.gz" if compress else ".db"
+    path = base + suffix
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{base}-{n}{suffix}"
+    return path
+
+
+def _copy_pages(dest, pages, progress, cancelled):
+    # Page-stepped copy of the live database into a new file; returns the page count.
+    # The source holds one read transaction throughout, so writers on other connections
+    # neither wait for the copy nor force it to start over.
+    src = sqlite3.connect(sms_db.get_db().path, timeout=sms_db.BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    dst = sqlite3.connect(dest)
+    total = [0]
+
+    def step(status, remaining, count):
+        total[0] = count
+        if progress:
+            progress("copy", (count - remaining) / count if count else 1.0)
+        if cancelled is not None and cancelled():
+            raise BackupCancelled()      # aborts the backup
+
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        src.backup(dst, pages=pages, progress=step)
+        src.execute("COMMIT")
+        # One self-contained file, no -wal/-shm to keep next to it
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dst.close()
+        src.close()
+    return total[0]
+
+
+def _integrity(path):
+    # -> problems reported by PRAGMA integrity_check ([] = ok)
+    conn = sqlite3.connect(path)
+    try:
+        rows = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if rows == ["ok"] else rows
+
+
+def _compress(src, dest, progress, cancelled):
+    size = os.path.getsize(src)
+    done = 0
+    with open(src, "rb") as f_in, gzip.open(dest, "wb", compresslevel=GZIP_LEVEL) as f_out:
+        while True:
+            chunk = f_in.read(COPY_CHUNK)
+            if not chunk:
+                break
+            f_out.write(chunk)
+            done += len(chunk)
+            if progress:
+                progress("compress", done / size if size else 1.0)
+            if cancelled is not None and cancelled():
+                raise BackupCancelled()
+
+
+def backup_database(directory=None, compress=True, keep=BACKUP_KEEP, pages=BACKUP_STEP_PAGES,
+                    progress=None, cancelled=None):
+    """Snapshot the live database into the backup folder while others keep working.
+
+    progress(stage, fraction) is called with stage "copy", "verify" and "compress".
+    keep=None keeps every snapshot. Returns a BackupReport, or None if cancelled
+    (nothing is left behind). A snapshot failing the integrity check raises
+    sqlite3.DatabaseError and is deleted, so it never rotates out a good one.
+    """
+    start = time.perf_counter()
+    directory = backup_dir(directory)
+    os.makedirs(directory, exist_ok=True)
+    path = _new_path(directory, compress)
+    raw = (path[:-3] if compress else path) + ".part"
+    packed = path + ".part"
+    report = BackupReport(path)
+    try:
+        report.pages = _copy_pages(raw, pages, progress, cancelled)
+        if progress:
+            progress("verify", 1.0)
+        problems = _integrity(raw)
+        if problems:
+            raise sqlite3.DatabaseError(f"Backup failed the integrity check: {problems[0]}")
+        if compress:
+            _compress(raw, packed, progress, cancelled)
+            os.replace(packed, path)
+            os.remove(raw)
+        else:
+            os.replace(raw, path)
+    except BackupCancelled:
+        return None
+    finally:
+        for leftover in (raw, packed):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    if keep is not None:
+        prune_backups(directory, keep)
+    report.size = os.path.getsize(path)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+# ------------------------ Verify & Restore ------------------------
+@contextmanager
+def _opened(path):
+    # A snapshot as a plain database file (a .gz one is unpacked next to it for the duration)
+    if not path.lower().endswith(".gz"):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        yield path
+        return
+    plain = path[:-3] + ".restore"
+    try:
+        with gzip.open(path, "rb") as f_in, open(plain, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, COPY_CHUNK)
+        yield plain
+    finally:
+        for leftover in (plain, plain + "-journal"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def verify_backup(path):
+    # -> integrity problems in a snapshot ([] = ok)
+    with _opened(path) as plain:
+        return _integrity(plain)
+
+
+def restore_backup(path, safety_copy=True):
+    """Replace the live database's contents with a snapshot, without closing the app.
+
+    The snapshot is verified first, and unless safety_copy is off the current database is
+    backed up (outside the rotation) so the restore can be undone. The pages go in through
+    the app's own writer connection in one step: readers see the old database or the
+    restored one, never a mix. Snapshots from an older version are migrated afterwards.
+    Returns the safety copy's BackupReport (or None).
+    """
+    with _opened(path) as plain:
+        problems = _integrity(plain)
+        if problems:
+            raise sqlite3.DatabaseError(f"{os.path.basename(path)} failed the integrity check: {problems[0]}")
+        saved = backup_database(keep=None) if safety_copy else None
+        src = sqlite3.connect(plain)
+        try:
+            with sms_db.get_db().writer() as conn:
+                src.backup(conn)
+                conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            src.close()
+    sms_db.get_db().cache.invalidate()
+    sms_db.init_db()
+    return saved
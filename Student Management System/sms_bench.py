@@ -0,0 +1,301 @@
+"""Headless benchmark for every data path of the Student Management System.
+
+    python sms_bench.py --sizes 1000 100000 1000000 --out bench.json
+
+Each size gets a fresh database filled with a synthetic roster. Every operation is timed
+over a few runs, and every SQL statement it issues gets an EXPLAIN QUERY PLAN. Plans that
+scan a whole table or sort through a temp B-tree are flagged. Output is JSON so results
+from different versions can be diffed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+
+import sms_db
+from sms_db import (STUDENT_COLUMNS, SEARCH_FIELDS, PAGE_SIZE, get_db, close_db, init_db,
+                    authenticate, count_students, fetch_student_page, search_students,
+                    db_insert_student, db_update_student, db_delete_student, deferred_sync)
+from sms_io import export_students_csv
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_REPEAT = 5
+# PDF rendering is ~minutes per million rows; larger rosters record "skipped"
+PDF_MAX_ROWS = 100000
+GENERATE_BATCH = 20000
+
+MALE_NAMES = ("Muhammad", "Ali", "Ahmed", "Hassan", "Omar", "Bilal", "Usman", "Hamza", "Daniel",
+              "James", "John", "Michael", "David", "Ravi", "Arjun", "Wei", "Chen", "Luis", "Carlos", "Kofi")
+FEMALE_NAMES = ("Fatima", "Ayesha", "Zainab", "Maryam", "Sara", "Hira", "Emma", "Olivia", "Sophia",
+                "Mia", "Priya", "Ananya", "Mei", "Lin", "Maria", "Ana", "Amara", "Grace", "Noor", "Leila")
+LAST_NAMES = ("Khan", "Ahmed", "Ali", "Hussain", "Shah", "Malik", "Smith", "Johnson", "Williams",
+              "Brown", "Jones", "Garcia", "Martinez", "Patel", "Sharma", "Singh", "Wang", "Li", "Zhang",
+              "Okafor", "Mensah", "Nguyen", "Kim", "Rossi", "Silva", "Cohen", "Ivanov", "Murphy")
+STREETS = ("Main", "Park", "Oak", "Canal", "Mall", "Station", "Church", "Garden", "Lake", "Hill")
+CITIES = ("Lahore", "Karachi", "Islamabad", "London", "Leeds", "Austin", "Toronto", "Pune", "Accra")
+DOMAINS = ("gmail.com", "yahoo.com", "outlook.com", "school.edu")
+
+
+# ------------------------ Synthetic Roster ------------------------
+def _zipf_weights(n):
+    # A few very common names and a long tail, like real rosters
+    return [1 / (i + 1) for i in range(n)]
+
+
+def _contact(rng):
+    n = rng.randrange(10 ** 9)
+    style = rng.random()
+    if style < 0.05:
+        return ""
+    if style < 0.6:
+        return f"03{n % 100:02d}-{n // 100 % 10 ** 7:07d}"
+    if style < 0.85:
+        return f"+92 3{n % 100:02d} {n // 100 % 10 ** 7:07d}"
+    return f"(0{n % 100:02d}) {n // 100 % 1000:03d}-{n // 10 ** 5 % 10 ** 4:04d}"
+
+
+def _dob(rng, start=date(1998, 1, 1), span=365 * 17):
+    d = start + timedelta(days=rng.randrange(span))
+    style = rng.random()
+    if style < 0.02:
+        return ""
+    if style < 0.85:
+        return d.isoformat()
+    if style < 0.95:
+        return d.strftime("%d/%m/%Y")
+    return d.strftime("%d %b %Y")
+
+
+def generate_roster(n, seed=42, linked=0.3):
+    """Yield (student_row, user_row_or_None) for n synthetic students."""
+    rng = random.Random(seed)
+    male_w, female_w, last_w = (_zipf_weights(len(MALE_NAMES)), _zipf_weights(len(FEMALE_NAMES)),
+                                _zipf_weights(len(LAST_NAMES)))
+    for i in range(n):
+        g = rng.random()
+        gender = "Male" if g < 0.48 else "Female" if g < 0.96 else "Other"
+        pool, weights = (MALE_NAMES, male_w) if gender == "Male" else (FEMALE_NAMES, female_w)
+        first = rng.choices(pool, weights)[0]
+        last = rng.choices(LAST_NAMES, last_w)[0]
+        email = "" if rng.random() < 0.1 else f"{first}.{last}{i}@{rng.choice(DOMAINS)}".lower()
+        address = f"{rng.randrange(1, 999)} {rng.choice(STREETS)} Road, {rng.choice(CITIES)}"
+        username = f"{first.lower()}{i}" if rng.random() < linked else None
+        roll_no = f"{2015 + i % 10}-{i:07d}"
+        student = (roll_no, f"{first} {last}", email, gender, _contact(rng), _dob(rng), address, username)
+        user = (username, "pass", "student") if username else None
+        yield student, user
+
+
+def populate(n, seed=42):
+    rows = generate_roster(n, seed)
+    while True:
+        batch = [r for _, r in zip(range(GENERATE_BATCH), rows)]
+        if not batch:
+            break
+        with get_db().writer() as conn:
+            conn.executemany("INSERT INTO users (username, password, role) VALUES (?,?,?)",
+                             [u for _, u in batch if u])
+            with deferred_sync(conn):
+                conn.executemany(f"INSERT INTO students ({', '.join(STUDENT_COLUMNS)}) "
+                                 f"VALUES (?,?,?,?,?,?,?,?)", [s for s, _ in batch])
+
+
+# ------------------------ Measurement ------------------------
+class StatementLog:
+    # Collects each distinct statement the pool runs (trace callback gives expanded SQL)
+    def __init__(self):
+        self.statements = []
+        self._seen = set()
+
+    def __call__(self, sql):
+        sql = sql.strip()
+        if sql.startswith("--") or sql in self._seen:
+            return          # trigger bodies are reported as comments
+        if "'main'." in sql:
+            return          # FTS5's own bookkeeping on its shadow tables
+        head = sql.split(None, 1)[0].upper()
+        if head in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+            self._seen.add(sql)
+            self.statements.append(sql)
+
+
+def explain(sql):
+    with get_db().reader() as conn:
+        try:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        except sqlite3.Error as e:
+            return {"sql": sql, "error": str(e)}
+    full_scan = any(step.startswith("SCAN ") and "USING" not in step and "VIRTUAL TABLE" not in step
+                    for step in plan)
+    temp_sort = any("TEMP B-TREE" in step for step in plan)
+    return {"sql": sql, "plan": plan, "full_scan": full_scan, "temp_sort": temp_sort}
+
+
+def _timings(times):
+    return {"min_s": round(min(times), 6), "median_s": round(statistics.median(times), 6),
+            "max_s": round(max(times), 6)}
+
+
+def measure(fn, repeat, warm=False):
+    # Every run starts from an empty query cache, so the main numbers time the SQL.
+    # warm: fn reads through the cache (sms_db.cached_query); each run is then repeated
+    # straight away and those cache hits are reported apart, under "warm".
+    log = StatementLog()
+    get_db().set_trace(log)
+    try:
+        cold, hits = [], []
+        for i in range(repeat):
+            get_db().cache.invalidate()
+            start = time.perf_counter()
+            fn(i)
+            cold.append(time.perf_counter() - start)
+            if warm:
+                start = time.perf_counter()
+                fn(i)
+                hits.append(time.perf_counter() - start)
+    finally:
+        get_db().set_trace(None)
+    result = {"runs": repeat, **_timings(cold)}
+    if warm:
+        result["warm"] = _timings(hits)
+    result["plans"] = [explain(sql) for sql in log.statements[:20]]
+    return result
+
+
+def _search_term(field, sample):
+    # A realistic prefix of an existing value for the field
+    val = sample[STUDENT_COLUMNS.index(field)] or "a"
+    return val.split()[0][:4]
+
+
+def bench_size(n, workdir, repeat, seed, pdf_max_rows):
+    path = os.path.join(workdir, f"bench_{n}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    close_db()
+    sms_db.DB_FILE = path
+
+    result = {"rows": n, "ops": {}}
+    ops = result["ops"]
+
+    start = time.perf_counter()
+    init_db()
+    ops["init_db"] = {"runs": 1, "min_s": round(time.perf_counter() - start, 6), "plans": []}
+
+    start = time.perf_counter()
+    populate(n, seed)
+    result["generate_s"] = round(time.perf_counter() - start, 3)
+    with get_db().writer() as conn:
+        conn.execute("ANALYZE")
+    result["db_bytes"] = os.path.getsize(path)
+
+    # Startup again on a populated file
+    ops["init_db_existing"] = measure(lambda i: init_db(), repeat)
+    ops["login"] = measure(lambda i: authenticate("admin", "admin123"), repeat)
+
+    first = fetch_student_page(limit=PAGE_SIZE + 1)
+    sample = first[0]
+    ops["fetch_data"] = measure(lambda i: (count_students(), fetch_student_page(limit=PAGE_SIZE + 1)),
+                                repeat, warm=True)
+    mid = fetch_student_page(after=("M", ""), limit=1)
+    if mid:
+        key = (mid[0][1], mid[0][0])
+        ops["fetch_page_deep"] = measure(lambda i: fetch_student_page(after=key, limit=PAGE_SIZE + 1),
+                                         repeat, warm=True)
+    ops["fetch_data_student_role"] = measure(
+        lambda i: fetch_student_page("username=?", (sample[7] or "nobody",), limit=PAGE_SIZE + 1), repeat,
+        warm=True)
+
+    linked = next((r for r in fetch_student_page("username IS NOT NULL", limit=1)), sample)
+    for field in SEARCH_FIELDS:
+        term = _search_term(field, linked)
+        ops[f"search_fts_{field}"] = measure(lambda i: search_students(term, field), repeat, warm=True)
+        ops[f"search_like_{field}"] = measure(
+            lambda i: (count_students(f"{field} LIKE ?", (f"%{term}%",)),
+                       fetch_student_page(f"{field} LIKE ?", (f"%{term}%",), limit=PAGE_SIZE + 1)),
+            repeat, warm=True)
+
+    def new_row(i):
+        return (f"BENCH-{i:06d}", "Bench Student", "bench@example.com", "Other",
+                "0300-0000000", "2005-05-05", "1 Bench Road", None)
+    ops["add_student"] = measure(lambda i: db_insert_student(new_row(i)), repeat)
+    ops["update_student"] = measure(lambda i: db_update_student(new_row(i)[:1] + ("Bench Updated",) +
+                                                                new_row(i)[2:]), repeat)
+    ops["delete_student"] = measure(lambda i: db_delete_student(new_row(i)[0]), repeat)
+
+    csv_path = os.path.join(workdir, f"bench_{n}.csv")
+    ops["export_csv"] = measure(lambda i: export_students_csv(csv_path), 1)
+    os.remove(csv_path)
+
+    if n <= pdf_max_rows:
+        from sms_report import export_students_pdf
+        pdf_path = os.path.join(workdir, f"bench_{n}.pdf")
+        ops["export_pdf"] = measure(lambda i: export_students_pdf(pdf_path), 1)
+        os.remove(pdf_path)
+    else:
+        ops["export_pdf"] = {"skipped": f"more than {pdf_max_rows} rows"}
+
+    result["connection_stats"] = get_db().stats()
+    close_db()
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the Student Management System data layer.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    ap.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--pdf-max-rows", type=int, default=PDF_MAX_ROWS)
+    ap.add_argument("--workdir", help="where to build the databases (default: a temp dir)")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sms_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "sizes": [],
+    }
+    try:
+        for n in args.sizes:
+            report["sizes"].append(bench_size(n, workdir, args.repeat, args.seed, args.pdf_max_rows))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    flagged = sorted({f"{size['rows']}:{name}" for size in report["sizes"]
+                      for name, op in size["ops"].items()
+                      for plan in op.get("plans", []) if plan.get("full_scan")})
+    report["full_scans"] = flagged
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
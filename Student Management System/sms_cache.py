@@ -0,0 +1,123 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# Default memory budget for cached query results
+CACHE_BUDGET_BYTES = 32 * 1024 * 1024
+
+
+# ------------------------ Query Cache ------------------------
+def normalize_search(text):
+    # Same tokens build_fts_query uses, so "  Jo SMI" and "jo smi" share an entry
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def estimate_size(value):
+    # Deep size of the row containers the data layer returns (tuples/lists of scalars)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "tables")
+
+    def __init__(self, value, size, tables):
+        self.value = value
+        self.size = size
+        self.tables = tables
+
+
+class QueryCache:
+    """LRU cache of query results bounded by an estimated byte budget.
+
+    Entries are dropped by table when this process writes (invalidate) and wholesale when
+    version_fn() changes, i.e. PRAGMA data_version saw a commit from another connection.
+    The writer reports its own commits (settle_version) so they don't count as foreign.
+    Entries hold the result lists as the sqlite3 module returns them. A slotted record
+    of the same eight fields would save 8 bytes a row (96 vs 104) but cost a conversion
+    on every miss and hit, since the table and exports take the tuples as they are.
+    A result computed while an invalidation happened is not stored (generation check),
+    so a slow query can't put stale rows back.
+    """
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES, version_fn=None):
+        self.budget = budget_bytes
+        self._version_fn = version_fn
+        self._version = None
+        self._entries = OrderedDict()
+        self._used = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self):
+        if self._version_fn is None:
+            return
+        version = self._version_fn()
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._clear()
+                self._version = version
+
+    def settle_version(self, version):
+        # version_fn()'s value right after this process committed
+        if self._version_fn is None:
+            return
+        with self._lock:
+            if self._version is not None:
+                self._version = version
+
+    def lookup(self, key):
+        # -> (hit, value, generation); pass generation back to store()
+        self._check_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None, self._generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value, self._generation
+
+    def store(self, key, value, generation, tables=("students",)):
+        size = estimate_size(value) + estimate_size(key)
+        if size > self.budget:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._used -= old.size
+            self._entries[key] = CacheEntry(value, size, frozenset(tables))
+            self._used += size
+            while self._used > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self._used -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, tables=None):
+        # tables=None drops everything
+        with self._lock:
+            self._generation += 1
+            if tables is None:
+                self._clear()
+                return
+            tables = set(tables)
+            for key in [k for k, e in self._entries.items() if e.tables & tables]:
+                self._used -= self._entries.pop(key).size
+
+    def _clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._used = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._used, "budget": self.budget,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,660 @@
+"""Headless command line for the Student Management System (no Tk, no display needed).
+
+    python sms_cli.py init
+    python sms_cli.py --user admin backup --keep 14
+    python sms_cli.py --user admin consolidate --dry-run
+    python sms_cli.py --user admin --campus North import north.csv
+    python sms_cli.py --user admin import roster.csv --mode upsert
+    python sms_cli.py --user staff export-csv - --search "khan" | gzip > khan.csv.gz
+    python sms_cli.py --user staff export-csv - --filter name:prefix:Al --filter email:empty --sort dob:desc
+    cut -d, -f1 leavers.csv | python sms_cli.py --user admin delete -
+
+The login is checked against the same users table as the desktop app and the same role
+rules apply: students read only their own record, staff manage students, admins also
+manage users. The password comes from --password, $SMS_PASSWORD, or a prompt.
+
+With campuses set up (`campus add`), student commands work in one campus's file: the
+login's own campus, or --campus for unrestricted logins. Read-only commands (export-csv,
+export-pdf, search, stats) given no --campus read every campus as one roster.
+"""
+import argparse
+import csv
+import getpass
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from itertools import islice
+
+import sms_db
+from sms_db import (STUDENT_COLUMNS, SEARCH_FIELDS, ROLES, init_db, close_db, authenticate,
+                    role_allows, role_filter, search_available, fetch_student, iter_view,
+                    parse_dob, link_username, birth_filter, build_filter, db_normalize_dobs, dob_issues, roster_stats,
+                    db_rebuild_stats, age_bands, db_merge_students, CHANGE_TABLES,
+                    CHANGE_LOG_RETENTION_DAYS, change_log_head, db_maintain_change_log, db_delete_students,
+                    db_add_user, db_update_user, db_delete_user, list_users, list_campuses,
+                    user_campus, db_set_user_campus)
+from sms_io import (GENDERS, import_students_stream, export_students_csv, write_students_csv,
+                    export_changes, write_changes, IMPORT_BATCH_SIZE)
+
+# Roll numbers per transaction for `delete -`
+DELETE_BATCH = 5000
+
+
+class CliError(Exception):
+    pass
+
+
+# ------------------------ Login ------------------------
+def _login(args, action=None, campus=None):
+    # campus: None (app.db only: logins, campuses), "one" (one campus's students),
+    # "any" (one campus, or all of them as one roster) or "opt" (a campus if named, else app.db)
+    user = args.user or os.environ.get("SMS_USER")
+    if not user:
+        raise CliError("this command needs --user (or $SMS_USER)")
+    password = args.password or os.environ.get("SMS_PASSWORD")
+    if password is None:
+        if not sys.stdin.isatty():
+            raise CliError("no password: use --password or $SMS_PASSWORD when stdin is not a terminal")
+        password = getpass.getpass(f"Password for {user}: ")
+    role = authenticate(user, password)
+    if role is None:
+        raise CliError("invalid username or password")
+    if action is not None and not role_allows(role, action):
+        raise CliError(f"role '{role}' is not allowed to do this")
+    args.router = None
+    args.source = _use_campus(args, user, campus) if campus else None
+    return user, role
+
+
+def _use_campus(args, user, scope):
+    # Bind this run to the login's campus (or --campus); returns the router when an
+    # "any" command reads every campus, else None. A bound run keeps its one-campus
+    # router in args.router: student writes go through it so they are checked against
+    # every other campus too.
+    from sms_shards import ShardRouter
+    limit = user_campus(user)
+    name = args.campus or limit
+    if limit and name != limit:
+        raise CliError(f"'{user}' works at campus {limit} only")
+    router = ShardRouter.for_login(name)
+    if router is None:
+        if args.campus:
+            raise CliError("no campuses are set up (see `campus add`)")
+        return None
+    args.stack.callback(router.close)
+    if name is not None:
+        args.stack.enter_context(router.bound())
+        args.router = router
+        return None
+    if scope == "any":
+        return router
+    if scope == "one":
+        raise CliError(f"choose a campus with --campus ({', '.join(router.names)})")
+    return None
+
+
+def _view(args, user, role):
+    # (where, params, search) of what this login asked for and may see
+    where, params = role_filter(role, user)
+    born, born_params = birth_filter(args.born_from, args.born_to, args.min_age, args.max_age)
+    if born:
+        where = f"{where} AND {born}" if where else born
+        params += born_params
+    if args.filter:
+        extra, extra_params = build_filter([_predicate(f) for f in args.filter])
+        where = f"{where} AND {extra}" if where else extra
+        params += extra_params
+    text = getattr(args, "search", None)
+    if not text:
+        return where, params, None
+    field = args.field
+    if search_available():
+        return where, params, (text, field)
+    # No FTS5 in this SQLite build: same LIKE fallback as the desktop search box
+    clause = f"s.{field or 'name'} LIKE ?"
+    where = f"{where} AND {clause}" if where else clause
+    return where, params + (f"%{text}%",), None
+
+
+def _predicate(text):
+    # --filter COLUMN:OP[:VALUE] -> (column, op, value); a range's VALUE is LOW..HIGH
+    column, _, rest = text.partition(":")
+    op, _, value = rest.partition(":")
+    if op == "range":
+        if ".." not in value:
+            raise CliError(f"--filter {text}: a range is LOW..HIGH (either end may be left out)")
+        value = tuple(value.split("..", 1))
+    return column, op, value
+
+
+def _sort(args):
+    # --sort COLUMN[:desc] -> (column, descending); None = the default order
+    if not args.sort:
+        return None
+    column, _, way = args.sort.partition(":")
+    if column not in STUDENT_COLUMNS or way not in ("", "asc", "desc"):
+        raise CliError(f"--sort {args.sort}: use COLUMN or COLUMN:desc "
+                       f"(columns: {', '.join(STUDENT_COLUMNS)})")
+    return column, way == "desc"
+
+
+# ------------------------ Streams ------------------------
+def _open_in(path):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    return open(path, newline="", encoding="utf-8-sig")
+
+
+def _stdout():
+    # csv writes its own \r\n; don't let the platform translate it again
+    sys.stdout.reconfigure(newline="")
+    return sys.stdout
+
+
+def _columns(text):
+    if not text:
+        return STUDENT_COLUMNS
+    cols = tuple(c.strip() for c in text.split(","))
+    bad = [c for c in cols if c not in STUDENT_COLUMNS]
+    if bad:
+        raise CliError(f"unknown columns: {', '.join(bad)} (choose from {', '.join(STUDENT_COLUMNS)})")
+    return cols
+
+
+# ------------------------ Commands ------------------------
+def cmd_init(args):
+    init_db()
+    print(f"Database ready: {sms_db.DB_FILE} (schema v{sms_db.MIGRATIONS[-1][0]})", file=sys.stderr)
+
+
+def cmd_import(args):
+    _login(args, "import", "one")
+    size = None if args.file == "-" else os.path.getsize(args.file) or 1
+    with _open_in(args.file) as f:
+        report = import_students_stream(f, args.mode, args.batch_size, size=size,
+                                        claimed=args.router and args.router.claimed_elsewhere)
+    print(report.summary(), file=sys.stderr)
+    for line, roll_no, reason in report.issues:
+        print(f"line {line}: {roll_no}: {reason}", file=sys.stderr)
+    return 1 if report.invalid or report.skipped else 0
+
+
+def cmd_export_csv(args):
+    user, role = _login(args, campus="any")
+    where, params, search = _view(args, user, role)
+    columns = _columns(args.columns)
+    if args.file == "-":
+        count = write_students_csv(_stdout(), where, params, search, columns, limit=args.limit,
+                                   source=args.source, sort=_sort(args))
+    else:
+        count = export_students_csv(args.file, where, params, search, columns,
+                                    compress=True if args.gzip else None, limit=args.limit,
+                                    source=args.source, sort=_sort(args))
+    print(f"{count} rows", file=sys.stderr)
+
+
+def cmd_changes(args):
+    # Delta export: rows changed since a checkpoint; with --checkpoint FILE the checkpoint
+    # is read from FILE (missing = first run, full export) and advanced after a clean run.
+    # Student changes are per campus; the users table lives in app.db
+    _login(args, "export", "one" if args.table == "students" else "opt")
+    since = args.since
+    if args.checkpoint and since is None and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            since = int(f.read().strip() or 0)
+    if args.file == "-":
+        until = change_log_head()
+        count = write_changes(_stdout(), args.table, since, until, args.format)
+    else:
+        count, until = export_changes(args.file, args.table, since, args.format,
+                                      compress=True if args.gzip else None)
+    if args.checkpoint:
+        tmp = args.checkpoint + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{until}\n")
+        os.replace(tmp, args.checkpoint)
+    print(f"{count} {'rows' if since is None else 'changes'}, checkpoint {until}", file=sys.stderr)
+
+
+def cmd_changes_maintain(args):
+    _login(args, "maintain", "opt")
+    pruned, compacted = db_maintain_change_log(None if args.retain_days < 0 else args.retain_days,
+                                               compact=not args.no_compact)
+    print(f"pruned {pruned} old entries, compacted {compacted} superseded entries", file=sys.stderr)
+
+
+def cmd_export_pdf(args):
+    from sms_report import export_students_pdf
+    user, role = _login(args, campus="any")
+    where, params, search = _view(args, user, role)
+    if args.file != "-":
+        pages = export_students_pdf(args.file, where, params, search, workers=args.workers,
+                                    source=args.source, sort=_sort(args))
+    else:
+        # reportlab seeks while writing, so render to a temp file and copy it out
+        fd, tmp = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        try:
+            pages = export_students_pdf(tmp, where, params, search, workers=args.workers,
+                                        source=args.source, sort=_sort(args))
+            with open(tmp, "rb") as f:
+                shutil.copyfileobj(f, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        finally:
+            os.remove(tmp)
+    print(f"{pages} pages", file=sys.stderr)
+
+
+def cmd_search(args):
+    user, role = _login(args, campus="any")
+    where, params, search = _view(args, user, role)
+    columns = _columns(args.columns)
+    if args.format == "csv":
+        write_students_csv(_stdout(), where, params, search, columns, limit=args.limit,
+                           source=args.source, sort=_sort(args))
+        return
+    out = sys.stdout
+    left = args.limit
+    for rows in (args.source or sms_db).iter_view(where, params, search, columns, sort=_sort(args)):
+        for row in rows[:left]:
+            out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+        if left is not None:
+            left -= min(left, len(rows))
+            if not left:
+                break
+
+
+def _student_row(args, base=None):
+    # Options given on the command line override base (the stored row, for update); only
+    # those are checked, so a stored value the form let through doesn't block an update
+    rec = dict(zip(STUDENT_COLUMNS, base)) if base else dict.fromkeys(STUDENT_COLUMNS, "")
+    rec["roll_no"] = args.roll_no
+    given = set()
+    for col in STUDENT_COLUMNS[1:]:
+        value = getattr(args, col)
+        if value is not None:
+            rec[col] = value.strip()
+            given.add(col)
+    if not rec["roll_no"] or not rec["name"]:
+        raise CliError("Roll No and Name are required")
+    if "gender" in given and rec["gender"]:
+        # any case, as CSV import takes it
+        gender = rec["gender"].capitalize()
+        if gender not in GENDERS:
+            raise CliError(f"unknown gender '{rec['gender']}'")
+        rec["gender"] = gender
+    if "dob" in given:
+        try:
+            rec["dob"] = parse_dob(rec["dob"])
+        except ValueError as e:
+            raise CliError(str(e)) from None
+    rec["username"] = link_username(rec["username"])
+    return tuple(rec[c] for c in STUDENT_COLUMNS)
+
+
+def cmd_dob_report(args):
+    # Stored D.O.B values that aren't dates, as CSV; --normalize re-reads them all first
+    if args.normalize:
+        _login(args, "write", "one")
+        fixed, reported = db_normalize_dobs()
+        print(f"rewrote {fixed} dates, {reported} unreadable", file=sys.stderr)
+    else:
+        _login(args, "report", "one")
+    out = csv.writer(_stdout())
+    out.writerow(("Roll No", "D.O.B", "Problem"))
+    out.writerows(dob_issues())
+
+
+def cmd_stats(args):
+    # The dashboard's counters as JSON; --rebuild recounts them from the roster first
+    if args.rebuild:
+        _login(args, "maintain", "any")
+        (args.source or sms_db).db_rebuild_stats()
+    else:
+        _login(args, "stats", "any")
+    stats = (args.source or sms_db).roster_stats()
+    print(json.dumps({
+        "total": stats.get("total", {}).get("", 0),
+        "gender": stats.get("gender", {}),
+        "age_this_year": dict(age_bands(stats.get("birth_year", {}))),
+        "missing": stats.get("missing", {}),
+        "unlinked": stats.get("unlinked", {}).get("", 0),
+    }, indent=2))
+
+
+def cmd_dedup(args):
+    # Likely duplicate pairs as CSV, best first; the scan summary goes to stderr
+    _login(args, "dedup", "one")
+    from sms_dedup import find_duplicates
+    report = find_duplicates(sms_db.get_db().path, args.threshold, limit=args.limit)
+    print(report.summary(), file=sys.stderr)
+    out = csv.writer(_stdout())
+    out.writerow(("Score", "Roll No A", "Name A", "Roll No B", "Name B", "Matching"))
+    for score, a, b, agree in report.suggestions:
+        out.writerow((score, a[0], a[1], b[0], b[1], " ".join(agree)))
+
+
+def cmd_merge(args):
+    _login(args, "dedup", "one")
+    db_merge_students(args.keep, args.drop)
+
+
+def cmd_backup(args):
+    # Online snapshot: the database stays usable by everyone else while it's copied
+    from sms_backup import backup_database
+    _login(args, "backup", "opt")
+    report = backup_database(args.dir, compress=not args.no_gzip, keep=args.keep or None)
+    print(report.summary(), file=sys.stderr)
+    print(report.path)
+
+
+def cmd_backups(args):
+    from sms_backup import list_backups, verify_backup
+    _login(args, "backup", "opt")
+    bad = 0
+    for path, size, mtime in list_backups(args.dir):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))}\t{size / 2 ** 20:.1f} MB\t{path}"
+        if args.verify:
+            problems = verify_backup(path)
+            bad += bool(problems)
+            line += "\t" + (problems[0] if problems else "ok")
+        print(line)
+    return 1 if bad else 0
+
+
+def cmd_restore(args):
+    from sms_backup import restore_backup
+    _login(args, "backup", "opt")
+    saved = restore_backup(args.file, safety_copy=not args.no_safety_copy)
+    if saved is not None:
+        print(f"previous database saved as {saved.path}", file=sys.stderr)
+    print(f"restored {args.file}", file=sys.stderr)
+
+
+def cmd_consolidate(args):
+    # Merge the old loose .db files; the reconciliation (every row not simply added) is
+    # CSV on stdout, the per-file counts go to stderr
+    from sms_legacy import consolidate
+    _login(args, "users")
+    if not args.dry_run and not args.no_backup:
+        from sms_backup import backup_database
+        print(backup_database().summary(), file=sys.stderr)
+    report = consolidate(args.files or None, args.students, args.users, args.dry_run)
+    print(report.summary(), file=sys.stderr)
+    out = csv.writer(_stdout())
+    out.writerow(("File", "Table", "Key", "Outcome", "New Key", "Detail"))
+    out.writerows(report.details)
+
+
+def cmd_add(args):
+    _login(args, "write", "one")
+    if args.gender is None:
+        args.gender = "Male"     # the form's default
+    (args.router or sms_db).db_insert_student(_student_row(args))
+
+
+def cmd_update(args):
+    _login(args, "write", "one")
+    current = fetch_student(args.roll_no)
+    if current is None:
+        raise CliError(f"no student with Roll No {args.roll_no}")
+    (args.router or sms_db).db_update_student(_student_row(args, current))
+
+
+def cmd_delete(args):
+    _login(args, "write", "one")
+    if args.roll_nos != ["-"]:
+        removed = db_delete_students(args.roll_nos)
+    else:
+        # One roll number per line (extra CSV columns ignored), a transaction per batch
+        rolls = (line.split(",", 1)[0].strip() for line in sys.stdin)
+        rolls = (r for r in rolls if r)
+        removed = 0
+        while True:
+            batch = list(islice(rolls, DELETE_BATCH))
+            if not batch:
+                break
+            removed += db_delete_students(batch)
+    print(f"{removed} deleted", file=sys.stderr)
+
+
+def _new_password(args):
+    if args.new_password is not None:
+        return args.new_password
+    if not sys.stdin.isatty():
+        # First line of stdin, so `echo "$PW" | sms_cli.py user add ...` works
+        return sys.stdin.readline().rstrip("\n")
+    first = getpass.getpass("New password: ")
+    if getpass.getpass("Repeat: ") != first:
+        raise CliError("passwords do not match")
+    return first
+
+
+def cmd_user(args):
+    _login(args, "users")
+    if args.user_cmd == "list":
+        for username, role in list_users():
+            print(f"{username}\t{role}")
+    elif args.user_cmd == "add":
+        password = _new_password(args)
+        if not password:
+            raise CliError("password must not be empty")
+        try:
+            db_add_user(args.username, password, args.role)
+        except sqlite3.IntegrityError:
+            raise CliError(f"username '{args.username}' already exists")
+    elif args.user_cmd == "passwd":
+        if not db_update_user(args.username, password=_new_password(args)):
+            raise CliError(f"no user '{args.username}'")
+    elif args.user_cmd == "role":
+        if not db_update_user(args.username, role=args.role):
+            raise CliError(f"no user '{args.username}'")
+    elif args.user_cmd == "delete":
+        if args.username == (args.user or os.environ.get("SMS_USER")):
+            raise CliError("refusing to delete the login running this command")
+        if not db_delete_user(args.username):
+            raise CliError(f"no user '{args.username}'")
+
+
+def cmd_campus(args):
+    _login(args, "users")
+    if args.campus_cmd == "list":
+        for name, path in list_campuses():
+            print(f"{name}\t{sms_db.campus_file(path)}")
+    elif args.campus_cmd == "add":
+        from sms_shards import add_campus
+        try:
+            path = add_campus(args.name, args.path)
+        except sqlite3.IntegrityError:
+            raise CliError(f"campus '{args.name}' or its file is already registered")
+        print(f"{args.name}: {sms_db.campus_file(path)}", file=sys.stderr)
+    elif args.campus_cmd == "assign":
+        if not db_set_user_campus(args.username, None if args.name == "-" else args.name):
+            raise CliError(f"no user '{args.username}'")
+
+
+# ------------------------ Parser ------------------------
+def build_parser():
+    ap = argparse.ArgumentParser(prog="sms_cli.py", description="Student Management System, headless.")
+    ap.add_argument("--db", default=sms_db.DB_FILE, help="database file (default: %(default)s)")
+    ap.add_argument("--user", help="login name (default: $SMS_USER)")
+    ap.add_argument("--password", help="login password (default: $SMS_PASSWORD, else prompt)")
+    ap.add_argument("--campus", help="work in this campus's database (default: the login's campus)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("init", help="create or migrate the database")
+    p.set_defaults(func=cmd_init)
+
+    p = sub.add_parser("import", help="bulk-load students from CSV ('-' = stdin)")
+    p.add_argument("file", nargs="?", default="-")
+    p.add_argument("--mode", choices=("skip", "upsert"), default="skip",
+                   help="what to do with roll numbers that already exist")
+    p.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    p.set_defaults(func=cmd_import)
+
+    def add_view_args(p):
+        p.add_argument("--field", choices=SEARCH_FIELDS, help="search one column only")
+        p.add_argument("--columns", help="comma-separated subset of: " + ",".join(STUDENT_COLUMNS))
+        p.add_argument("--limit", type=int, help="stop after this many rows")
+        add_filter_args(p)
+
+    def add_filter_args(p):
+        p.add_argument("--filter", action="append", default=[], metavar="COLUMN:OP[:VALUE]",
+                       help="only rows where COLUMN equals / prefix / range (VALUE = LOW..HIGH) / "
+                            "empty / not_empty; repeat to combine (all must hold)")
+        p.add_argument("--sort", metavar="COLUMN[:desc]",
+                       help="order by this column (default: name; searches: best match)")
+        p.add_argument("--born-from", help="only students born on or after this date")
+        p.add_argument("--born-to", help="only students born on or before this date")
+        p.add_argument("--min-age", type=int, help="only students at least this old")
+        p.add_argument("--max-age", type=int, help="only students at most this old")
+
+    p = sub.add_parser("export-csv", help="write students as CSV ('-' = stdout)")
+    p.add_argument("file", nargs="?", default="-")
+    p.add_argument("--search", help="only rows matching this text")
+    p.add_argument("--gzip", action="store_true", help="gzip the file (implied by a .gz name)")
+    add_view_args(p)
+    p.set_defaults(func=cmd_export_csv)
+
+    p = sub.add_parser("changes", help="export only what changed since a checkpoint ('-' = stdout)")
+    p.add_argument("file", nargs="?", default="-")
+    p.add_argument("--table", choices=tuple(CHANGE_TABLES), default="students")
+    p.add_argument("--since", type=int, help="checkpoint from the previous export (default: full export)")
+    p.add_argument("--checkpoint", help="file holding the checkpoint; read before and updated after")
+    p.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    p.add_argument("--gzip", action="store_true", help="gzip the file (implied by a .gz name)")
+    p.set_defaults(func=cmd_changes)
+
+    p = sub.add_parser("changes-maintain", help="apply change-log retention and compaction (admin)")
+    p.add_argument("--retain-days", type=float, default=CHANGE_LOG_RETENTION_DAYS,
+                   help="drop entries older than this; -1 keeps everything (default: %(default)s)")
+    p.add_argument("--no-compact", action="store_true", help="keep entries superseded by later ones")
+    p.set_defaults(func=cmd_changes_maintain)
+
+    p = sub.add_parser("export-pdf", help="render students as a PDF report ('-' = stdout)")
+    p.add_argument("file")
+    p.add_argument("--search", help="only rows matching this text")
+    p.add_argument("--field", choices=SEARCH_FIELDS, help="search one column only")
+    p.add_argument("--workers", type=int, help="render processes (default: CPU count)")
+    add_filter_args(p)
+    p.set_defaults(func=cmd_export_pdf)
+
+    p = sub.add_parser("search", help="stream matching students to stdout")
+    p.add_argument("search", metavar="text")
+    p.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    add_view_args(p)
+    p.set_defaults(func=cmd_search)
+
+    for name, func in (("add", cmd_add), ("update", cmd_update)):
+        p = sub.add_parser(name, help=f"{name} one student" + (" (only given fields change)" if name == "update" else ""))
+        p.add_argument("roll_no")
+        for col in STUDENT_COLUMNS[1:]:
+            p.add_argument("--" + col.replace("_", "-"), dest=col)
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("dob-report", help="list stored D.O.B values that aren't dates (CSV)")
+    p.add_argument("--normalize", action="store_true", help="first rewrite readable dates as YYYY-MM-DD")
+    p.set_defaults(func=cmd_dob_report)
+
+    p = sub.add_parser("stats", help="roster counts by gender, age band, missing fields (JSON)")
+    p.add_argument("--rebuild", action="store_true", help="recount from the roster first (admin)")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("dedup", help="list likely duplicate students (CSV, admin)")
+    p.add_argument("--threshold", type=float, default=0.85, help="minimum score 0..1 (default: %(default)s)")
+    p.add_argument("--limit", type=int, default=1000, help="most pairs to list (default: %(default)s)")
+    p.set_defaults(func=cmd_dedup)
+
+    p = sub.add_parser("merge", help="fold one student into another, then delete it (admin)")
+    p.add_argument("keep", help="Roll No that stays; its blank fields are filled in")
+    p.add_argument("drop", help="Roll No that is removed")
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser("backup", help="snapshot the database without taking it offline (admin)")
+    p.add_argument("--dir", help="backup folder (default: backups/ next to the database)")
+    p.add_argument("--keep", type=int, default=7, help="newest snapshots kept; 0 keeps all (default: %(default)s)")
+    p.add_argument("--no-gzip", action="store_true", help="store the snapshot uncompressed")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("backups", help="list snapshots, newest first (admin)")
+    p.add_argument("--dir", help="backup folder (default: backups/ next to the database)")
+    p.add_argument("--verify", action="store_true", help="run an integrity check on each")
+    p.set_defaults(func=cmd_backups)
+
+    p = sub.add_parser("restore", help="replace the database with a snapshot (admin)")
+    p.add_argument("file")
+    p.add_argument("--no-safety-copy", action="store_true",
+                   help="don't back up the current database first")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("consolidate", help="merge old .db files into the database (admin)")
+    p.add_argument("files", nargs="*", help="legacy files (default: the known ones next to the database)")
+    p.add_argument("--students", choices=("skip", "replace", "fill", "rename"), default="skip",
+                   help="when a Roll No already exists with other data (default: %(default)s)")
+    p.add_argument("--users", choices=("skip", "replace", "rename"), default="skip",
+                   help="when a username already exists with other data (default: %(default)s)")
+    p.add_argument("--dry-run", action="store_true", help="report only, write nothing")
+    p.add_argument("--no-backup", action="store_true", help="don't take a backup first")
+    p.set_defaults(func=cmd_consolidate)
+
+    p = sub.add_parser("delete", help="delete students by Roll No ('-' = one per line on stdin)")
+    p.add_argument("roll_nos", nargs="+")
+    p.set_defaults(func=cmd_delete)
+
+    p = sub.add_parser("user", help="manage logins (admin only)")
+    users = p.add_subparsers(dest="user_cmd", required=True)
+    users.add_parser("list")
+    for name in ("add", "passwd"):
+        u = users.add_parser(name)
+        u.add_argument("username")
+        u.add_argument("--new-password", help="default: first line of stdin, or prompt")
+        if name == "add":
+            u.add_argument("--role", choices=ROLES, default="student")
+    u = users.add_parser("role")
+    u.add_argument("username")
+    u.add_argument("role", choices=ROLES)
+    u = users.add_parser("delete")
+    u.add_argument("username")
+    p.set_defaults(func=cmd_user)
+
+    p = sub.add_parser("campus", help="set up campuses, one database file each (admin only)")
+    campuses = p.add_subparsers(dest="campus_cmd", required=True)
+    campuses.add_parser("list")
+    c = campuses.add_parser("add")
+    c.add_argument("name")
+    c.add_argument("--path", help="database file, relative to the main one "
+                                  "(default: campuses/<name>.db)")
+    c = campuses.add_parser("assign", help="limit a login to one campus ('-' = all campuses)")
+    c.add_argument("username")
+    c.add_argument("name")
+    p.set_defaults(func=cmd_campus)
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sms_db.DB_FILE = args.db
+    try:
+        if args.command != "init":
+            init_db()     # cheap when the schema is current; keeps old files usable
+        with ExitStack() as args.stack:
+            return args.func(args) or 0
+    except BrokenPipeError:
+        # Reader went away (`| head`); silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (CliError, sqlite3.Error, ValueError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import gzip
+import http.client
+import json
+import os
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+
+from sms_db import SEARCH_LIMIT, PAGE_SIZE, MAX_LOADED_PAGES, STUDENT_COLUMNS
+from sms_io import ImportReport
+from sms_backup import BackupReport
+
+TIMEOUT = 60
+CHUNK = 256 * 1024
+# sms_server accepts at most this many calls per /api/batch
+BATCH_CALLS = 100
+
+# Server error "type" -> exception the desktop app already handles for local calls
+_ERRORS = {"IntegrityError": sqlite3.IntegrityError, "DatabaseError": sqlite3.DatabaseError,
+           "ValueError": ValueError}
+
+
+# ------------------------ Service Client ------------------------
+class ServiceClient:
+    """Same call signatures as the sms_db/sms_io functions the desktop app uses, served
+    by sms_server over HTTP. One keep-alive connection per calling thread."""
+
+    # Names the desktop app rebinds to this client in --server mode
+    DATA_API = ("authenticate", "search_available", "count_students", "fetch_student_page",
+                "fetch_student", "fetch_student_range", "search_students", "db_insert_student",
+                "db_update_student", "db_delete_student", "db_add_user", "db_apply_writes",
+                "roster_stats", "db_rebuild_stats")
+    # sms_db write kinds -> server calls
+    _WRITE_CALLS = {"insert": ("insert_student", "row"), "update": ("update_student", "row"),
+                    "delete": ("delete_student", "roll_no")}
+
+    def __init__(self, url, timeout=TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.token = None
+        self._local = threading.local()
+        self._search_available = None
+
+    # ---- transport ----
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _send(self, op, body=None, query="", content_type="application/json"):
+        headers = {"Content-Type": content_type}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if hasattr(body, "read"):
+            # The server only takes Content-Length bodies, not chunked uploads
+            headers["Content-Length"] = str(len(body))
+        elif body is not None:
+            body = json.dumps(body).encode("utf-8")
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.request("POST", f"/api/{op}{query}", body=body, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server dropped an idle keep-alive connection; retry once on a fresh one
+                conn.close()
+                self._local.conn = None
+                if attempt or hasattr(body, "read"):
+                    raise
+
+    def _raise(self, resp):
+        try:
+            payload = json.loads(resp.read() or b"{}")
+        except ValueError:
+            payload = {}
+        message = payload.get("error", f"HTTP {resp.status}")
+        if resp.status in (401, 403):
+            raise PermissionError(message)
+        raise _ERRORS.get(payload.get("type"), sqlite3.DatabaseError)(message)
+
+    def call(self, op, **body):
+        resp = self._send(op, body)
+        if resp.status != 200:
+            self._raise(resp)
+        return json.loads(resp.read())["result"]
+
+    def batch(self, calls):
+        # [(op, body), ...] in one round trip -> [result | exception, ...]
+        out = []
+        for item in self.call("batch", calls=[{"op": op, "body": body} for op, body in calls]):
+            if "error" in item:
+                out.append(_ERRORS.get(item.get("type"), sqlite3.DatabaseError)(item["error"]))
+            else:
+                out.append(item["result"])
+        return out
+
+    # ---- data layer ----
+    def authenticate(self, username, password):
+        try:
+            result = self.call("login", username=username, password=password)
+        except PermissionError:
+            return None
+        self.token = result["token"]
+        return result["role"]
+
+    def search_available(self):
+        if self._search_available is None:
+            self._search_available = self.call("info")["search_available"]
+        return self._search_available
+
+    def count_students(self, where="", params=()):
+        return self.call("count_students", where=where, params=params)
+
+    def fetch_student_page(self, where="", params=(), after=None, before=None, limit=PAGE_SIZE, sort=None):
+        return _rows(self.call("fetch_student_page", where=where, params=params, after=after,
+                               before=before, limit=limit, sort=sort))
+
+    def fetch_student(self, roll_no, where="", params=()):
+        row = self.call("fetch_student", roll_no=roll_no, where=where, params=params)
+        return tuple(row) if row is not None else None
+
+    def fetch_student_range(self, where="", params=(), low=None, high=None,
+                            limit=PAGE_SIZE * MAX_LOADED_PAGES, sort=None):
+        return _rows(self.call("fetch_student_range", where=where, params=params, low=low,
+                               high=high, limit=limit, sort=sort))
+
+    def search_students(self, text, field=None, where="", params=(), limit=SEARCH_LIMIT, cancelled=None,
+                        sort=None, after=None, before=None):
+        # The server can't be interrupted mid-query; a cancelled search just drops its answer
+        rows, total = self.call("search_students", text=text, field=field, where=where,
+                                params=params, limit=limit, sort=sort, after=after, before=before)
+        if cancelled is not None and cancelled():
+            return None
+        return _rows(rows), total
+
+    def roster_stats(self):
+        return self.call("roster_stats")
+
+    def db_rebuild_stats(self):
+        self.call("rebuild_stats")
+
+    def db_insert_student(self, row):
+        self.call("insert_student", row=row)
+
+    def db_update_student(self, row):
+        self.call("update_student", row=row)
+
+    def db_delete_student(self, roll_no):
+        self.call("delete_student", roll_no=roll_no)
+
+    def db_add_user(self, username, password, role):
+        self.call("add_user", username=username, password=password, role=role)
+
+    def db_apply_writes(self, ops):
+        # A group of queued edits in as few round trips as the server's batch limit allows;
+        # the server commits whatever arrives together as one transaction
+        calls = [(self._WRITE_CALLS[kind][0], {self._WRITE_CALLS[kind][1]: payload}) for kind, payload in ops]
+        results = []
+        for i in range(0, len(calls), BATCH_CALLS):
+            results += self.batch(calls[i:i + BATCH_CALLS])
+        return [r if isinstance(r, Exception) else None for r in results]
+
+    def backup_database(self, compress=True, progress=None, cancelled=None):
+        # Taken and kept on the server; it can't be stopped or followed from here
+        data = self.call("backup", compress=compress)
+        report = BackupReport(data["path"])
+        for name in ("pages", "size", "seconds"):
+            setattr(report, name, data[name])
+        return report
+
+    # ---- files ----
+    def _download(self, op, path, body, compress=False, progress=None, total=None, cancelled=None):
+        # Stream a response body to path; returns (bytes, rows seen, headers) or None if cancelled
+        resp = self._send(op, body)
+        if resp.status != 200:
+            self._raise(resp)
+        total = int(resp.getheader("X-Total-Rows", 0)) if total is None else total
+        opener = gzip.open if compress else open
+        lines = 0
+        size = 0
+        try:
+            with opener(path, "wb") as f:
+                while True:
+                    chunk = resp.read(CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+                    lines += chunk.count(b"\n")
+                    if progress and total:
+                        done = max(lines - 1, 0)     # header line; embedded newlines overcount a little
+                        progress(done, min(done / total, 1.0))
+                    if cancelled is not None and cancelled():
+                        # Can't stop the server mid-stream except by hanging up
+                        self._conn().close()
+                        self._local.conn = None
+                        os.remove(path)
+                        return None
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return size, max(lines - 1, 0), resp
+
+    def export_students_csv(self, path, where="", params=(), search=None, columns=STUDENT_COLUMNS,
+                            compress=None, progress=None, cancelled=None, sort=None):
+        if compress is None:
+            compress = path.lower().endswith(".gz")
+        result = self._download("export_csv", path, {"where": where, "params": params, "search": search,
+                                                     "columns": columns, "sort": sort},
+                                compress, progress, None, cancelled)
+        return None if result is None else result[1]
+
+    def export_students_pdf(self, path, where="", params=(), search=None, workers=None,
+                            progress=None, cancelled=None, sort=None):
+        result = self._download("export_pdf", path, {"where": where, "params": params, "search": search,
+                                                     "workers": workers, "sort": sort}, cancelled=cancelled)
+        if result is None:
+            return None
+        pages = int(result[2].getheader("X-Pages", 0))
+        if progress:
+            progress(pages, 1.0)
+        return pages
+
+    def import_students_csv(self, path, mode="skip", progress=None, cancelled=None):
+        # The file is uploaded whole and imported server-side; progress covers the upload
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            resp = self._send("import_csv", _Upload(f, size, progress), query=f"?mode={mode}",
+                              content_type="text/csv")
+        if resp.status != 200:
+            self._raise(resp)
+        data = json.loads(resp.read())["result"]
+        report = ImportReport()
+        for name in ("read", "written", "skipped", "invalid", "seconds", "cancelled"):
+            setattr(report, name, data[name])
+        report.issues = [tuple(i) for i in data["issues"]]
+        return report
+
+
+class _Upload:
+    # File wrapper http.client streams the upload from, reporting progress as it goes
+    def __init__(self, f, size, progress):
+        self.f = f
+        self.size = size
+        self.sent = 0
+        self.progress = progress
+
+    def __len__(self):
+        return self.size
+
+    def read(self, n=-1):
+        chunk = self.f.read(CHUNK if n is None or n < 0 else n)
+        self.sent += len(chunk)
+        if self.progress and self.size:
+            self.progress(0, self.sent / self.size)
+        return chunk
+
+
+def _rows(rows):
+    # JSON arrays back to the tuples sqlite3 returns, so rows compare equal either way
+    return [tuple(r) for r in rows]
@@ -0,0 +1,1388 @@
+import functools
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import queue
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from sms_cache import QueryCache, normalize_search
+from sms_metrics import metrics
+
+DB_FILE = "app.db"
+
+STUDENT_COLUMNS = ("roll_no", "name", "email", "gender", "contact", "dob", "address", "username")
+STUDENT_SELECT = "SELECT " + ", ".join(STUDENT_COLUMNS) + " FROM students"
+STUDENT_LABELS = {"roll_no": "Roll No", "name": "Name", "email": "Email", "gender": "Gender",
+                  "contact": "Contact", "dob": "D.O.B", "address": "Address", "username": "Username"}
+
+# Virtualized table: rows fetched per page and how many pages stay in the Treeview at once
+PAGE_SIZE = 100
+MAX_LOADED_PAGES = 3
+
+# Full-text search: columns indexed in students_fts, max ranked hits returned per search
+SEARCH_FIELDS = ("roll_no", "name", "contact", "username", "email")
+SEARCH_LIMIT = 500
+FTS_ENABLED = False
+_FTS_COLS = ", ".join(SEARCH_FIELDS)
+
+# Connection tuning
+READER_POOL_SIZE = 3
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",       # safe with WAL, one fsync per checkpoint instead of per commit
+    "PRAGMA cache_size=-16000",        # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",      # map up to 256 MB of the file
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+# VM steps between checks of a query's cancel flag
+PROGRESS_STEPS = 1000
+# Rows per fetchmany() when streaming a whole view (exports)
+STREAM_BATCH = 2000
+# Keys per IN (...) list when looking many roll numbers up at once
+KEY_CHUNK = 500
+
+# Accepted D.O.B spellings, tried in order; numeric dates are read day first.
+# Stored values are ISO (YYYY-MM-DD) so they sort and compare as dates.
+DOB_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d",
+               "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y")
+MIN_BIRTH_YEAR = 1900
+# Rows per statement when normalizing stored dates
+DOB_BATCH = 5000
+
+# Change log: tables captured (-> key column, exported columns; never the password) and
+# how long entries are kept by default
+CHANGE_TABLES = {"students": ("roll_no", STUDENT_COLUMNS), "users": ("username", ("username", "role"))}
+CHANGE_LOG_RETENTION_DAYS = 90
+
+# Roster statistics: age bands (inclusive, None = open) over the age students turn this year
+AGE_BANDS = ((None, 17, "Under 18"), (18, 20, "18-20"), (21, 24, "21-24"), (25, None, "25 and over"))
+
+
+# ------------------------ Connections ------------------------
+class ConnectionStats:
+    __slots__ = ("name", "queries", "seconds", "statement_reuse", "_seen")
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.seconds = 0.0
+        self.statement_reuse = 0
+        self._seen = set()
+
+    def record(self, sql, elapsed):
+        self.queries += 1
+        self.seconds += elapsed
+        # sqlite3 keeps compiled statements keyed by SQL text, so a repeat of the
+        # same parameterized text is served from the statement cache.
+        if sql in self._seen:
+            self.statement_reuse += 1
+        elif len(self._seen) < STATEMENT_CACHE_SIZE:
+            self._seen.add(sql)
+
+    def as_dict(self):
+        return {"connection": self.name, "queries": self.queries,
+                "seconds": round(self.seconds, 6), "statement_reuse": self.statement_reuse}
+
+
+class TrackedConnection(sqlite3.Connection):
+    # sqlite3.connect(factory=...) subclass that times every execute on the connection
+    # and attaches it to the sms_metrics operation running on the calling thread
+    stats = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        cur = None
+        try:
+            cur = super().execute(sql, params)
+            return cur
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record(sql, elapsed)
+            metrics.statement(sql, params, elapsed, rowcount=cur.rowcount if cur is not None else -1)
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        cur = None
+        try:
+            cur = super().executemany(sql, seq)
+            return cur
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.record(sql, elapsed)
+            metrics.statement(sql, seq, elapsed, many=True,
+                              rowcount=cur.rowcount if cur is not None else -1)
+
+
+class ConnectionManager:
+    """One long-lived writer plus a small pool of readers over the same WAL database."""
+
+    def __init__(self, path=DB_FILE, readers=READER_POOL_SIZE):
+        self.path = path
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._max_readers = max(1, readers)
+        self._pool_lock = threading.Lock()
+        self._all = []
+        self._closed = False
+        self._trace = None
+        self._watch = None
+        self._watch_lock = threading.Lock()
+        # Query results cached for this database; see Query Cache below
+        self.cache = QueryCache(version_fn=self.data_version)
+        # on_write(tables) runs after every commit that changed rows (tables=None: unknown)
+        self.on_write = [self.cache.invalidate]
+
+        self._writer = self._open("writer")
+        # WAL is persistent in the file; readers no longer block the writer or each other
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        # The writer's own data_version: it moves only for commits from other connections
+        self._seen_version = self._writer_version()
+
+    def _open(self, name):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               factory=TrackedConnection, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.stats = ConnectionStats(name)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.set_trace_callback(self._trace)
+        self._all.append(conn)
+        return conn
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._reader_count < self._max_readers:
+                self._reader_count += 1
+                return self._open(f"reader-{self._reader_count}")
+        return self._readers.get()
+
+    @contextmanager
+    def reader(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection manager is closed.")
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            # Never hand a connection back with an open read transaction (it would pin the WAL)
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self, touches=None):
+        # touches: tables the block writes, so caches only drop what it can affect
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection manager is closed.")
+        with self._write_lock:
+            before = self._writer.total_changes
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                if self._writer.total_changes != before:
+                    self._after_write(touches)
+
+    def _writer_version(self):
+        return self._writer.execute("PRAGMA data_version").fetchone()[0]
+
+    def _after_write(self, touches):
+        # Called with the write lock held. The watch connection counts this commit as a
+        # foreign one, so the cache adopts its new value instead of clearing everything;
+        # only if the writer saw some other connection commit since its last write does
+        # every table count as touched. Read in this order, a foreign commit can't slip
+        # between the two unnoticed.
+        watched = self.data_version()
+        seen = self._writer_version()
+        if seen != self._seen_version:
+            touches = None
+        self._seen_version = seen
+        for hook in self.on_write:
+            hook(touches)
+        self.cache.settle_version(watched)
+
+    def data_version(self):
+        # PRAGMA data_version changes whenever *another* connection (or process) commits.
+        # A dedicated connection is used so the value isn't tied to a pooled one.
+        with self._watch_lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.path, check_same_thread=False)
+            return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def set_trace(self, callback):
+        # callback(sql) for every statement on every pooled connection; None turns it off
+        self._trace = callback
+        for conn in self._all:
+            conn.set_trace_callback(callback)
+
+    def stats(self):
+        return [conn.stats.as_dict() for conn in self._all]
+
+    def close(self):
+        with self._write_lock:
+            self._closed = True
+            try:
+                # Cheap on close: only re-analyzes tables whose stats have drifted
+                self._writer.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            with self._watch_lock:
+                if self._watch is not None:
+                    self._watch.close()
+                    self._watch = None
+
+
+_manager = None
+_manager_lock = threading.Lock()
+_bound = threading.local()
+
+def get_db():
+    manager = getattr(_bound, "manager", None)
+    if manager is not None:
+        return manager
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager(DB_FILE, READER_POOL_SIZE)
+        return _manager
+
+def close_db():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+
+@contextmanager
+def bind_db(manager):
+    # Every sms_db call on this thread uses manager instead of DB_FILE's (a campus
+    # database, see sms_shards) until the block ends
+    previous = getattr(_bound, "manager", None)
+    _bound.manager = manager
+    try:
+        yield manager
+    finally:
+        _bound.manager = previous
+
+
+# ------------------------ Query Cache ------------------------
+# Read-through cache in front of the roster/search queries, one per database
+# (ConnectionManager.cache). Results are keyed on the function and its normalized
+# arguments; see sms_cache.QueryCache for invalidation.
+def cached_query(fn):
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = [fn.__name__]
+        for name, value in bound.arguments.items():
+            if name == "cancelled":
+                continue
+            if name == "text":
+                value = normalize_search(value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            key.append(value)
+        key = tuple(key)
+        cache = get_db().cache
+        hit, value, generation = cache.lookup(key)
+        metrics.annotate(cache="hit" if hit else "miss")
+        if hit:
+            return value
+        value = fn(*args, **kwargs)
+        if value is not None:     # None = cancelled, never cached
+            cache.store(key, value, generation)
+        return value
+
+    # Callers must treat returned lists as read-only: they are shared with the cache
+    wrapper.uncached = fn
+    return wrapper
+
+
+# ------------------------ Schema & Migrations ------------------------
+# The schema version lives in PRAGMA user_version. Each migration runs once, in its own
+# transaction together with the version bump, so an interrupted upgrade never leaves a
+# half-applied step behind. Files created before versioning report 0 and are upgraded in
+# place (the first steps are idempotent for that reason).
+MIGRATIONS = []
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def init_db():
+    global FTS_ENABLED
+    latest = MIGRATIONS[-1][0]
+    with get_db().writer() as conn:
+        if schema_version(conn) < latest:
+            _migrate(conn)
+
+        # Seed admin if missing
+        if not conn.execute("SELECT 1 FROM users WHERE username='admin'").fetchone():
+            conn.execute("INSERT INTO users (username, password, role) VALUES (?,?,?)",
+                         ("admin", "admin123", "admin"))
+
+        FTS_ENABLED = conn.execute("SELECT 1 FROM sqlite_master "
+                                   "WHERE name='students_fts'").fetchone() is not None
+
+def _migrate(conn):
+    for version, step in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock first, so a second instance starting at the
+        # same moment waits and then sees the bumped version instead of re-running the step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    optimize_db(conn, analyze=True)
+
+def optimize_db(conn=None, analyze=False):
+    # Refresh planner statistics after bulk changes; ANALYZE is the full (slower) version
+    sql = "ANALYZE" if analyze else "PRAGMA optimize"
+    if conn is not None:
+        conn.execute(sql)
+        return
+    with get_db().writer() as conn:
+        conn.execute(sql)
+
+
+@migration(1)
+def _create_base_tables(conn):
+    # Users table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin','staff','student'))
+        )
+    """)
+
+    # Students table (username is UNIQUE so one login links to at most one record)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS students (
+            roll_no TEXT PRIMARY KEY,
+            name TEXT,
+            email TEXT,
+            gender TEXT,
+            contact TEXT,
+            dob TEXT,
+            address TEXT,
+            username TEXT UNIQUE
+        )
+    """)
+
+
+@migration(2)
+def _create_search_index(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='students_fts'").fetchone():
+        return
+    cols = _FTS_COLS
+    new_cols = ", ".join(f"new.{c}" for c in SEARCH_FIELDS)
+    old_cols = ", ".join(f"old.{c}" for c in SEARCH_FIELDS)
+    try:
+        # External-content table: the index stores only tokens and reads rows back from
+        # students by rowid. prefix= builds extra indexes so "ab"* lookups don't scan terms.
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE students_fts USING fts5(
+                {cols}, content='students', content_rowid='rowid', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; search falls back to LIKE
+        return
+    conn.execute(f"""
+        CREATE TRIGGER students_fts_ai AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER students_fts_ad AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts(students_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER students_fts_au AFTER UPDATE ON students BEGIN
+            INSERT INTO students_fts(students_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+            INSERT INTO students_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+    """)
+    conn.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+
+@migration(3)
+def _create_query_indexes(conn):
+    # (name, roll_no) serves ORDER BY name, roll_no and the keyset seeks without a temp
+    # B-tree. contact and email get their own indexes for lookups and so LIKE filters scan
+    # a narrow covering index instead of the table. roll_no (PK) and username (UNIQUE)
+    # already have automatic indexes.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students(name, roll_no)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_contact ON students(contact)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_email ON students(email)")
+
+
+@migration(4)
+def _add_birth_date(conn):
+    # birth_date is dob when dob is a real ISO date, else NULL. A virtual generated column
+    # can't drift from dob whichever path wrote it; SQLite before 3.31 has no generated
+    # columns, so there it's a plain column kept in step by triggers.
+    expr = "CASE WHEN date(dob) = dob THEN dob END"
+    try:
+        conn.execute(f"ALTER TABLE students ADD COLUMN birth_date TEXT GENERATED ALWAYS AS ({expr}) VIRTUAL")
+    except sqlite3.OperationalError:
+        conn.execute("ALTER TABLE students ADD COLUMN birth_date TEXT")
+        for event in ("INSERT", "UPDATE OF dob"):
+            name = "students_birth_date_" + event.split()[0].lower()
+            conn.execute(f"""
+                CREATE TRIGGER {name} AFTER {event} ON students BEGIN
+                    UPDATE students SET birth_date = {expr.replace("dob", "new.dob")} WHERE rowid = new.rowid;
+                END
+            """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_birth_date ON students(birth_date)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dob_issues (
+            roll_no TEXT PRIMARY KEY,
+            dob TEXT,
+            reason TEXT
+        )
+    """)
+    normalize_dobs(conn)
+
+
+@migration(5)
+def _create_student_stats(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS student_stats (
+            stat TEXT NOT NULL,
+            value TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (stat, value)
+        ) WITHOUT ROWID
+    """)
+    for sql in _stats_trigger_sql():
+        conn.execute(sql)
+    rebuild_stats(conn)
+
+
+@migration(6)
+def _create_change_log(conn):
+    # AUTOINCREMENT: a sequence number is never reused, even after old entries are pruned,
+    # so a consumer's checkpoint always means the same point in history
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('I','U','D')),
+            key TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    for sql in _change_trigger_sql():
+        conn.execute(sql)
+
+
+@migration(7)
+def _create_campuses(conn):
+    # Multi-campus installs keep each campus's students in a file of its own (sms_shards).
+    # This database holds the logins and the list of campuses; a login with a campus
+    # only ever works in that campus's file.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campuses (
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )
+    """)
+    if not any(r[1] == "campus" for r in conn.execute("PRAGMA table_info(users)")):
+        conn.execute("ALTER TABLE users ADD COLUMN campus TEXT REFERENCES campuses(name)")
+
+
+@migration(8)
+def _create_sort_indexes(conn):
+    # One index per sortable column on the exact expression pages are ordered, seeked and
+    # filtered by (see Sorting & Filters). idx_students_name was the same for name before
+    # blank and NULL names sorted together, so it goes.
+    for column in SORT_INDEXED:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_students_sort_{column} "
+                     f"ON students({sort_expr(column)}, roll_no)")
+    conn.execute("DROP INDEX IF EXISTS idx_students_name")
+
+
+# ------------------------ Search Index ------------------------
+def _triggers(conn, names):
+    # Current DDL of the named triggers, so a bulk writer can drop and restore them verbatim
+    marks = ", ".join("?" * len(names))
+    return dict(conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type='trigger' "
+                             f"AND name IN ({marks})", names).fetchall())
+
+def _fts_triggers(conn):
+    return _triggers(conn, ("students_fts_ai", "students_fts_au"))
+
+@contextmanager
+def deferred_sync(conn, upsert_keys=None):
+    # The per-row triggers make executemany crawl: FTS5 flushes its pending index data at
+    # every statement savepoint, and each statistics bump is an upsert of its own. For a
+    # bulk write, drop the insert/update triggers inside the writer's transaction and catch
+    # up on the touched rows with one set-based statement each at the end. New rows always
+    # get rowids above the current max. For upserts, pass the batch's roll numbers: their
+    # old index entries and counts are removed up front and re-added afterwards.
+    triggers = _triggers(conn, ("students_fts_ai", "students_fts_au", "students_stats_ai", "students_stats_au",
+                                "students_log_ai", "students_log_au"))
+    fts = FTS_ENABLED and "students_fts_ai" in triggers
+    stats = "students_stats_ai" in triggers
+    log = "students_log_ai" in triggers
+    if not fts and not stats and not log:
+        yield
+        return
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    start = conn.execute("SELECT IFNULL(MAX(rowid), 0) FROM students").fetchone()[0]
+    touched = "rowid > ?"
+    if upsert_keys is not None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS sync_keys (roll_no TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.sync_keys")
+        conn.executemany("INSERT OR IGNORE INTO temp.sync_keys VALUES (?)", ((k,) for k in upsert_keys))
+        keyed = "roll_no IN (SELECT roll_no FROM temp.sync_keys)"
+        if fts:
+            conn.execute(f"INSERT INTO students_fts(students_fts, rowid, {_FTS_COLS}) "
+                         f"SELECT 'delete', rowid, {_FTS_COLS} FROM students WHERE {keyed}")
+        if stats:
+            bump_stats(conn, keyed, (), -1)
+        touched += " OR " + keyed
+    for name in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    try:
+        yield
+        if fts:
+            conn.execute(f"INSERT INTO students_fts(rowid, {_FTS_COLS}) "
+                         f"SELECT rowid, {_FTS_COLS} FROM students WHERE {touched}", (start,))
+        if stats:
+            bump_stats(conn, touched, (start,), 1)
+        if log:
+            conn.execute(f"INSERT INTO change_log (tbl, op, key) SELECT 'students', "
+                         f"CASE WHEN rowid > ? THEN 'I' ELSE 'U' END, roll_no FROM students "
+                         f"WHERE {touched} ORDER BY rowid", (start, start))
+    finally:
+        for sql in triggers.values():
+            conn.execute(sql)
+
+def search_available():
+    return FTS_ENABLED
+
+def rebuild_search_index():
+    # students has an implicit rowid, which VACUUM may renumber; rebuild after one
+    with get_db().writer() as conn:
+        conn.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+def build_fts_query(text, field=None):
+    # Every word becomes a quoted prefix term, all terms must match: "jo smi" -> "jo"* AND "smi"*
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    expr = " AND ".join(f'"{t}"*' for t in terms)
+    if field in SEARCH_FIELDS:
+        expr = f"{field} : ({expr})"
+    return expr
+
+@contextmanager
+def _interruptible(conn, cancelled):
+    # Abort the running statement as soon as cancelled() turns true
+    if cancelled is None:
+        yield
+        return
+    conn.set_progress_handler(lambda: 1 if cancelled() else 0, PROGRESS_STEPS)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+_FTS_HITS = "(SELECT rowid AS rid, rank FROM students_fts WHERE students_fts MATCH ?) AS m"
+
+@metrics.op()
+@cached_query
+def search_students(text, field=None, where="", params=(), limit=SEARCH_LIMIT, cancelled=None,
+                    ranked=False, sort=None, after=None, before=None):
+    # Full-text search; returns (rows, total), or None if cancelled mid-query. Best match
+    # first, or with sort in that order and paged by keyset as fetch_student_page does;
+    # total is counted for a first page only (None past it).
+    # ranked=True appends the FTS rank to each row, for merging results across databases.
+    match = build_fts_query(text, field)
+    if match is None:
+        return [], 0
+    hits = _FTS_HITS
+    cols = ", ".join(f"s.{c}" for c in STUDENT_COLUMNS) + (", m.rank" if ranked else "")
+    cond = f" WHERE {where}" if where else ""
+    first = after is None and before is None
+    if sort is None:
+        page, key, order = cond, [], " ORDER BY m.rank"
+    else:
+        seek, key = _page_seek(sort, after, before, "s.")
+        page = f" WHERE ({where}) AND ({seek})" if where and seek else f" WHERE {seek}" if seek else cond
+        order = _order_by(sort, backwards=after is None and before is not None, alias="s.")
+    with get_db().reader() as conn, _interruptible(conn, cancelled):
+        try:
+            rows = conn.execute(f"SELECT {cols} FROM {hits} JOIN students AS s ON s.rowid = m.rid"
+                                f"{page}{order} LIMIT ?", (match, *params, *key, limit)).fetchall()
+            if not first:
+                total = None
+            elif len(rows) < limit:
+                total = len(rows)
+            else:
+                total = conn.execute(f"SELECT COUNT(*) FROM {hits} JOIN students AS s ON s.rowid = m.rid"
+                                     f"{cond}", (match, *params)).fetchone()[0]
+        except sqlite3.OperationalError:
+            if cancelled is not None and cancelled():
+                return None
+            raise
+    if sort is not None and after is None and before is not None:
+        rows.reverse()
+    return rows, total
+
+
+# ------------------------ Users ------------------------
+ROLES = ("admin", "staff", "student")
+# What each role may do besides reading its view; students only ever see their own record.
+# export: delta exports, report: data-quality reports, maintain: rebuild counters and
+# prune the change log, users: logins and campuses
+ROLE_ACTIONS = {"admin": {"write", "import", "export", "report", "stats", "maintain", "users", "dedup",
+                          "backup"},
+                "staff": {"write", "import", "export", "report", "stats"}, "student": set()}
+
+def role_allows(role, action):
+    return action in ROLE_ACTIONS.get(role, ())
+
+def role_filter(role, username):
+    # (where, params) limiting what a login can read
+    if role == "student":
+        return "username=?", (username,)
+    return "", ()
+
+@metrics.op()
+def authenticate(username, password):
+    # Role of the matching login, or None
+    with get_db().reader() as conn:
+        row = conn.execute("SELECT role FROM users WHERE username=? AND password=?",
+                           (username, password)).fetchone()
+    return row[0] if row else None
+
+def _check_role(role):
+    if role not in ROLES:
+        raise ValueError(f"Unknown role: {role}")
+
+@metrics.op()
+def db_add_user(username, password, role):
+    # Raises sqlite3.IntegrityError if the username is taken
+    with get_db().writer(touches=("users",)) as conn:
+        _apply_write(conn, "add_user", (username, password, role))
+
+@metrics.op()
+def db_update_user(username, password=None, role=None):
+    # Returns False if there is no such user
+    if role is not None:
+        _check_role(role)
+    with get_db().writer(touches=("users",)) as conn:
+        cur = conn.execute("UPDATE users SET password=COALESCE(?, password), role=COALESCE(?, role) "
+                           "WHERE username=?", (password, role, username))
+    return cur.rowcount > 0
+
+@metrics.op()
+def db_delete_user(username):
+    with get_db().writer(touches=("users",)) as conn:
+        cur = conn.execute("DELETE FROM users WHERE username=?", (username,))
+    return cur.rowcount > 0
+
+@metrics.op()
+def list_users():
+    with get_db().reader() as conn:
+        return conn.execute("SELECT username, role FROM users ORDER BY username").fetchall()
+
+
+# ------------------------ Campuses ------------------------
+def list_campuses():
+    # -> [(name, path)], paths relative to this database's folder unless stored absolute
+    with get_db().reader() as conn:
+        return conn.execute("SELECT name, path FROM campuses ORDER BY name").fetchall()
+
+def campus_file(path):
+    return os.path.join(os.path.dirname(os.path.abspath(get_db().path)), path)
+
+@metrics.op()
+def db_add_campus(name, path):
+    with get_db().writer(touches=("campuses",)) as conn:
+        conn.execute("INSERT INTO campuses (name, path) VALUES (?, ?)", (name, path))
+
+@metrics.op()
+def user_campus(username):
+    # The campus a login is limited to, or None (all campuses)
+    with get_db().reader() as conn:
+        row = conn.execute("SELECT campus FROM users WHERE username=?", (username,)).fetchone()
+    return row[0] if row else None
+
+@metrics.op()
+def db_set_user_campus(username, campus):
+    # campus=None lifts the limit; False if there is no such user
+    with get_db().writer(touches=("users",)) as conn:
+        if campus is not None and not conn.execute("SELECT 1 FROM campuses WHERE name=?", (campus,)).fetchone():
+            raise ValueError(f"Unknown campus {campus}")
+        cur = conn.execute("UPDATE users SET campus=? WHERE username=?", (campus, username))
+    return cur.rowcount > 0
+
+
+# ------------------------ Dates of Birth ------------------------
+@functools.lru_cache(maxsize=65536)
+def _read_date(text):
+    # strptime is slow and a roster repeats the same few thousand dates; parse each once
+    if len(text) == 10 and text[4] == "-":
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            pass
+    for fmt in DOB_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def parse_dob(text, today=None):
+    # Any DOB_FORMATS spelling -> ISO date; "" stays "" (D.O.B is optional)
+    text = (text or "").strip()
+    if not text:
+        return ""
+    d = _read_date(text)
+    if d is None:
+        raise ValueError(f"D.O.B '{text}' is not a date (use YYYY-MM-DD or DD/MM/YYYY)")
+    if d > (today or date.today()):
+        raise ValueError(f"D.O.B '{text}' is in the future")
+    if d.year < MIN_BIRTH_YEAR:
+        raise ValueError(f"D.O.B '{text}' is before {MIN_BIRTH_YEAR}")
+    return d.isoformat()
+
+def link_username(text):
+    # The login a student row links to. Blank is stored as NULL, not '': UNIQUE lets any
+    # number of rows hold NULL, so unlinked students never collide.
+    return (text or "").strip() or None
+
+def normalize_row(row):
+    # A student row as stored: D.O.B validated and rewritten as ISO
+    row = tuple(row)
+    return row[:5] + (parse_dob(row[5]),) + row[6:]
+
+def _years_before(d, years):
+    try:
+        return d.replace(year=d.year - years)
+    except ValueError:        # 29 Feb in a non-leap year
+        return d.replace(year=d.year - years, day=28)
+
+def birth_filter(born_from="", born_to="", min_age="", max_age="", today=None):
+    """(where, params) for a birth-date window and/or an age range, as bounds on the
+    indexed birth_date column so the filter is an index range scan. Blank = no bound."""
+    today = today or date.today()
+    low, high = [], []
+    if born_from:
+        low.append(parse_dob(born_from, today))
+    if born_to:
+        high.append(parse_dob(born_to, today))
+    for text, bounds in ((min_age, high), (max_age, low)):
+        if text == "" or text is None:
+            continue
+        try:
+            age = int(text)
+        except ValueError:
+            raise ValueError(f"Age '{text}' is not a whole number") from None
+        if not 0 <= age <= 150:
+            raise ValueError(f"Age {age} is out of range")
+        if bounds is high:
+            # min_age N: had their Nth birthday by today
+            high.append(_years_before(today, age).isoformat())
+        else:
+            # max_age N: not yet N+1, so born after today minus N+1 years
+            low.append(date.fromordinal(_years_before(today, age + 1).toordinal() + 1).isoformat())
+    clauses, params = [], []
+    if low:
+        clauses.append("birth_date >= ?")
+        params.append(max(low))
+    if high:
+        clauses.append("birth_date <= ?")
+        params.append(min(high))
+    return " AND ".join(clauses), tuple(params)
+
+def normalize_dobs(conn, batch=DOB_BATCH):
+    """Rewrite stored D.O.B values as ISO dates and list the ones that can't be read in
+    dob_issues. Runs inside the caller's transaction; -> (rows rewritten, rows reported)."""
+    # dob isn't in the search index, so the FTS update trigger would only re-index
+    # identical text for every row; take it out for the duration
+    triggers = _fts_triggers(conn)
+    for name in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    try:
+        conn.execute("DELETE FROM dob_issues")
+        fixed = reported = 0
+        last = 0
+        while True:
+            # Rows whose birth_date is already set are clean ISO; only the rest are read
+            rows = conn.execute("SELECT rowid, roll_no, dob FROM students "
+                                "WHERE rowid > ? AND birth_date IS NULL AND dob <> '' "
+                                "ORDER BY rowid LIMIT ?", (last, batch)).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            updates, issues = [], []
+            for rowid, roll_no, dob in rows:
+                try:
+                    iso = parse_dob(dob)
+                except ValueError as e:
+                    issues.append((roll_no, dob, str(e)))
+                    continue
+                if iso != dob:
+                    updates.append((iso, rowid))
+            conn.executemany("UPDATE students SET dob=? WHERE rowid=?", updates)
+            conn.executemany("INSERT OR REPLACE INTO dob_issues (roll_no, dob, reason) VALUES (?,?,?)", issues)
+            fixed += len(updates)
+            reported += len(issues)
+    finally:
+        for sql in triggers.values():
+            conn.execute(sql)
+    return fixed, reported
+
+@metrics.op()
+def db_normalize_dobs():
+    with get_db().writer(touches=("students",)) as conn:
+        return normalize_dobs(conn)
+
+def dob_issues():
+    with get_db().reader() as conn:
+        return conn.execute("SELECT roll_no, dob, reason FROM dob_issues ORDER BY roll_no").fetchall()
+
+
+# ------------------------ Roster Statistics ------------------------
+# student_stats holds one counter per (stat, value): the roster total, students per
+# gender and per birth year, missing emails/contacts and records with no linked login.
+# Triggers move the counters on every insert, delete and relevant update, so reading
+# the whole dashboard is one scan of a table of a few dozen rows.
+
+def _stat_rows(r):
+    # The (stat, value) counters one students row (new/old) contributes to
+    return f"""
+        SELECT 'total' AS stat, '' AS value
+        UNION ALL SELECT 'gender', IFNULL({r}.gender, '')
+        UNION ALL SELECT 'birth_year', IFNULL(CASE WHEN date({r}.dob) = {r}.dob THEN substr({r}.dob, 1, 4) END, '')
+        UNION ALL SELECT 'missing', 'email' WHERE IFNULL({r}.email, '') = ''
+        UNION ALL SELECT 'missing', 'contact' WHERE IFNULL({r}.contact, '') = ''
+        UNION ALL SELECT 'unlinked', '' WHERE {r}.username IS NULL
+    """
+
+def _stats_trigger_sql():
+    def bump(r, delta):
+        # WHERE true: an INSERT ... SELECT needs it before ON CONFLICT to parse
+        return (f"INSERT INTO student_stats (stat, value, n) SELECT stat, value, {delta} "
+                f"FROM ({_stat_rows(r)}) WHERE true "
+                f"ON CONFLICT(stat, value) DO UPDATE SET n = n + excluded.n;")
+    return (
+        f"CREATE TRIGGER students_stats_ai AFTER INSERT ON students BEGIN {bump('new', 1)} END",
+        f"CREATE TRIGGER students_stats_ad AFTER DELETE ON students BEGIN {bump('old', -1)} END",
+        f"CREATE TRIGGER students_stats_au AFTER UPDATE OF gender, email, contact, dob, username "
+        f"ON students BEGIN {bump('old', -1)} {bump('new', 1)} END",
+    )
+
+def _stats_counts(where="1"):
+    # The counters recomputed over the students rows matching where. The CTE is used more
+    # than once, so SQLite reads the matching rows a single time into a temp table.
+    return f"""
+        WITH r AS (SELECT gender, birth_date, email, contact, username FROM students WHERE {where})
+        SELECT 'total' AS stat, '' AS value, COUNT(*) AS n FROM r
+        UNION ALL SELECT 'gender', IFNULL(gender, ''), COUNT(*) FROM r GROUP BY 2
+        UNION ALL SELECT 'birth_year', IFNULL(substr(birth_date, 1, 4), ''), COUNT(*) FROM r GROUP BY 2
+        UNION ALL SELECT 'missing', 'email', COUNT(*) FROM r WHERE IFNULL(email, '') = ''
+        UNION ALL SELECT 'missing', 'contact', COUNT(*) FROM r WHERE IFNULL(contact, '') = ''
+        UNION ALL SELECT 'unlinked', '', COUNT(*) FROM r WHERE username IS NULL
+    """
+
+def bump_stats(conn, where, params, sign):
+    # Add (sign=1) or remove (sign=-1) a subset of rows' contribution to the counters
+    conn.execute(f"INSERT INTO student_stats (stat, value, n) SELECT stat, value, {int(sign)} * n "
+                 f"FROM ({_stats_counts(where)}) WHERE n > 0 "
+                 f"ON CONFLICT(stat, value) DO UPDATE SET n = n + excluded.n", params)
+
+def rebuild_stats(conn):
+    # Recount everything from students (the birth years come off the birth_date index);
+    # runs inside the caller's transaction
+    conn.execute("DELETE FROM student_stats")
+    conn.execute(f"INSERT INTO student_stats (stat, value, n) SELECT stat, value, n FROM ({_stats_counts()})")
+
+@metrics.op()
+def db_rebuild_stats():
+    with get_db().writer(touches=("student_stats",)) as conn:
+        rebuild_stats(conn)
+
+@metrics.op()
+def roster_stats():
+    # {stat: {value: count}} straight from the counters
+    with get_db().reader() as conn:
+        rows = conn.execute("SELECT stat, value, n FROM student_stats WHERE n <> 0").fetchall()
+    stats = {}
+    for stat, value, n in rows:
+        stats.setdefault(stat, {})[value] = n
+    return stats
+
+def age_bands(birth_years, year=None):
+    # {birth year: count} -> [(band label, count)] by the age reached this year
+    year = year or date.today().year
+    counts = dict.fromkeys([label for _, _, label in AGE_BANDS] + ["Unknown"], 0)
+    for born, n in birth_years.items():
+        if not born:
+            counts["Unknown"] += n
+            continue
+        age = year - int(born)
+        for low, high, label in AGE_BANDS:
+            if (low is None or age >= low) and (high is None or age <= high):
+                counts[label] += n
+                break
+    return list(counts.items())
+
+
+# ------------------------ Change Log ------------------------
+# Triggers append (seq, tbl, op, key) for every insert, real update and delete of students
+# and users. Only the key is logged: a delta export joins the latest entry per key back
+# to the table, so it carries current values and a row changed ten times is sent once.
+
+def _change_trigger_sql():
+    out = []
+    for table, (key, columns) in CHANGE_TABLES.items():
+        changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+        log = f"INSERT INTO change_log (tbl, op, key) VALUES ('{table}', '{{op}}', {{row}}.{key});"
+        out += [
+            f"CREATE TRIGGER {table}_log_ai AFTER INSERT ON {table} BEGIN "
+            f"{log.format(op='I', row='new')} END",
+            f"CREATE TRIGGER {table}_log_ad AFTER DELETE ON {table} BEGIN "
+            f"{log.format(op='D', row='old')} END",
+            # Saving a form unchanged (or a password change) isn't news downstream
+            f"CREATE TRIGGER {table}_log_au AFTER UPDATE ON {table} WHEN {changed} BEGIN "
+            f"INSERT INTO change_log (tbl, op, key) SELECT '{table}', 'D', old.{key} WHERE old.{key} IS NOT new.{key}; "
+            f"{log.format(op='U', row='new')} END",
+        ]
+    return out
+
+def _change_log_head(conn):
+    # Newest sequence number ever issued (from sqlite_sequence, so pruning never moves it back)
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+    return row[0] if row else 0
+
+def change_log_head():
+    # The checkpoint to hand out for an export taken up to now
+    with get_db().reader() as conn:
+        return _change_log_head(conn)
+
+def change_log_horizon(conn):
+    # Entries up to this seq were pruned; a checkpoint below it can't be caught up from the log
+    row = conn.execute("SELECT value FROM change_log_state WHERE name='pruned_through'").fetchone()
+    return row[0] if row else 0
+
+def iter_changes(table, since=None, until=None, batch=STREAM_BATCH):
+    """Batches of (seq, "upsert"|"delete", key, *columns) for rows of table changed
+    after checkpoint since, up to checkpoint until (default: now), in sequence order.
+    since=None is a full snapshot: every current row as an upsert. Deleted rows carry
+    only the key. Rows hold current values, so a change made after until may show up
+    early; it is sent again next time, and applying an upsert twice is harmless."""
+    if table not in CHANGE_TABLES:
+        raise ValueError(f"Unknown table {table}")
+    key, columns = CHANGE_TABLES[table]
+    select = ", ".join(f"t.{c}" for c in columns)
+    # Resolve the range and check the checkpoint now, not on the first batch, so a caller
+    # gets the error before it has written anything
+    with get_db().reader() as conn:
+        if until is None:
+            until = _change_log_head(conn)
+        if since is None:
+            sql = f"SELECT ?, 'upsert', t.{key}, {select} FROM {table} AS t ORDER BY t.{key}"
+            args = (until,)
+        else:
+            horizon = change_log_horizon(conn)
+            if since < horizon:
+                raise ValueError(f"Checkpoint {since} is older than the change log (pruned through "
+                                 f"{horizon}); start again from a full export")
+            sql = (f"SELECT c.seq, CASE WHEN t.{key} IS NULL THEN 'delete' ELSE 'upsert' END, c.key, {select} "
+                   f"FROM (SELECT key, MAX(seq) AS seq FROM change_log WHERE tbl = ? AND seq > ? AND seq <= ? "
+                   f"GROUP BY key) AS c LEFT JOIN {table} AS t ON t.{key} = c.key ORDER BY c.seq")
+            args = (table, since, until)
+    return _iter_query(sql, args, batch)
+
+def _iter_query(sql, args, batch):
+    with get_db().reader() as conn:
+        cur = conn.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield rows
+
+def compact_change_log(conn):
+    # Only the newest entry per key matters to an export; drop the ones it supersedes
+    return conn.execute("DELETE FROM change_log WHERE seq NOT IN "
+                        "(SELECT MAX(seq) FROM change_log GROUP BY tbl, key)").rowcount
+
+def prune_change_log(conn, days):
+    # Drop entries older than days and remember the horizon; returns entries removed
+    cutoff = conn.execute("SELECT MAX(seq) FROM change_log WHERE ts < strftime('%Y-%m-%d %H:%M:%f', 'now', ?)",
+                          (f"-{float(days)} days",)).fetchone()[0]
+    if cutoff is None:
+        return 0
+    removed = conn.execute("DELETE FROM change_log WHERE seq <= ?", (cutoff,)).rowcount
+    conn.execute("INSERT INTO change_log_state (name, value) VALUES ('pruned_through', ?) "
+                 "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)", (cutoff,))
+    return removed
+
+@metrics.op()
+def db_maintain_change_log(retain_days=CHANGE_LOG_RETENTION_DAYS, compact=True):
+    # Retention then compaction in one transaction -> (pruned, compacted)
+    with get_db().writer(touches=("change_log",)) as conn:
+        pruned = prune_change_log(conn, retain_days) if retain_days is not None else 0
+        compacted = compact_change_log(conn) if compact else 0
+    return pruned, compacted
+
+
+# ------------------------ Student Writes ------------------------
+def student_keys(roll_nos=(), usernames=()):
+    # -> ({roll_no}, {username: roll_no}) for the given keys that a student here already holds
+    found = ({}, {})
+    with get_db().reader() as conn:
+        for column, keys, into in (("roll_no", roll_nos, found[0]), ("username", usernames, found[1])):
+            keys = list(dict.fromkeys(k for k in keys if k))
+            for i in range(0, len(keys), KEY_CHUNK):
+                chunk = keys[i:i + KEY_CHUNK]
+                into.update(conn.execute(f"SELECT {column}, roll_no FROM students "
+                                         f"WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk))
+    return set(found[0]), found[1]
+
+def _apply_write(conn, kind, payload):
+    # One write of a kind that can be queued/batched (see db_apply_writes)
+    if kind == "insert":
+        # payload is a row tuple in STUDENT_COLUMNS order
+        conn.execute(f"INSERT INTO students ({', '.join(STUDENT_COLUMNS)}) VALUES (?,?,?,?,?,?,?,?)",
+                     normalize_row(payload))
+    elif kind == "update":
+        try:
+            payload = normalize_row(payload)
+        except ValueError:
+            # An unreadable D.O.B already stored (see dob_issues) may stay while other
+            # fields are edited; only a new value has to be a date
+            stored = conn.execute("SELECT dob FROM students WHERE roll_no=?", (payload[0],)).fetchone()
+            if stored is None or stored[0] != payload[5]:
+                raise
+            payload = tuple(payload)
+        conn.execute("""
+            UPDATE students SET
+                name=?, email=?, gender=?, contact=?, dob=?, address=?, username=?
+            WHERE roll_no=?
+        """, (*payload[1:], payload[0]))
+    elif kind == "delete":
+        conn.execute("DELETE FROM students WHERE roll_no=?", (payload,))
+    elif kind == "add_user":
+        _check_role(payload[2])
+        conn.execute("INSERT INTO users (username, password, role) VALUES (?,?,?)", payload)
+    else:
+        raise ValueError(f"Unknown write: {kind}")
+
+@metrics.op()
+def db_insert_student(row):
+    with get_db().writer() as conn:
+        _apply_write(conn, "insert", row)
+
+@metrics.op()
+def db_update_student(row):
+    with get_db().writer() as conn:
+        _apply_write(conn, "update", row)
+
+@metrics.op()
+def db_delete_student(roll_no):
+    with get_db().writer() as conn:
+        _apply_write(conn, "delete", roll_no)
+
+@metrics.op()
+def db_delete_students(roll_nos):
+    # Many deletes in one transaction; returns how many rows were removed
+    with get_db().writer() as conn:
+        cur = conn.executemany("DELETE FROM students WHERE roll_no=?", [(r,) for r in roll_nos])
+    return cur.rowcount
+
+@metrics.op()
+def db_merge_students(keep, drop):
+    """Fold student `drop` into `keep`: keep's blank fields take drop's values (its login
+    link included), then drop is deleted. One transaction; returns the merged row."""
+    with get_db().writer() as conn:
+        rows = {r[0]: r for r in conn.execute(STUDENT_SELECT + " WHERE roll_no IN (?, ?)", (keep, drop))}
+        if keep == drop or keep not in rows or drop not in rows:
+            raise ValueError(f"Can't merge {drop} into {keep}: both must be existing, different students")
+        merged = tuple(a if a not in ("", None) else b for a, b in zip(rows[keep], rows[drop]))
+        # Delete first: username is UNIQUE, so drop must let go of a link keep inherits
+        _apply_write(conn, "delete", drop)
+        _apply_write(conn, "update", merged)
+        return merged
+
+@metrics.op()
+def db_apply_writes(ops):
+    """Apply [(kind, payload), ...] in one transaction: one commit for the whole group.
+
+    Each write runs under its own savepoint, so one that fails (a duplicate roll number,
+    say) is undone alone. Returns one entry per write: None, or the exception it raised.
+    """
+    results = []
+    with get_db().writer() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        for kind, payload in ops:
+            conn.execute("SAVEPOINT w")
+            try:
+                _apply_write(conn, kind, payload)
+                results.append(None)
+            except (sqlite3.Error, ValueError) as e:
+                conn.execute("ROLLBACK TO w")
+                results.append(e)
+            conn.execute("RELEASE w")
+    return results
+
+
+# ------------------------ Sorting & Filters ------------------------
+# Any column can order the roster: sort=(column, descending), default name A-Z. Blank and
+# NULL sort together as '' and roll_no breaks ties, so every row has one keyset position.
+# Each column in SORT_INDEXED has an index on exactly that expression (migration 8): pages
+# come off it in order, a keyset seek is one lookup, and filters on the column use it too.
+DEFAULT_SORT = ("name", False)
+# address is long free text; sorting by it sorts the matching rows per page instead
+SORT_INDEXED = ("name", "email", "gender", "contact", "dob", "username")
+# Filter operators -> labels (see build_filter)
+FILTER_OPS = {"equals": "equals", "prefix": "starts with", "range": "between",
+              "empty": "is empty", "not_empty": "is not empty"}
+# The highest code point: "abc" + this sorts after every string starting with "abc"
+_PREFIX_END = "\U0010ffff"
+
+def sort_expr(column, alias=""):
+    if column not in STUDENT_COLUMNS:
+        raise ValueError(f"Unknown column: {column}")
+    return f"{alias}roll_no" if column == "roll_no" else f"IFNULL({alias}{column}, '')"
+
+def _sort_spec(sort):
+    column, descending = sort or DEFAULT_SORT
+    sort_expr(column)
+    return column, bool(descending)
+
+def sort_key(sort=None):
+    # Keyset position of a row (STUDENT_COLUMNS order) as the queries order it, ascending
+    i = STUDENT_COLUMNS.index(_sort_spec(sort)[0])
+    return lambda row: (row[i] if row[i] is not None else "", row[0])
+
+def _keyset(sort, op, key, alias=""):
+    # (clause, args) for the rows on one side of a keyset position
+    column, _ = _sort_spec(sort)
+    if column == "roll_no":
+        return f"{alias}roll_no {op} ?", [key[1]]
+    # The bare bound is what lets SQLite seek the index; it can't with a row value of
+    # expressions alone, and would scan up to the position instead
+    expr = sort_expr(column, alias)
+    return f"{expr} {op[0]}= ? AND ({expr}, {alias}roll_no) {op} (?, ?)", [key[0], *key]
+
+def _order_by(sort, backwards=False, alias=""):
+    column, descending = _sort_spec(sort)
+    way = "DESC" if descending != backwards else "ASC"
+    if column == "roll_no":
+        return f" ORDER BY {alias}roll_no {way}"
+    return f" ORDER BY {sort_expr(column, alias)} {way}, {alias}roll_no {way}"
+
+def _page_seek(sort, after, before, alias=""):
+    # (clause, args) for the page past after (or before) a keyset position; ("", []) for neither
+    _, descending = _sort_spec(sort)
+    if after is not None:
+        return _keyset(sort, "<" if descending else ">", after, alias)
+    if before is not None:
+        return _keyset(sort, ">" if descending else "<", before, alias)
+    return "", []
+
+def _filter_date(text):
+    d = _read_date(text)
+    if d is None:
+        raise ValueError(f"D.O.B '{text}' is not a date (use YYYY-MM-DD or DD/MM/YYYY)")
+    return d.isoformat()
+
+def build_filter(predicates):
+    """[(column, op, value), ...] -> (where, params) matching rows where all of them hold.
+
+    op is a FILTER_OPS key; a range's value is (low, high), inclusive, either end blank.
+    Every predicate compares the column's sort expression, so the column's index serves
+    equals, prefix and range alike. Blank and NULL are both "empty".
+    """
+    clauses, params = [], []
+    for column, op, value in predicates:
+        expr = sort_expr(column)
+        label = STUDENT_LABELS[column]
+        if op in ("empty", "not_empty"):
+            bounds = [("=" if op == "empty" else "<>", "")]
+        elif op == "range":
+            low, high = ((v or "").strip() for v in value)
+            if not low and not high:
+                raise ValueError(f"{label}: give at least one end of the range")
+            if column == "dob":
+                low, high = (_filter_date(v) if v else "" for v in (low, high))
+            bounds = [(o, v) for o, v in ((">=", low), ("<=", high)) if v]
+        elif op in ("equals", "prefix"):
+            text = (value or "").strip()
+            if not text:
+                raise ValueError(f"{label}: enter a value (or use '{FILTER_OPS['empty']}')")
+            if op == "equals":
+                bounds = [("=", _filter_date(text) if column == "dob" else text)]
+            else:
+                bounds = [(">=", text), ("<", text + _PREFIX_END)]
+        else:
+            raise ValueError(f"Unknown filter: {op}")
+        for o, v in bounds:
+            clauses.append(f"{expr} {o} ?")
+            params.append(v)
+    return " AND ".join(clauses), tuple(params)
+
+def filter_clauses():
+    # Every clause build_filter can produce (what sms_server accepts from clients)
+    return {f"{sort_expr(c)} {o} ?" for c in STUDENT_COLUMNS for o in ("=", "<>", ">=", "<", "<=")}
+
+
+# ------------------------ Paged Queries ------------------------
+@metrics.op()
+@cached_query
+def count_students(where="", params=()):
+    with get_db().reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM students" + (f" WHERE {where}" if where else ""),
+                            params).fetchone()[0]
+
+@metrics.op()
+@cached_query
+def fetch_student_page(where="", params=(), after=None, before=None, limit=PAGE_SIZE, sort=None):
+    # Keyset pagination on (sort value, roll_no) (see sort_key): seek past the last (or
+    # before the first) key we hold instead of OFFSET, so every page costs the same no
+    # matter how deep we are.
+    clauses = [where] if where else []
+    args = list(params)
+    clause, key = _page_seek(sort, after, before)
+    if clause:
+        clauses.append(clause)
+        args += key
+    sql = STUDENT_SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(f"({cl})" for cl in clauses)
+    sql += _order_by(sort, backwards=after is None and before is not None) + " LIMIT ?"
+    args.append(limit)
+
+    with get_db().reader() as conn:
+        rows = conn.execute(sql, args).fetchall()
+    if after is None and before is not None:
+        rows.reverse()
+    return rows
+
+@metrics.op()
+@cached_query
+def fetch_student(roll_no, where="", params=()):
+    # Point lookup; None if the row is gone or no longer matches the view's filter
+    sql = STUDENT_SELECT + " WHERE roll_no=?" + (f" AND ({where})" if where else "")
+    with get_db().reader() as conn:
+        return conn.execute(sql, (roll_no, *params)).fetchone()
+
+@metrics.op()
+def fetch_student_range(where="", params=(), low=None, high=None, limit=PAGE_SIZE * MAX_LOADED_PAGES,
+                        sort=None):
+    # Every row from keyset position low through high in the sort's order, inclusive;
+    # None = open end
+    _, descending = _sort_spec(sort)
+    clauses = [where] if where else []
+    args = list(params)
+    for key, op in ((low, "<=" if descending else ">="), (high, ">=" if descending else "<=")):
+        if key is not None:
+            clause, key = _keyset(sort, op, key)
+            clauses.append(clause)
+            args += key
+    sql = STUDENT_SELECT
+    if clauses:
+        sql += " WHERE " + " AND ".join(f"({cl})" for cl in clauses)
+    sql += _order_by(sort) + " LIMIT ?"
+    args.append(limit)
+    with get_db().reader() as conn:
+        return conn.execute(sql, args).fetchall()
+
+
+# ------------------------ View Streaming ------------------------
+# A "view" is what the table shows: a filter (where, params) plus, for searches, the
+# (text, field) of the full-text query. These run it to completion rather than a page.
+
+def _view_sql(where, params, search, select):
+    cond = f" WHERE {where}" if where else ""
+    if search:
+        match = build_fts_query(*search)
+        if match is None:
+            return None, ()
+        return (f"SELECT {select} FROM {_FTS_HITS} JOIN students AS s ON s.rowid = m.rid{cond}",
+                (match, *params))
+    return f"SELECT {select} FROM students AS s{cond}", tuple(params)
+
+@metrics.op()
+@cached_query
+def count_view(where="", params=(), search=None):
+    sql, args = _view_sql(where, params, search, "COUNT(*)")
+    if sql is None:
+        return 0
+    with get_db().reader() as conn:
+        return conn.execute(sql, args).fetchone()[0]
+
+def iter_view(where="", params=(), search=None, columns=STUDENT_COLUMNS, batch=STREAM_BATCH,
+              cancelled=None, ranked=False, sort=None):
+    # Yields lists of rows straight off one cursor; memory stays at one batch.
+    # ranked=True appends the FTS rank to each row of a search. Rows come in sort order
+    # (see Sorting & Filters), or for a search with no sort given, best match first.
+    bad = [c for c in columns if c not in STUDENT_COLUMNS]
+    if bad or not columns:
+        raise ValueError(f"Unknown columns: {bad}")
+    select = ", ".join(f"s.{c}" for c in columns) + (", m.rank" if search and ranked else "")
+    sql, args = _view_sql(where, params, search, select)
+    if sql is None:
+        return
+    sql += " ORDER BY m.rank" if search and sort is None else _order_by(sort, alias="s.")
+    with get_db().reader() as conn, _interruptible(conn, cancelled):
+        try:
+            cur = conn.execute(sql, args)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+        except sqlite3.OperationalError:
+            if cancelled is not None and cancelled():
+                return
+            raise
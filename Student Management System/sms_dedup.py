@@ -0,0 +1,242 @@
+import functools
+import gc
+import re
+import sqlite3
+import time
+
+from sms_tasks import spawn_context
+
+# Pairs scoring at least this (0..1) are suggested; at most this many, best first
+DEFAULT_THRESHOLD = 0.85
+MAX_SUGGESTIONS = 1000
+# A block bigger than this is a shared placeholder (e.g. contact "0000000"), not one person
+MAX_BLOCK = 50
+# How often a waiting caller checks its cancel flag (seconds)
+POLL_SECONDS = 0.1
+
+# Field weights in the score; a field blank on either side doesn't count either way
+WEIGHTS = {"name": 0.4, "dob": 0.2, "contact": 0.2, "email": 0.2}
+# Name similarity (Jaro-Winkler per token) below this counts as a different name; above it
+# the scale is stretched so near-identical spellings score close to 1
+NAME_FLOOR = 0.75
+# Different recorded genders make a match less likely, not impossible (data-entry slips)
+GENDER_MISMATCH = 0.9
+# Digits of a contact number compared, from the right (drops +92 / 0 trunk prefixes)
+CONTACT_DIGITS = 9
+
+_SOUNDEX = {c: str(d) for d, letters in enumerate(("aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r"))
+            for c in letters}
+_NOT_LETTERS = re.compile(r"[^a-z ]+")
+_NOT_DIGITS = re.compile(r"\D+")
+
+
+# ------------------------ Normalization ------------------------
+def soundex(word):
+    # American Soundex: first letter + three digits for the consonant sounds that follow
+    word = word.lower()
+    if not word:
+        return ""
+    out = word[0].upper()
+    last = _SOUNDEX.get(word[0], "")
+    for c in word[1:]:
+        code = _SOUNDEX.get(c, "")
+        if code and code != "0" and code != last:
+            out += code
+            if len(out) == 4:
+                break
+        if c not in "hw":
+            last = code
+    return out.ljust(4, "0")
+
+
+def name_tokens(name):
+    # Lowercase letters only, tokens sorted so "Khan Ahmed" == "Ahmed Khan"
+    return tuple(sorted(_NOT_LETTERS.sub("", (name or "").lower().replace("-", " ")).split()))
+
+
+# A roster repeats the same few thousand names; each is tokenized and encoded once
+@functools.lru_cache(maxsize=65536)
+def name_keys(name):
+    # -> (tokens, phonetic key)
+    tokens = name_tokens(name)
+    return tokens, " ".join(sorted(soundex(t) for t in tokens))
+
+
+def contact_key(contact):
+    digits = _NOT_DIGITS.sub("", contact or "")
+    return digits[-CONTACT_DIGITS:] if len(digits) >= 7 else ""
+
+
+def jaro_winkler(a, b):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    a_hit = [False] * len(a)
+    b_hit = [False] * len(b)
+    matches = 0
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not b_hit[j] and b[j] == ch:
+                a_hit[i] = b_hit[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    b_matched = [ch for ch, hit in zip(b, b_hit) if hit]
+    transpositions = sum(x != y for x, y in zip((ch for ch, hit in zip(a, a_hit) if hit), b_matched)) / 2
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def name_similarity(a, b):
+    # Each token of the shorter name against its best match in the other, averaged, so a
+    # shared surname alone ("Ali Khan" / "Omar Khan") doesn't pass for the same person
+    if len(a) > len(b):
+        a, b = b, a
+    sim = sum(max(jaro_winkler(x, y) for y in b) for x in a) / len(a)
+    return max(0.0, (sim - NAME_FLOOR) / (1 - NAME_FLOOR))
+
+
+# ------------------------ Matching ------------------------
+class Candidate:
+    __slots__ = ("row", "name", "phonetic", "dob", "contact", "email", "gender")
+
+    def __init__(self, row):
+        roll_no, name, email, gender, contact, dob = row
+        self.row = row
+        self.name, self.phonetic = name_keys(name)
+        self.dob = dob or ""
+        self.contact = contact_key(contact)
+        self.email = (email or "").strip().lower()
+        self.gender = (gender or "").lower()
+
+    def blocking_keys(self):
+        # Only rows sharing a key are ever compared. Name alone would put every "Ali Khan"
+        # in one block, so the phonetic name is paired with the date of birth.
+        if self.phonetic and self.dob:
+            yield ("name_dob", self.phonetic, self.dob)
+        if self.contact:
+            yield ("contact", self.contact)
+        if self.email:
+            yield ("email", self.email)
+
+
+def score(a, b):
+    # -> (0..1, fields that agree)
+    total = weight = 0.0
+    agree = []
+    for field, w in WEIGHTS.items():
+        x, y = getattr(a, field), getattr(b, field)
+        if not x or not y:
+            continue
+        sim = name_similarity(x, y) if field == "name" else float(x == y)
+        total += w * sim
+        weight += w
+        if sim >= 0.9:
+            agree.append(field)
+    if weight < WEIGHTS["name"] + 0.2:
+        return 0.0, agree      # a name plus one more field at least, or it's a guess
+    result = total / weight
+    if a.gender and b.gender and a.gender != b.gender:
+        result *= GENDER_MISMATCH
+    return result, agree
+
+
+class DedupReport:
+    __slots__ = ("rows", "blocks", "oversized", "comparisons", "suggestions", "seconds")
+
+    def __init__(self):
+        self.rows = 0
+        self.blocks = 0
+        self.oversized = 0
+        self.comparisons = 0
+        self.suggestions = []   # (score, row_a, row_b, agreeing fields), best first
+        self.seconds = 0.0
+
+    def summary(self):
+        return (f"Scanned {self.rows} students in {self.seconds:.1f}s: {self.comparisons} comparisons "
+                f"in {self.blocks} blocks ({self.oversized} oversized blocks skipped), "
+                f"{len(self.suggestions)} possible duplicates")
+
+
+def find_duplicates(db_path, threshold=DEFAULT_THRESHOLD, max_block=MAX_BLOCK, limit=MAX_SUGGESTIONS):
+    """Suggest pairs of students that are probably the same person.
+
+    Every row gets blocking keys (phonetic name + D.O.B, contact digits, lowercased email)
+    and only rows sharing a key are scored, so the work grows with the roster instead of
+    with its square. Reads the database itself so it can run in a separate process.
+    """
+    start = time.perf_counter()
+    report = DedupReport()
+    # Hundreds of thousands of small objects and no cycles: the cyclic GC would only
+    # rescan them over and over while they're built
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT roll_no, name, email, gender, contact, dob FROM students")
+            candidates = [Candidate(r) for r in rows]
+        finally:
+            conn.close()
+        report.rows = len(candidates)
+
+        # Most keys are unique: remember the first holder, and start a list only on a repeat
+        first = {}
+        blocks = {}
+        for i, c in enumerate(candidates):
+            for key in c.blocking_keys():
+                j = first.setdefault(key, i)
+                if j != i:
+                    blocks.setdefault(key, [j]).append(i)
+        del first
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    seen = set()
+    found = []
+    for members in blocks.values():
+        if len(members) > max_block:
+            report.oversized += 1
+            continue
+        report.blocks += 1
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pair = (members[x], members[y])
+                if pair in seen:
+                    continue        # already scored via another shared key
+                seen.add(pair)
+                report.comparisons += 1
+                a, b = candidates[pair[0]], candidates[pair[1]]
+                s, agree = score(a, b)
+                if s >= threshold:
+                    found.append((round(s, 3), a.row, b.row, tuple(agree)))
+    found.sort(key=lambda f: (-f[0], f[1][0], f[2][0]))
+    report.suggestions = found[:limit]
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def find_duplicates_in_process(db_path, threshold=DEFAULT_THRESHOLD, cancelled=None):
+    # Run the scan in a worker process so a big roster doesn't hold the caller's GIL;
+    # a cancelled scan kills the worker and returns None
+    pool = spawn_context().Pool(1)
+    try:
+        result = pool.apply_async(find_duplicates, (db_path, threshold))
+        while not result.ready():
+            if cancelled is not None and cancelled():
+                pool.terminate()
+                return None
+            result.wait(POLL_SECONDS)
+        return result.get()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,321 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import date
+
+from sms_db import (STUDENT_COLUMNS, STUDENT_LABELS, get_db, deferred_sync, student_keys,
+                    count_view, iter_view, optimize_db, parse_dob, link_username, CHANGE_TABLES,
+                    change_log_head, iter_changes)
+
+GENDERS = ("Male", "Female", "Other")
+
+# Rows per transaction when importing (larger batches leave FTS5 fewer segments to merge;
+# progress and cancel are still checked about once a second), and how many problems a
+# report keeps verbatim
+IMPORT_BATCH_SIZE = 20000
+MAX_REPORTED_ISSUES = 1000
+
+# Accepted header spellings -> students column (the app's own CSV export uses the labels)
+HEADER_ALIASES = {
+    "roll_no": "roll_no", "roll no": "roll_no", "roll": "roll_no", "rollno": "roll_no",
+    "name": "name",
+    "email": "email",
+    "gender": "gender",
+    "contact": "contact", "phone": "contact",
+    "dob": "dob", "d.o.b": "dob", "date of birth": "dob",
+    "address": "address",
+    "username": "username",
+}
+
+# Positions in a STUDENT_COLUMNS tuple that _clean_row checks
+_ROLL, _NAME, _GENDER, _DOB, _USERNAME = (STUDENT_COLUMNS.index(c) for c in
+                                          ("roll_no", "name", "gender", "dob", "username"))
+
+_INSERT_SQL = (f"INSERT INTO students ({', '.join(STUDENT_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(STUDENT_COLUMNS))})")
+_UPSERT_SQL = _INSERT_SQL + " ON CONFLICT(roll_no) DO UPDATE SET " + ", ".join(
+    f"{c}=excluded.{c}" for c in STUDENT_COLUMNS[1:])
+
+
+# ------------------------ CSV Import ------------------------
+class ImportReport:
+    __slots__ = ("read", "written", "skipped", "invalid", "issues", "seconds", "cancelled")
+
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.issues = []        # (line, roll_no, reason), capped at MAX_REPORTED_ISSUES
+        self.seconds = 0.0
+        self.cancelled = False
+
+    def note(self, line, roll_no, reason):
+        if len(self.issues) < MAX_REPORTED_ISSUES:
+            self.issues.append((line, roll_no, reason))
+
+    @property
+    def rows_per_sec(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        text = (f"Read {self.read} rows in {self.seconds:.1f}s ({self.rows_per_sec:,.0f} rows/s)\n"
+                f"Written: {self.written}   Skipped (conflict): {self.skipped}   Invalid: {self.invalid}")
+        if self.cancelled:
+            text += "\nImport was cancelled; batches already committed were kept."
+        return text
+
+
+def _map_header(header):
+    # -> [(position in a CSV row, position in STUDENT_COLUMNS)] for the columns we know;
+    # a repeated column keeps its last value
+    mapping = []
+    for pos, name in enumerate(header):
+        col = HEADER_ALIASES.get(name.strip().lower())
+        if col:
+            mapping.append((pos, STUDENT_COLUMNS.index(col)))
+    found = {at for _, at in mapping}
+    if _ROLL not in found or _NAME not in found:
+        raise ValueError("CSV needs at least a Roll No and a Name column.")
+    return mapping
+
+
+def _clean_row(mapping, raw, today=None):
+    # -> (row tuple in STUDENT_COLUMNS order, None) or (None, reason). Runs once per row,
+    # so it fills a list by position rather than going through a dict of column names.
+    rec = [""] * len(STUDENT_COLUMNS)
+    width = len(raw)
+    for pos, at in mapping:
+        if pos < width:
+            rec[at] = raw[pos].strip()
+    if not rec[_ROLL] or not rec[_NAME]:
+        return None, "Roll No and Name are required"
+    if rec[_GENDER]:
+        gender = rec[_GENDER].capitalize()
+        if gender not in GENDERS:
+            return None, f"Unknown gender '{rec[_GENDER]}'"
+        rec[_GENDER] = gender
+    if rec[_DOB]:
+        try:
+            rec[_DOB] = parse_dob(rec[_DOB], today)
+        except ValueError as e:
+            return None, str(e)
+    rec[_USERNAME] = link_username(rec[_USERNAME])
+    return tuple(rec), None
+
+
+def _conflicts(batch, upsert):
+    # {index in batch: reason} for rows that fail whatever else the batch does: their key
+    # is held by a stored row the batch doesn't touch. One lookup per key column finds
+    # them; clashes within the batch are left to the statement (see _write_rows).
+    at = STUDENT_COLUMNS.index("username")
+    keys = {row[0] for _, row in batch}
+    held, linked = student_keys([] if upsert else keys, [row[at] for _, row in batch])
+    found = {}
+    for i, (_, row) in enumerate(batch):
+        holder = linked.get(row[at])
+        if row[0] in held:
+            found[i] = "UNIQUE constraint failed: students.roll_no"
+        elif holder is not None and holder != row[0] and not (upsert and holder in keys):
+            found[i] = "UNIQUE constraint failed: students.username"
+    return found
+
+
+def _write_rows(conn, sql, rows, report):
+    # rows in one executemany; if any of them fails, each half is tried on its own until
+    # the offenders are alone, so the rest still go in as a few large statements. Halves
+    # run in file order, so the same rows win as with a row-by-row replay.
+    conn.execute("SAVEPOINT rows")
+    try:
+        conn.executemany(sql, [row for _, row in rows])
+    except sqlite3.IntegrityError as e:
+        conn.execute("ROLLBACK TO rows")
+        conn.execute("RELEASE rows")
+        if len(rows) == 1:
+            line, row = rows[0]
+            report.skipped += 1
+            report.note(line, row[0], str(e))
+            return
+        mid = len(rows) // 2
+        _write_rows(conn, sql, rows[:mid], report)
+        _write_rows(conn, sql, rows[mid:], report)
+        return
+    conn.execute("RELEASE rows")
+    report.written += len(rows)
+
+
+def _write_batch(sql, batch, report, upsert, claimed=None):
+    # One transaction per batch, with the bulk-write triggers held off throughout
+    # (deferred_sync). Rows already known to conflict are skipped up front.
+    skip = _conflicts(batch, upsert)
+    if claimed is not None:
+        others = claimed([row for i, (_, row) in enumerate(batch) if i not in skip])
+        skip.update((i, others[row[0]]) for i, (_, row) in enumerate(batch) if row[0] in others)
+    for i, reason in skip.items():
+        line, row = batch[i]
+        report.skipped += 1
+        report.note(line, row[0], reason)
+    rows = [item for i, item in enumerate(batch) if i not in skip]
+    if not rows:
+        return
+    with get_db().writer() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        with deferred_sync(conn, [row[0] for _, row in rows] if upsert else None):
+            _write_rows(conn, sql, rows, report)
+
+
+def import_students_csv(path, mode="skip", batch_size=IMPORT_BATCH_SIZE, progress=None, cancelled=None,
+                        claimed=None):
+    """Stream a CSV into students in batches of batch_size rows per transaction.
+
+    mode "skip" leaves existing roll numbers alone and reports them; "upsert" overwrites
+    them. progress(rows_read, fraction_of_file) is called after every batch.
+    claimed(rows) -> {roll_no: reason} names rows to skip as conflicts before they are
+    written (sms_shards.ShardRouter.claimed_elsewhere: keys another campus holds).
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return import_students_stream(f, mode, batch_size, progress, cancelled,
+                                      size=os.path.getsize(path) or 1, claimed=claimed)
+
+
+def import_students_stream(f, mode="skip", batch_size=IMPORT_BATCH_SIZE, progress=None,
+                           cancelled=None, size=None, claimed=None):
+    # f is any text stream opened with newline="" (a file, or stdin in a pipeline);
+    # without size in bytes progress can't tell how far through the input it is
+    if mode not in ("skip", "upsert"):
+        raise ValueError(f"Unknown import mode: {mode}")
+    upsert = mode == "upsert"
+    sql = _UPSERT_SQL if upsert else _INSERT_SQL
+    report = ImportReport()
+    start = time.perf_counter()
+
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("CSV file is empty.")
+    mapping = _map_header(header)
+    today = date.today()
+
+    batch = []
+    for raw in reader:
+        if not any(raw):
+            continue
+        report.read += 1
+        row, reason = _clean_row(mapping, raw, today)
+        if row is None:
+            report.invalid += 1
+            report.note(reader.line_num, raw[0] if raw else "", reason)
+            continue
+        batch.append((reader.line_num, row))
+        if len(batch) >= batch_size:
+            _write_batch(sql, batch, report, upsert, claimed)
+            batch = []
+            if progress:
+                progress(report.read, min(f.buffer.tell() / size, 1.0) if size else 0.0)
+            if cancelled is not None and cancelled():
+                report.cancelled = True
+                break
+    if batch and not report.cancelled:
+        _write_batch(sql, batch, report, upsert, claimed)
+
+    if report.written:
+        optimize_db()
+    report.seconds = time.perf_counter() - start
+    if progress:
+        progress(report.read, 1.0)
+    return report
+
+
+# ------------------------ CSV Export ------------------------
+def open_text_output(path, compress=None):
+    # compress=None picks gzip from a .gz suffix
+    if compress is None:
+        compress = path.lower().endswith(".gz")
+    if compress:
+        return gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6)
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def export_students_csv(path, where="", params=(), search=None, columns=STUDENT_COLUMNS,
+                        compress=None, progress=None, cancelled=None, limit=None, source=None, sort=None):
+    """Write the rows of a view (see sms_db.iter_view) to CSV straight from the cursor.
+
+    Values are written exactly as stored, so roll numbers and contacts keep leading zeros.
+    source: anything with count_view/iter_view (an sms_shards.ShardRouter) instead of the database.
+    Returns the number of rows written, or None if cancelled (the partial file is removed).
+    """
+    try:
+        with open_text_output(path, compress) as f:
+            written = write_students_csv(f, where, params, search, columns, progress, cancelled, limit,
+                                         source, sort)
+        if cancelled is not None and cancelled():
+            os.remove(path)
+            return None
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
+
+
+def write_students_csv(f, where="", params=(), search=None, columns=STUDENT_COLUMNS,
+                       progress=None, cancelled=None, limit=None, source=None, sort=None):
+    # Header + rows to an open text stream (a file, or stdout in a pipeline); returns rows written
+    count, rows_of = (source.count_view, source.iter_view) if source else (count_view, iter_view)
+    total = count(where, params, search) if progress else 0
+    written = 0
+    wr = csv.writer(f)
+    wr.writerow([STUDENT_LABELS[c] for c in columns])
+    for rows in rows_of(where, params, search, columns, cancelled=cancelled, sort=sort):
+        if limit is not None:
+            rows = rows[:limit - written]
+        wr.writerows(rows)
+        written += len(rows)
+        if progress:
+            progress(written, written / total if total else 1.0)
+        if (cancelled is not None and cancelled()) or written == limit:
+            break
+    return written
+
+
+# ------------------------ Delta Export ------------------------
+def write_changes(f, table="students", since=None, until=None, fmt="csv"):
+    """Rows of table changed after checkpoint since (None = everything) to an open text
+    stream, as CSV (Seq, Op, then the table's columns) or JSON lines. Returns rows written."""
+    key, columns = CHANGE_TABLES[table]
+    blank = ("",) * (len(columns) - 1)
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format {fmt}")
+    batches = iter_changes(table, since, until)
+    written = 0
+    if fmt == "csv":
+        wr = csv.writer(f)
+        wr.writerow(["Seq", "Op"] + [STUDENT_LABELS.get(c, c.capitalize()) for c in columns])
+    for rows in batches:
+        if fmt == "csv":
+            # The key column comes first in every captured table; a delete has nothing else
+            wr.writerows(r[:2] + (r[3:] if r[1] == "upsert" else (r[2],) + blank) for r in rows)
+        else:
+            for r in rows:
+                record = {"seq": r[0], "table": table, "op": r[1], "key": r[2],
+                          "row": dict(zip(columns, r[3:])) if r[1] == "upsert" else None}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        written += len(rows)
+    return written
+
+
+def export_changes(path, table="students", since=None, fmt="csv", compress=None):
+    """Delta export to a file; returns (rows written, checkpoint to pass as since next time)."""
+    until = change_log_head()
+    try:
+        with open_text_output(path, compress) as f:
+            written = write_changes(f, table, since, until, fmt)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written, until
@@ -0,0 +1,268 @@
+"""Fold the old loose database files into the live database.
+
+    python sms_cli.py --user admin consolidate --dry-run
+    python sms_cli.py --user admin consolidate login.db --users replace > reconcile.csv
+
+Each legacy file is ATTACHed to the writer connection and merged in one transaction:
+its users/students table is copied into a temp staging table with the columns mapped
+onto the current schema, every row is classified there with set-based UPDATEs (invalid,
+identical, new, or a conflict resolved by the chosen rule), and the outcome is applied
+with INSERT ... SELECT / UPDATE ... FROM. Nothing is looped over in Python.
+"""
+import os
+
+import sms_db
+from sms_db import STUDENT_COLUMNS, ROLES, get_db, deferred_sync, normalize_dobs
+from sms_io import GENDERS, HEADER_ALIASES, MAX_REPORTED_ISSUES
+
+# Files older versions of the app wrote next to app.db, merged in this order
+LEGACY_FILES = ("sms.db", "student.db", "students.db", "users.db", "login.db")
+# Table names they used, tried in order
+LEGACY_TABLES = {"students": ("students", "student"), "users": ("users", "login", "accounts")}
+USER_ALIASES = {"username": "username", "user": "username", "login": "username",
+                "password": "password", "pass": "password", "pwd": "password", "role": "role"}
+
+# What to do when a legacy row's key already exists with different data:
+#   skip     keep the current row
+#   replace  the legacy row wins (an admin login is never demoted)
+#   fill     students only: copy legacy values into the current row's blank fields
+#   rename   add the legacy row under "<key>-<file>" (students) / "<key>_<file>" (users)
+STUDENT_RULES = ("skip", "replace", "fill", "rename")
+USER_RULES = ("skip", "replace", "rename")
+# Outcome recorded for a conflicting row under each rule
+_CONFLICT_OUTCOME = {"skip": "kept", "replace": "replaced", "fill": "filled", "rename": "renamed"}
+
+
+class ConsolidationReport:
+    __slots__ = ("counts", "details", "dob_issues", "dry_run")
+
+    def __init__(self, dry_run=False):
+        self.counts = []        # (file, table, {outcome: rows})
+        self.details = []       # (file, table, key, outcome, new key, detail) for rows not simply added
+        self.dob_issues = 0
+        self.dry_run = dry_run
+
+    def summary(self):
+        lines = []
+        for path, table, counts in self.counts:
+            text = ", ".join(f"{n} {outcome}" for outcome, n in sorted(counts.items())) or "empty"
+            lines.append(f"{os.path.basename(path)} {table}: {text}")
+        if self.dob_issues:
+            lines.append(f"{self.dob_issues} merged D.O.B values can't be read (see dob-report)")
+        if self.dry_run:
+            lines.append("Dry run: nothing was written.")
+        return "\n".join(lines)
+
+
+def legacy_files(directory=None):
+    # Legacy files present next to the live database
+    directory = directory or os.path.dirname(os.path.abspath(sms_db.get_db().path))
+    return [os.path.join(directory, name) for name in LEGACY_FILES
+            if os.path.exists(os.path.join(directory, name))]
+
+
+def _legacy_table(conn, kind):
+    names = LEGACY_TABLES[kind]
+    found = dict(conn.execute(f"SELECT lower(name), name FROM legacy.sqlite_master WHERE type='table' "
+                              f"AND lower(name) IN ({', '.join('?' * len(names))})", names).fetchall())
+    for name in names:
+        if name in found:
+            return found[name]
+    return None
+
+
+def _mapped(conn, table, aliases):
+    # -> {current column: legacy column} for the columns the legacy table has
+    mapping = {}
+    for _, name, *_ in conn.execute(f'PRAGMA legacy.table_info("{table}")'):
+        col = aliases.get(name.strip().lower().replace("_", " ")) or aliases.get(name.strip().lower())
+        if col and col not in mapping:
+            mapping[col] = name
+    return mapping
+
+
+def _text(mapping, col):
+    return f"""TRIM(COALESCE(CAST("{mapping[col]}" AS TEXT), ''))""" if col in mapping else "''"
+
+
+def _stage(conn, name, columns, select):
+    # Temp table of the legacy rows as the current schema sees them, plus the verdict
+    conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP TABLE {name} ({', '.join(columns)}, outcome TEXT, new_key TEXT, detail TEXT)")
+    conn.execute(f"INSERT INTO temp.{name} ({', '.join(columns)}) {select}")
+
+
+def _collect(conn, name, key, path, table, report):
+    counts = dict(conn.execute(f"SELECT outcome, COUNT(*) FROM temp.{name} GROUP BY outcome").fetchall())
+    report.counts.append((path, table, counts))
+    room = MAX_REPORTED_ISSUES - len(report.details)
+    if room > 0:
+        rows = conn.execute(f"SELECT {key}, outcome, COALESCE(new_key, ''), COALESCE(detail, '') "
+                            f"FROM temp.{name} WHERE outcome NOT IN ('added', 'identical') "
+                            f"ORDER BY rowid LIMIT ?", (room,))
+        report.details += [(path, table) + r for r in rows]
+    conn.execute(f"DROP TABLE temp.{name}")
+
+
+# ------------------------ Students ------------------------
+def _merge_students(conn, table, path, stem, rule, report):
+    mapping = _mapped(conn, table, HEADER_ALIASES)
+    if "roll_no" not in mapping:
+        report.counts.append((path, table, {"unreadable (no roll number column)": 1}))
+        return
+    data = STUDENT_COLUMNS[1:-1]
+    exprs = [_text(mapping, c) for c in STUDENT_COLUMNS[:-1]]
+    exprs.append(f"""NULLIF(TRIM(CAST("{mapping['username']}" AS TEXT)), '')""" if "username" in mapping else "NULL")
+    _stage(conn, "legacy_students", STUDENT_COLUMNS,
+           f'SELECT {", ".join(exprs)} FROM legacy."{table}"')
+    s = "temp.legacy_students"
+    genders = ", ".join(f"'{g}'" for g in GENDERS)
+
+    # Same checks as the CSV import; D.O.B values are kept and reported after the merge
+    conn.execute(f"UPDATE {s} SET gender = upper(substr(gender, 1, 1)) || lower(substr(gender, 2))")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Roll No and Name are required' "
+                 f"WHERE roll_no = '' OR name = ''")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Unknown gender ''' || gender || '''' "
+                 f"WHERE outcome IS NULL AND gender <> '' AND gender NOT IN ({genders})")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Roll No repeated in this file' "
+                 f"WHERE outcome IS NULL AND rowid NOT IN "
+                 f"(SELECT MIN(rowid) FROM {s} WHERE outcome IS NULL GROUP BY roll_no)")
+
+    same = " AND ".join(f"t.{c} IS s.{c}" for c in data)
+    conn.execute(f"UPDATE {s} AS s SET outcome = 'identical' WHERE outcome IS NULL AND EXISTS "
+                 f"(SELECT 1 FROM main.students t WHERE t.roll_no = s.roll_no AND {same} "
+                 f"AND (s.username IS NULL OR t.username IS s.username))")
+    conflict = f"outcome IS NULL AND roll_no IN (SELECT roll_no FROM main.students)"
+    if rule == "fill":
+        blank = " OR ".join(f"(COALESCE(t.{c}, '') = '' AND s.{c} <> '')" for c in data)
+        conn.execute(f"UPDATE {s} AS s SET outcome = CASE WHEN EXISTS (SELECT 1 FROM main.students t "
+                     f"WHERE t.roll_no = s.roll_no AND ({blank} OR (t.username IS NULL AND "
+                     f"s.username IS NOT NULL))) THEN 'filled' ELSE 'kept' END WHERE {conflict}")
+    elif rule == "rename":
+        conn.execute(f"UPDATE {s} SET outcome = 'renamed', new_key = roll_no || '-' || ? WHERE {conflict}", (stem,))
+        conn.execute(f"UPDATE {s} SET outcome = 'kept', new_key = NULL, "
+                     f"detail = 'Roll No ' || new_key || ' is taken too' "
+                     f"WHERE outcome = 'renamed' AND new_key IN (SELECT roll_no FROM main.students)")
+    else:
+        conn.execute(f"UPDATE {s} SET outcome = ? WHERE {conflict}", (_CONFLICT_OUTCOME[rule],))
+    conn.execute(f"UPDATE {s} SET outcome = 'added' WHERE outcome IS NULL")
+
+    # A login links to one student at most: a username already linked elsewhere is dropped
+    conn.execute(f"UPDATE {s} AS s SET username = NULL, detail = 'Username ' || username || "
+                 f"' is linked to another student; left unlinked' "
+                 f"WHERE outcome IN ('added', 'renamed', 'replaced', 'filled') AND username IS NOT NULL AND "
+                 f"(EXISTS (SELECT 1 FROM main.students t WHERE t.username = s.username "
+                 f"AND t.roll_no <> COALESCE(s.new_key, s.roll_no)) OR rowid NOT IN "
+                 f"(SELECT MIN(rowid) FROM {s} WHERE outcome IN ('added', 'renamed', 'replaced', 'filled') "
+                 f"AND username IS NOT NULL GROUP BY username))")
+
+    changed = [r[0] for r in conn.execute(f"SELECT roll_no FROM {s} WHERE outcome IN ('replaced', 'filled')")]
+    cols = ", ".join(STUDENT_COLUMNS)
+    with deferred_sync(conn, changed or None):
+        conn.execute(f"INSERT INTO main.students ({cols}) SELECT COALESCE(new_key, roll_no), "
+                     f"{', '.join(STUDENT_COLUMNS[1:])} FROM {s} WHERE outcome IN ('added', 'renamed') "
+                     f"ORDER BY rowid")
+        if rule == "replace":
+            sets = ", ".join(f"{c} = s.{c}" for c in data)
+            conn.execute(f"UPDATE main.students AS t SET {sets}, username = COALESCE(s.username, t.username) "
+                         f"FROM {s} AS s WHERE s.roll_no = t.roll_no AND s.outcome = 'replaced'")
+        elif rule == "fill":
+            sets = ", ".join(f"{c} = CASE WHEN COALESCE(t.{c}, '') = '' THEN s.{c} ELSE t.{c} END" for c in data)
+            conn.execute(f"UPDATE main.students AS t SET {sets}, username = COALESCE(t.username, s.username) "
+                         f"FROM {s} AS s WHERE s.roll_no = t.roll_no AND s.outcome = 'filled'")
+    # Rewrite readable dates as ISO; the rest stay as they were and are listed in dob_issues
+    normalize_dobs(conn)
+    report.dob_issues += conn.execute(f"SELECT COUNT(*) FROM dob_issues WHERE roll_no IN (SELECT "
+                                      f"COALESCE(new_key, roll_no) FROM {s} WHERE outcome IN "
+                                      f"('added', 'renamed', 'replaced', 'filled'))").fetchone()[0]
+    _collect(conn, "legacy_students", "roll_no", path, table, report)
+
+
+# ------------------------ Users ------------------------
+def _merge_users(conn, table, path, stem, rule, report):
+    mapping = _mapped(conn, table, USER_ALIASES)
+    if "username" not in mapping:
+        report.counts.append((path, table, {"unreadable (no username column)": 1}))
+        return
+    cols = ("username", "password", "role")
+    _stage(conn, "legacy_users", cols,
+           f'SELECT {", ".join(_text(mapping, c) for c in cols)} FROM legacy."{table}"')
+    s = "temp.legacy_users"
+    roles = ", ".join(f"'{r}'" for r in ROLES)
+
+    conn.execute(f"UPDATE {s} SET role = lower(role)")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Username and password are required' "
+                 f"WHERE username = '' OR password = ''")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Unknown role ''' || role || '''' "
+                 f"WHERE outcome IS NULL AND role NOT IN ({roles})")
+    conn.execute(f"UPDATE {s} SET outcome = 'invalid', detail = 'Username repeated in this file' "
+                 f"WHERE outcome IS NULL AND rowid NOT IN "
+                 f"(SELECT MIN(rowid) FROM {s} WHERE outcome IS NULL GROUP BY username)")
+    conn.execute(f"UPDATE {s} AS s SET outcome = 'identical' WHERE outcome IS NULL AND EXISTS "
+                 f"(SELECT 1 FROM main.users u WHERE u.username = s.username AND u.password = s.password "
+                 f"AND u.role = s.role)")
+    conflict = f"outcome IS NULL AND username IN (SELECT username FROM main.users)"
+    if rule == "replace":
+        conn.execute(f"UPDATE {s} AS s SET outcome = 'kept', detail = 'Would demote an admin' WHERE {conflict} "
+                     f"AND s.role <> 'admin' AND (SELECT role FROM main.users u WHERE u.username = s.username) = 'admin'")
+    if rule == "rename":
+        conn.execute(f"UPDATE {s} SET outcome = 'renamed', new_key = username || '_' || ? WHERE {conflict}", (stem,))
+        conn.execute(f"UPDATE {s} SET outcome = 'kept', new_key = NULL, "
+                     f"detail = 'Username ' || new_key || ' is taken too' "
+                     f"WHERE outcome = 'renamed' AND new_key IN (SELECT username FROM main.users)")
+    else:
+        conn.execute(f"UPDATE {s} SET outcome = ? WHERE {conflict}", (_CONFLICT_OUTCOME[rule],))
+    conn.execute(f"UPDATE {s} SET outcome = 'added' WHERE outcome IS NULL")
+
+    conn.execute(f"INSERT INTO main.users (username, password, role) SELECT COALESCE(new_key, username), "
+                 f"password, role FROM {s} WHERE outcome IN ('added', 'renamed') ORDER BY rowid")
+    conn.execute(f"UPDATE main.users AS u SET password = s.password, role = s.role FROM {s} AS s "
+                 f"WHERE s.username = u.username AND s.outcome = 'replaced'")
+    _collect(conn, "legacy_users", "username", path, table, report)
+
+
+# ------------------------ Consolidation ------------------------
+def consolidate(paths=None, students_rule="skip", users_rule="skip", dry_run=False):
+    """Merge legacy database files into the live one; -> ConsolidationReport.
+
+    paths defaults to the LEGACY_FILES found next to the database. Each file is one
+    transaction (users first, so merged students can link to merged logins); with
+    dry_run every transaction is rolled back after the report is taken.
+    """
+    if students_rule not in STUDENT_RULES:
+        raise ValueError(f"Unknown students rule {students_rule}")
+    if users_rule not in USER_RULES:
+        raise ValueError(f"Unknown users rule {users_rule}")
+    paths = legacy_files() if paths is None else paths
+    live = os.path.realpath(get_db().path)
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        if os.path.realpath(path) == live:
+            raise ValueError(f"{path} is the live database")
+
+    report = ConsolidationReport(dry_run)
+    with get_db().writer(touches=("students", "users")) as conn:
+        for path in paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            # ATTACH/DETACH aren't allowed inside a transaction
+            conn.execute("ATTACH DATABASE ? AS legacy", (path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    table = _legacy_table(conn, "users")
+                    if table:
+                        _merge_users(conn, table, path, stem, users_rule, report)
+                    table = _legacy_table(conn, "students")
+                    if table:
+                        _merge_students(conn, table, path, stem, students_rule, report)
+                except BaseException:
+                    conn.rollback()
+                    raise
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE legacy")
+    return report
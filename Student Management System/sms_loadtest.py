@@ -0,0 +1,166 @@
+"""Load test for sms_server: sustained requests per second from many concurrent clients.
+
+    python sms_loadtest.py --rows 100000 --clients 40 --duration 30
+    python sms_loadtest.py --url http://127.0.0.1:8765 --user admin --password admin123
+
+Without --url a server is started on a temporary database filled with the benchmark's
+synthetic roster. Each client thread loops over the desktop app's own calls (page,
+count, search, lookup, and --write-ratio updates) until the time is up. Output is JSON
+with overall requests/s and p50/p95/p99 latency per call.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import sms_db
+from sms_client import ServiceClient
+from sms_metrics import Histogram
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SEARCH_TERMS = ("khan", "ali", "maria", "smi", "0300", "patel", "sara", "wang")
+
+
+def start_server(rows, seed, readers):
+    # -> (process, url, workdir) for a throwaway server over a synthetic roster
+    from sms_bench import populate
+    workdir = tempfile.mkdtemp(prefix="sms_load_")
+    sms_db.DB_FILE = os.path.join(workdir, "app.db")
+    sms_db.init_db()
+    populate(rows, seed)
+    sms_db.close_db()
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "sms_server.py"), "--db", sms_db.DB_FILE,
+                             "--port", "0", "--readers", str(readers)],
+                            stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if not line.startswith("Serving on "):
+        proc.kill()
+        raise RuntimeError(f"server did not start: {line}{proc.stderr.read()}")
+    return proc, line.split()[-1], workdir
+
+
+class Worker(threading.Thread):
+    def __init__(self, url, user, password, deadline, write_ratio, batch, seed, sample):
+        super().__init__(daemon=True)
+        self.client = ServiceClient(url)
+        self.user = user
+        self.password = password
+        self.deadline = deadline
+        self.write_ratio = write_ratio
+        self.batch = batch
+        self.rng = random.Random(seed)
+        self.sample = sample
+        self.latency = {}
+        self.requests = 0
+        self.calls = 0
+        self.errors = 0
+
+    def _call(self):
+        # One random call as (name, op, body), in the proportions the desktop app makes them
+        rng = self.rng
+        r = rng.random()
+        row = rng.choice(self.sample)
+        if r < self.write_ratio:
+            return "update", "update_student", {"row": list(row[:2]) + [f"load{rng.randrange(10**6)}@x"]
+                                                + list(row[3:])}
+        r = rng.random()
+        if r < 0.55:
+            return "page", "fetch_student_page", {"after": [row[1], row[0]], "limit": 101}
+        if r < 0.70:
+            return "count", "count_students", {}
+        if r < 0.90:
+            return "search", "search_students", {"text": rng.choice(SEARCH_TERMS)}
+        return "get", "fetch_student", {"roll_no": row[0]}
+
+    def run(self):
+        if self.client.authenticate(self.user, self.password) is None:
+            self.errors += 1
+            return
+        while time.perf_counter() < self.deadline:
+            calls = [self._call() for _ in range(self.batch)]
+            start = time.perf_counter()
+            try:
+                if self.batch == 1:
+                    _, op, body = calls[0]
+                    self.client.call(op, **body)
+                else:
+                    results = self.client.batch([(op, body) for _, op, body in calls])
+                    self.errors += sum(isinstance(r, Exception) for r in results)
+            except Exception:
+                self.errors += 1
+            ms = (time.perf_counter() - start) * 1000
+            name = calls[0][0] if self.batch == 1 else "batch"
+            self.latency.setdefault(name, Histogram()).add(ms)
+            self.requests += 1
+            self.calls += len(calls)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test a local sms_server.")
+    ap.add_argument("--url", help="existing server (default: start one on a temp database)")
+    ap.add_argument("--user", default="admin")
+    ap.add_argument("--password", default="admin123")
+    ap.add_argument("--rows", type=int, default=20000, help="roster size for the temp server")
+    ap.add_argument("--readers", type=int, default=8, help="reader threads for the temp server")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds")
+    ap.add_argument("--write-ratio", type=float, default=0.05)
+    ap.add_argument("--batch", type=int, default=1, help="calls per HTTP request (uses /api/batch)")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    proc = workdir = None
+    url = args.url
+    if url is None:
+        proc, url, workdir = start_server(args.rows, args.seed, args.readers)
+    try:
+        probe = ServiceClient(url)
+        if probe.authenticate(args.user, args.password) is None:
+            sys.exit("login failed")
+        sample = [r for r in probe.fetch_student_page(limit=300) if r[1]]
+        if not sample:
+            sys.exit("the server has no students to test against")
+
+        deadline = time.perf_counter() + args.duration
+        workers = [Worker(url, args.user, args.password, deadline, args.write_ratio, args.batch,
+                          args.seed + i, sample) for i in range(args.clients)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        merged = {}
+        for w in workers:
+            for name, hist in w.latency.items():
+                into = merged.setdefault(name, Histogram())
+                into.count += hist.count
+                into.total += hist.total
+                into.max = max(into.max, hist.max)
+                for i, n in hist.buckets.items():
+                    into.buckets[i] = into.buckets.get(i, 0) + n
+        requests = sum(w.requests for w in workers)
+        calls = sum(w.calls for w in workers)
+        report = {
+            "url": url, "clients": args.clients, "batch": args.batch, "seconds": round(elapsed, 2),
+            "requests": requests, "calls": calls, "errors": sum(w.errors for w in workers),
+            "requests_per_sec": round(requests / elapsed, 1), "calls_per_sec": round(calls / elapsed, 1),
+            "latency_ms": {name: h.as_dict() for name, h in sorted(merged.items())},
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import cProfile
+import functools
+import heapq
+import io
+import json
+import logging
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Rotating JSON-lines log: one line per operation, plus a summary line on close
+LOG_DIR = "logs"
+LOG_FILE = "sms_metrics.jsonl"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+
+# Histogram buckets grow by 10%, so a percentile is accurate to within that
+BUCKET_GROWTH = 1.1
+SLOWEST_KEPT = 50
+# Statements recorded per operation (a batch import runs thousands)
+MAX_STATEMENTS = 20
+SQL_PREVIEW_CHARS = 200
+
+
+# ------------------------ Histograms ------------------------
+class Histogram:
+    """Log-bucketed latency histogram: fixed memory whatever the number of samples."""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        # Bucket 0 holds everything up to 1 microsecond
+        i = max(0, math.ceil(math.log(ms * 1000, BUCKET_GROWTH))) if ms > 0 else 0
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                return min(BUCKET_GROWTH ** i / 1000, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "p50": round(self.percentile(50), 3), "p95": round(self.percentile(95), 3),
+                "p99": round(self.percentile(99), 3), "max": round(self.max, 3)}
+
+
+def params_shape(params, many=False):
+    # Shape only, never values: parameters include passwords
+    if many:
+        if isinstance(params, (list, tuple)):
+            first = params[0] if params else ()
+            return f"{len(params)}x{params_shape(first)}"
+        return "iter"
+    if isinstance(params, dict):
+        return "dict[" + ",".join(sorted(params)) + "]"
+    if isinstance(params, (list, tuple)):
+        return f"{type(params).__name__}[{len(params)}]"
+    return type(params).__name__
+
+
+def _row_count(result):
+    # Data-layer results are row lists, (rows, total) pairs, single rows or counts
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    if isinstance(result, tuple):
+        return 1
+    return None
+
+
+# ------------------------ Recorder ------------------------
+class Metrics:
+    """Times operations (kind "db" or "ui") and the SQL statements they run.
+
+    Every operation updates an in-memory histogram and the slowest-N list; when a log is
+    open it is also written as one JSON line. A statement executed on a connection is
+    attached to whichever operation is running on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._slowest = []       # min-heap of (ms, seq, record)
+        self._seq = 0
+        self._logger = None
+        self._profile_ops = set()
+        self._profile_lock = threading.Lock()
+        self.profile_dir = LOG_DIR
+        self.last_profile = None
+        self.enabled = True
+
+    # ---- log ----
+    def open_log(self, log_dir=LOG_DIR):
+        os.makedirs(log_dir, exist_ok=True)
+        logger = logging.getLogger("sms.metrics")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(os.path.join(log_dir, LOG_FILE), maxBytes=LOG_MAX_BYTES,
+                                      backupCount=LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        self._logger = logger
+        self.profile_dir = log_dir
+
+    def close_log(self):
+        if self._logger is None:
+            return
+        self._write({"ts": round(time.time(), 3), "type": "summary", "ops": self.summary()})
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+            handler.close()
+        self._logger = None
+
+    def _write(self, record):
+        if self._logger is not None:
+            self._logger.info(json.dumps(record, default=str))
+
+    # ---- recording ----
+    @contextmanager
+    def timed(self, kind, name, **fields):
+        """Time the block as one operation; yields its record so callers can add fields."""
+        if not self.enabled:
+            yield {}
+            return
+        record = {"type": kind, "op": name, **fields}
+        parent = getattr(self._local, "op", None)
+        self._local.op = record
+        profiler = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as exc:
+            record["error"] = type(exc).__name__
+            raise
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._local.op = parent
+            if profiler is not None:
+                record["profile"] = self._stop_profile(profiler, name)
+                self.last_profile = record
+            self.record(record)
+
+    def record(self, record):
+        record.setdefault("ts", round(time.time(), 3))
+        key = f"{record['type']}:{record['op']}"
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.add(record["ms"])
+            self._seq += 1
+            entry = (record["ms"], self._seq, record)
+            if len(self._slowest) < SLOWEST_KEPT:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+        self._write(record)
+
+    def statement(self, sql, params, seconds, many=False, rowcount=-1):
+        # Called by the data layer's connections for every execute/executemany
+        op = getattr(self._local, "op", None)
+        if op is None:
+            return
+        statements = op.setdefault("statements", [])
+        op["sql_ms"] = round(op.get("sql_ms", 0.0) + seconds * 1000, 3)
+        op["sql_count"] = op.get("sql_count", 0) + 1
+        if len(statements) < MAX_STATEMENTS:
+            stmt = {"sql": " ".join(sql.split())[:SQL_PREVIEW_CHARS],
+                    "params": params_shape(params, many), "ms": round(seconds * 1000, 3)}
+            if rowcount >= 0:
+                stmt["rowcount"] = rowcount
+            statements.append(stmt)
+
+    def annotate(self, **fields):
+        # Add fields to the operation running on this thread, if any
+        op = getattr(self._local, "op", None)
+        if op is not None:
+            op.update(fields)
+
+    def op(self, name=None, kind="db"):
+        """Decorator form of timed(); also records how many rows the function returned."""
+        def decorate(fn):
+            op_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timed(kind, op_name) as record:
+                    result = fn(*args, **kwargs)
+                    rows = _row_count(result)
+                    if rows is not None:
+                        record["rows"] = rows
+                    return result
+            return wrapper
+        return decorate
+
+    # ---- profiling ----
+    def profile_next(self, name):
+        # Capture a cProfile of the next run of operation `name` (on whatever thread runs it)
+        with self._profile_lock:
+            self._profile_ops.add(name)
+
+    def _start_profile(self, name):
+        with self._profile_lock:
+            if name not in self._profile_ops:
+                return None
+            self._profile_ops.discard(name)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:     # another profiler is already active on this thread
+            return None
+        return profiler
+
+    def _stop_profile(self, profiler, name):
+        profiler.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"profile-{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    # ---- reading ----
+    def summary(self):
+        with self._lock:
+            return {key: hist.as_dict() for key, hist in self._histograms.items()}
+
+    def slowest(self, n=SLOWEST_KEPT):
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)[:n]]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slowest.clear()
+
+
+def profile_text(path, limit=25):
+    # Top functions by cumulative time from a saved profile, for display
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+metrics = Metrics()
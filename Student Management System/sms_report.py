@@ -0,0 +1,153 @@
+import math
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # without pypdf the parts can't be merged, so reports render serially
+    PdfWriter = None
+
+from sms_db import STUDENT_COLUMNS, STUDENT_LABELS, count_view, iter_view
+from sms_tasks import spawn_context
+
+# ------------------------ Layout ------------------------
+PAGE_W, PAGE_H = A4
+TITLE_Y = PAGE_H - 50
+HEADER_Y = TITLE_Y - 24
+BODY_TOP = HEADER_Y - 16
+BODY_BOTTOM = 40
+LINE_H = 14
+ROWS_PER_PAGE = int((BODY_TOP - BODY_BOTTOM) // LINE_H) + 1
+COLUMN_X = (20, 80, 150, 270, 320, 380, 440, 515)
+MAX_CELL_CHARS = 35
+
+# Parallel rendering: pages per part file, and below how many rows it isn't worth a pool
+PART_PAGES = 40
+PARALLEL_MIN_ROWS = 5000
+
+
+# ------------------------ Rendering ------------------------
+def _define_templates(pdf):
+    # The title + column header block is drawn once per document as a form XObject and
+    # stamped onto each page, instead of re-emitting the same text operators every page.
+    for name, title in (("first", "Student Records"), ("cont", "Student Records (cont.)")):
+        pdf.beginForm(name)
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawCentredString(PAGE_W / 2, TITLE_Y, title)
+        pdf.setFont("Helvetica", 9)
+        for x, col in zip(COLUMN_X, STUDENT_COLUMNS):
+            pdf.drawString(x, HEADER_Y, STUDENT_LABELS[col])
+        pdf.endForm()
+
+
+def render_pages(path, rows, first_page, total_pages, progress=None, cancelled=None):
+    """Render rows onto pages numbered from first_page; returns the number of pages.
+
+    Runs in pool processes for parallel reports (rows is a list) and in-process for
+    serial ones (rows can be any iterator, e.g. straight off a cursor).
+    """
+    pdf = canvas.Canvas(path, pagesize=A4)
+    pdf.setTitle("Student Records")
+    _define_templates(pdf)
+
+    rows = iter(rows)
+    page_no = first_page
+    while True:
+        page_rows = list(islice(rows, ROWS_PER_PAGE))
+        if not page_rows and page_no > first_page:
+            break
+        pdf.doForm("first" if page_no == 1 else "cont")
+        pdf.setFont("Helvetica", 9)
+        y = BODY_TOP
+        for r in page_rows:
+            for x, val in zip(COLUMN_X, r):
+                pdf.drawString(x, y, ("" if val is None else str(val))[:MAX_CELL_CHARS])
+            y -= LINE_H
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(PAGE_W - 20, 20, f"Page {page_no} of {total_pages}")
+        pdf.showPage()
+        page_no += 1
+        if progress:
+            progress(page_no - 1, (page_no - 1) / total_pages)
+        if cancelled is not None and cancelled():
+            break
+        if len(page_rows) < ROWS_PER_PAGE:
+            break
+    pdf.save()
+    return page_no - first_page
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_students_pdf(path, where="", params=(), search=None, workers=None,
+                        progress=None, cancelled=None, source=None, sort=None):
+    """Render a view (see sms_db.iter_view) to one PDF; returns pages, or None if cancelled.
+
+    Large reports are split into PART_PAGES-page ranges rendered in a process pool and
+    merged in order. At most two parts per worker are in flight, so memory stays bounded
+    whatever the roster size.
+    """
+    # source: anything with count_view/iter_view (an sms_shards.ShardRouter) instead of the database
+    count, rows_of = (source.count_view, source.iter_view) if source else (count_view, iter_view)
+    total_rows = count(where, params, search)
+    total_pages = max(1, math.ceil(total_rows / ROWS_PER_PAGE))
+    workers = workers or os.cpu_count() or 1
+    rows = chain.from_iterable(rows_of(where, params, search, cancelled=cancelled, sort=sort))
+
+    if workers <= 1 or PdfWriter is None or total_rows < PARALLEL_MIN_ROWS:
+        pages = render_pages(path, rows, 1, total_pages, progress, cancelled)
+        if cancelled is not None and cancelled():
+            os.remove(path)
+            return None
+        return pages
+
+    tmpdir = tempfile.mkdtemp(prefix="sms_pdf_")
+    parts = []
+    pages_done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=spawn_context()) as pool:
+            in_flight = deque()
+            next_page = 1
+            for chunk in _chunks(rows, ROWS_PER_PAGE * PART_PAGES):
+                if cancelled is not None and cancelled():
+                    break
+                part = os.path.join(tmpdir, f"part{len(parts):06d}.pdf")
+                parts.append(part)
+                in_flight.append(pool.submit(render_pages, part, chunk, next_page, total_pages))
+                next_page += math.ceil(len(chunk) / ROWS_PER_PAGE)
+                while len(in_flight) >= workers * 2:
+                    pages_done += in_flight.popleft().result()
+                    if progress:
+                        progress(pages_done, pages_done / total_pages)
+            if cancelled is not None and cancelled():
+                pool.shutdown(cancel_futures=True)
+                return None
+            while in_flight:
+                pages_done += in_flight.popleft().result()
+                if progress:
+                    progress(pages_done, pages_done / total_pages)
+
+        if not parts:
+            return render_pages(path, [], 1, 1)
+        writer = PdfWriter()
+        for part in parts:
+            writer.append(part)
+        writer.add_metadata({"/Title": "Student Records"})
+        with open(path, "wb") as f:
+            writer.write(f)
+        return pages_done
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,644 @@
+"""Local HTTP/JSON service that owns the database, so many desktop clients can share it.
+
+    python sms_server.py --db app.db --port 8765
+    python Student_management_system.py --server http://127.0.0.1:8765
+
+Every call is POST /api/<op> with a JSON body and answers {"result": ...} or
+{"error": ..., "type": ...}. /api/login returns a token that later calls send as
+"Authorization: Bearer <token>". Reads run concurrently on a thread pool over the
+reader connections; writes go through one queue drained by a single writer, which
+commits whatever has queued up meanwhile as one transaction. /api/batch runs a list of
+calls in one round trip.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import secrets
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import sms_db
+from sms_db import (STUDENT_COLUMNS, STUDENT_LABELS, SEARCH_FIELDS, SEARCH_LIMIT, PAGE_SIZE,
+                    MAX_LOADED_PAGES, ROLES, init_db, close_db, authenticate, role_allows,
+                    role_filter, search_available, count_students, fetch_student_page,
+                    fetch_student, fetch_student_range, search_students, count_view, iter_view,
+                    roster_stats, db_rebuild_stats, db_apply_writes, filter_clauses)
+from sms_metrics import metrics
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+READER_THREADS = 8
+# Most writes committed together, and most calls accepted in one /api/batch
+WRITE_BATCH_MAX = 500
+BATCH_MAX_CALLS = 100
+MAX_JSON_BODY = 1024 * 1024
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+SESSION_TTL = 12 * 3600
+STREAM_QUEUE = 8
+FILE_CHUNK = 256 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+            404: "Not Found", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, kind=None):
+        super().__init__(message)
+        self.status = status
+        self.kind = kind
+
+
+class ResponseAborted(Exception):
+    # A response failed after its status line went out: no error reply can follow, the
+    # connection is dropped so the client sees a truncated body, not a wrong one
+    pass
+
+
+class Session:
+    __slots__ = ("username", "role", "expires")
+
+    def __init__(self, username, role):
+        self.username = username
+        self.role = role
+        self.expires = time.time() + SESSION_TTL
+
+
+# ------------------------ Request Checks ------------------------
+# Filters arrive as the same (where, params) the desktop app builds, but only clauses it
+# can actually produce are accepted, and the login's own role filter is always added.
+_CLAUSES = ({"username=?", "birth_date >= ?", "birth_date <= ?"}
+            | {f"{f} LIKE ?" for f in SEARCH_FIELDS} | filter_clauses())
+
+def checked_view(session, body):
+    where = body.get("where") or ""
+    params = tuple(body.get("params") or ())
+    clauses = [c.strip() for c in where.split(" AND ")] if where else []
+    if (any(c not in _CLAUSES for c in clauses) or len(params) != len(clauses)
+            or not all(isinstance(p, str) for p in params)):
+        raise HttpError(400, "unsupported filter")
+    own_where, own_params = role_filter(session.role, session.username)
+    if own_where:
+        where = f"{where} AND {own_where}" if where else own_where
+        params += own_params
+    return where, params
+
+def _key(value):
+    # Keyset positions travel as JSON arrays [sort value, roll_no]
+    if value is None:
+        return None
+    if not isinstance(value, list) or len(value) != 2:
+        raise HttpError(400, "bad page key")
+    return tuple(value)
+
+def _row(value):
+    if (not isinstance(value, list) or len(value) != len(STUDENT_COLUMNS)
+            or not all(v is None or isinstance(v, str) for v in value)):
+        raise HttpError(400, f"a row is {len(STUDENT_COLUMNS)} strings in this order: "
+                             + ", ".join(STUDENT_COLUMNS))
+    if not value[0] or not value[1]:
+        raise HttpError(400, "Roll No and Name are required")
+    return tuple(value)
+
+def _sort(body):
+    # [column, descending] or absent (the default order)
+    sort = body.get("sort")
+    if sort is None:
+        return None
+    if not isinstance(sort, list) or len(sort) != 2 or sort[0] not in STUDENT_COLUMNS:
+        raise HttpError(400, "bad sort")
+    return sort[0], bool(sort[1])
+
+def _search(body):
+    search = body.get("search")
+    if search is None:
+        return None
+    text, field = search
+    if field is not None and field not in SEARCH_FIELDS:
+        raise HttpError(400, f"unknown field {field}")
+    return text, field
+
+def _columns(body):
+    cols = tuple(body.get("columns") or STUDENT_COLUMNS)
+    if not cols or any(c not in STUDENT_COLUMNS for c in cols):
+        raise HttpError(400, "unknown columns")
+    return cols
+
+def _limit(body, default, cap):
+    # 1..cap: SQLite reads a negative LIMIT as no limit at all
+    return max(1, min(int(body.get("limit", default)), cap))
+
+def _workers(body):
+    # PDF render processes, at most one per CPU of the server (None = that many)
+    workers = body.get("workers")
+    return None if workers is None else max(1, min(int(workers), os.cpu_count() or 1))
+
+
+# ------------------------ Service ------------------------
+class StreamResponse:
+    # produce(put, cancelled) runs on a reader thread and calls put(bytes) per chunk
+    def __init__(self, produce, content_type, headers=None):
+        self.produce = produce
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class FileResponse:
+    def __init__(self, path, content_type, headers=None, remove=False):
+        self.path = path
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.remove = remove
+
+
+OPS = {}
+
+def op(name, action=None, login=True):
+    # Register handler(service, session, body) as POST /api/<name>
+    def decorate(fn):
+        OPS[name] = (fn, action, login)
+        return fn
+    return decorate
+
+
+class StudentService:
+    def __init__(self, readers=READER_THREADS):
+        self.sessions = {}
+        self._read_pool = ThreadPoolExecutor(readers, thread_name_prefix="sms-read")
+        self._write_pool = ThreadPoolExecutor(1, thread_name_prefix="sms-write")
+        self._writes = None
+        self._writer_task = None
+
+    async def start(self):
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        # Let queued writes commit, then stop the writer
+        while self._writes is not None and not self._writes.empty():
+            await asyncio.sleep(0.01)
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+        self._read_pool.shutdown(wait=True)
+        self._write_pool.shutdown(wait=True)
+
+    async def read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._read_pool, fn, *args)
+
+    async def write_call(self, fn, *args):
+        # fn on the writer thread, between two groups of queued writes (rebuilds, backups)
+        return await asyncio.get_running_loop().run_in_executor(self._write_pool, fn, *args)
+
+    # ---- writes ----
+    async def write(self, kind, payload):
+        fut = asyncio.get_running_loop().create_future()
+        await self._writes.put((kind, payload, fut))
+        error = await fut
+        if error is not None:
+            raise error
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            # Whatever queued while the last group was committing goes into this one
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                results = await loop.run_in_executor(self._write_pool, db_apply_writes,
+                                                     [(kind, payload) for kind, payload, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, _, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    # ---- sessions ----
+    def session_for(self, headers):
+        auth = headers.get("authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else None
+        session = self.sessions.get(token)
+        if session is None or session.expires < time.time():
+            self.sessions.pop(token, None)
+            raise HttpError(401, "login required")
+        return session
+
+    # ---- dispatch ----
+    def authorize(self, name, headers):
+        # The caller's session for a call, role checked; done before its body is read
+        entry = OPS.get(name)
+        if entry is None:
+            raise HttpError(404, f"no such call: {name}")
+        _, action, login = entry
+        session = self.session_for(headers) if login else None
+        if action is not None and not role_allows(session.role, action):
+            raise HttpError(403, f"role '{session.role}' is not allowed to do this")
+        return session
+
+    async def run(self, name, session, body):
+        entry = OPS.get(name)
+        if entry is None:
+            raise HttpError(404, f"no such call: {name}")
+        fn, action, _ = entry
+        if action is not None and not role_allows(session.role, action):
+            raise HttpError(403, f"role '{session.role}' is not allowed to do this")
+        return await fn(self, session, body)
+
+
+# ---- calls ----
+@op("login", login=False)
+async def _login(service, session, body):
+    username, password = body.get("username"), body.get("password")
+    role = await service.read(authenticate, username, password)
+    if role is None:
+        raise HttpError(401, "invalid username or password")
+    now = time.time()
+    for token in [t for t, s in service.sessions.items() if s.expires < now]:
+        del service.sessions[token]
+    token = secrets.token_urlsafe(24)
+    service.sessions[token] = Session(username, role)
+    return {"token": token, "role": role}
+
+@op("logout")
+async def _logout(service, session, body):
+    for token, s in list(service.sessions.items()):
+        if s is session:
+            del service.sessions[token]
+    return True
+
+@op("info")
+async def _info(service, session, body):
+    return {"search_available": await service.read(search_available), "page_size": PAGE_SIZE,
+            "roles": ROLES, "columns": STUDENT_COLUMNS}
+
+@op("count_students")
+async def _count(service, session, body):
+    return await service.read(count_students, *checked_view(session, body))
+
+@op("fetch_student_page")
+async def _page(service, session, body):
+    where, params = checked_view(session, body)
+    limit = _limit(body, PAGE_SIZE, PAGE_SIZE * MAX_LOADED_PAGES + 1)
+    return await service.read(fetch_student_page, where, params, _key(body.get("after")),
+                              _key(body.get("before")), limit, _sort(body))
+
+@op("fetch_student")
+async def _get(service, session, body):
+    where, params = checked_view(session, body)
+    return await service.read(fetch_student, body.get("roll_no"), where, params)
+
+@op("fetch_student_range")
+async def _range(service, session, body):
+    where, params = checked_view(session, body)
+    limit = _limit(body, PAGE_SIZE * MAX_LOADED_PAGES, PAGE_SIZE * MAX_LOADED_PAGES)
+    return await service.read(fetch_student_range, where, params, _key(body.get("low")),
+                              _key(body.get("high")), limit, _sort(body))
+
+@op("search_students")
+async def _search_students(service, session, body):
+    where, params = checked_view(session, body)
+    field = body.get("field")
+    if field is not None and field not in SEARCH_FIELDS:
+        raise HttpError(400, f"unknown field {field}")
+    limit = _limit(body, SEARCH_LIMIT, SEARCH_LIMIT)
+    return await service.read(search_students, str(body.get("text", "")), field, where, params, limit,
+                              None, False, _sort(body), _key(body.get("after")), _key(body.get("before")))
+
+@op("roster_stats", action="stats")
+async def _stats(service, session, body):
+    return await service.read(roster_stats)
+
+@op("rebuild_stats", action="maintain")
+async def _rebuild_stats(service, session, body):
+    await service.write_call(db_rebuild_stats)
+    return True
+
+@op("backup", action="backup")
+async def _backup(service, session, body):
+    # Snapshot into the server's own backup folder; restores are done on the server host
+    from sms_backup import backup_database
+    report = await service.write_call(backup_database, None, bool(body.get("compress", True)))
+    return {"path": report.path, "pages": report.pages, "size": report.size, "seconds": report.seconds}
+
+@op("insert_student", action="write")
+async def _insert(service, session, body):
+    await service.write("insert", _row(body.get("row")))
+    return True
+
+@op("update_student", action="write")
+async def _update(service, session, body):
+    await service.write("update", _row(body.get("row")))
+    return True
+
+@op("delete_student", action="write")
+async def _delete(service, session, body):
+    await service.write("delete", str(body.get("roll_no")))
+    return True
+
+@op("add_user", action="users")
+async def _add_user(service, session, body):
+    username, password, role = body.get("username"), body.get("password"), body.get("role")
+    if not username or not password or role not in ROLES:
+        raise HttpError(400, "username, password and a valid role are required")
+    await service.write("add_user", (username, password, role))
+    return True
+
+@op("batch")
+async def _batch(service, session, body):
+    # [{"op": ..., "body": {...}}, ...] -> [{"result": ...} | {"error": ..., "type": ...}]
+    calls = body.get("calls") or []
+    if not isinstance(calls, list) or not all(
+            isinstance(c, dict) and isinstance(c.get("op"), str) and isinstance(c.get("body") or {}, dict)
+            for c in calls):
+        raise HttpError(400, 'calls is a list of {"op": name, "body": {...}}')
+    if len(calls) > BATCH_MAX_CALLS:
+        raise HttpError(413, f"at most {BATCH_MAX_CALLS} calls per batch")
+    if any(c.get("op") in ("batch", "login", "export_csv", "export_pdf", "import_csv", "backup") for c in calls):
+        raise HttpError(400, "that call can't be batched")
+    results = await asyncio.gather(*(service.run(c.get("op"), session, dict(c.get("body") or {}))
+                                     for c in calls), return_exceptions=True)
+    return [error_body(r)[1] if isinstance(r, BaseException) else {"result": r} for r in results]
+
+@op("export_csv")
+async def _export_csv(service, session, body):
+    where, params = checked_view(session, body)
+    search = _search(body)
+    columns = _columns(body)
+    sort = _sort(body)
+    total = await service.read(count_view, where, params, search)
+
+    def produce(put, cancelled):
+        buf = io.StringIO()
+        wr = csv.writer(buf)
+        wr.writerow([STUDENT_LABELS[c] for c in columns])
+        for rows in iter_view(where, params, search, columns, cancelled=cancelled, sort=sort):
+            wr.writerows(rows)
+            put(buf.getvalue().encode("utf-8"))
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            put(buf.getvalue().encode("utf-8"))
+
+    return StreamResponse(produce, "text/csv; charset=utf-8", {"X-Total-Rows": str(total)})
+
+@op("export_pdf", action="report")
+async def _export_pdf(service, session, body):
+    from sms_report import export_students_pdf
+    where, params = checked_view(session, body)
+    search = _search(body)
+    sort = _sort(body)
+    workers = _workers(body)
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="sms_srv_")
+    os.close(fd)
+    try:
+        pages = await service.read(lambda: export_students_pdf(path, where, params, search, workers,
+                                                               sort=sort))
+    except BaseException:
+        os.remove(path)
+        raise
+    return FileResponse(path, "application/pdf", {"X-Pages": str(pages)}, remove=True)
+
+@op("import_csv", action="import")
+async def _import_csv(service, session, body):
+    from sms_io import import_students_csv
+    mode = body.get("mode", "skip")
+    report = await service.read(import_students_csv, body["upload"], mode)
+    return {"read": report.read, "written": report.written, "skipped": report.skipped,
+            "invalid": report.invalid, "issues": report.issues, "seconds": report.seconds,
+            "cancelled": report.cancelled}
+
+
+# ------------------------ HTTP ------------------------
+def error_body(exc):
+    # -> (status, {"error": ..., "type": ...}); the type lets clients re-raise the same class
+    if isinstance(exc, HttpError):
+        kind = exc.kind or ("ValueError" if exc.status in (400, 413) else "HttpError")
+        return exc.status, {"error": str(exc), "type": kind}
+    if isinstance(exc, sqlite3.IntegrityError):
+        return 409, {"error": str(exc), "type": "IntegrityError"}
+    if isinstance(exc, (ValueError, TypeError, KeyError)):
+        return 400, {"error": str(exc), "type": "ValueError"}
+    if isinstance(exc, sqlite3.Error):
+        return 500, {"error": str(exc), "type": "DatabaseError"}
+    return 500, {"error": f"{type(exc).__name__}: {exc}", "type": "ServerError"}
+
+
+class HttpServer:
+    """Minimal HTTP/1.1 (keep-alive, Content-Length bodies, chunked responses) over asyncio."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+                if not await self._request(method, target, headers, reader, writer):
+                    break
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _request(self, method, target, headers, reader, writer):
+        # Returns False when the connection can't be reused
+        start = time.perf_counter()
+        url = urlsplit(target)
+        name = url.path[5:] if url.path.startswith("/api/") else None
+        length = int(headers.get("content-length", 0))
+        upload = None
+        status = 200
+        try:
+            if method != "POST" or name is None:
+                raise HttpError(404, "use POST /api/<call>")
+            body = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            # Token and role first: nothing is read or spooled for a caller who'd be refused
+            session = self.service.authorize(name, headers)
+            if name == "import_csv":
+                upload = body["upload"] = await self._spool(reader, length)
+                length = 0
+            elif length > MAX_JSON_BODY:
+                raise HttpError(413, "request body too large")
+            elif length:
+                data = await reader.readexactly(length)
+                length = 0
+                body.update(json.loads(data))
+            result = await self.service.run(name, session, body)
+            if isinstance(result, StreamResponse):
+                await self._send_stream(writer, result)
+            elif isinstance(result, FileResponse):
+                await self._send_file(writer, result)
+            else:
+                await self._send_json(writer, 200, {"result": result})
+            return True
+        except ResponseAborted:
+            status = 500
+            return False
+        except Exception as e:
+            status, payload = error_body(e)
+            if length:
+                # Body wasn't read (rejected up front); the connection is out of sync
+                await self._send_json(writer, status, payload, close=True)
+                return False
+            await self._send_json(writer, status, payload)
+            return True
+        finally:
+            if upload is not None:
+                os.remove(upload)
+            metrics.record({"type": "http", "op": name or url.path, "status": status,
+                            "ms": round((time.perf_counter() - start) * 1000, 3)})
+
+    async def _spool(self, reader, length):
+        if length > MAX_UPLOAD_BYTES:
+            raise HttpError(413, "upload too large")
+        fd, path = tempfile.mkstemp(suffix=".csv", prefix="sms_srv_")
+        with os.fdopen(fd, "wb") as f:
+            left = length
+            while left:
+                chunk = await reader.read(min(left, FILE_CHUNK))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", left)
+                f.write(chunk)
+                left -= len(chunk)
+        return path
+
+    async def _send_json(self, writer, status, payload, close=False):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1") + data)
+        await writer.drain()
+
+    def _head(self, status, content_type, extra):
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}", f"Content-Type: {content_type}"]
+        lines += [f"{k}: {v}" for k, v in extra.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_stream(self, writer, response):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=STREAM_QUEUE)
+        stop = threading.Event()
+
+        def put(item):
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def run():
+            try:
+                response.produce(put, stop.is_set)
+                put(None)
+            except BaseException as e:
+                put(e)
+
+        job = loop.run_in_executor(self.service._read_pool, run)
+        writer.write(self._head(200, response.content_type,
+                                {**response.headers, "Transfer-Encoding": "chunked"}))
+        try:
+            while True:
+                item = await chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise ResponseAborted("stream failed midway") from item
+                writer.write(b"%x\r\n%s\r\n" % (len(item), item))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError as e:
+            raise ResponseAborted("client went away") from e
+        finally:
+            # Client gone or stream failed: stop the producer and unblock its put()
+            stop.set()
+            while not job.done():
+                try:
+                    chunks.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.01)
+
+    async def _send_file(self, writer, response):
+        try:
+            size = os.path.getsize(response.path)
+            writer.write(self._head(200, response.content_type,
+                                    {**response.headers, "Content-Length": str(size)}))
+            try:
+                with open(response.path, "rb") as f:
+                    while True:
+                        chunk = f.read(FILE_CHUNK)
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+                        await writer.drain()
+            except (OSError, ConnectionError) as e:
+                raise ResponseAborted("file failed midway") from e
+        finally:
+            if response.remove:
+                os.remove(response.path)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, readers=READER_THREADS, ready=None):
+    service = StudentService(readers)
+    await service.start()
+    server = await asyncio.start_server(HttpServer(service).handle, host, port)
+    bound = server.sockets[0].getsockname()
+    print(f"Serving on http://{bound[0]}:{bound[1]}", file=sys.stderr, flush=True)
+    if ready is not None:
+        ready(bound)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve the student database over HTTP/JSON.")
+    ap.add_argument("--db", default=sms_db.DB_FILE)
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    ap.add_argument("--readers", type=int, default=READER_THREADS,
+                    help="reader threads (and reader connections)")
+    ap.add_argument("--metrics-log", metavar="DIR", help="write request/query metrics here")
+    args = ap.parse_args(argv)
+
+    sms_db.DB_FILE = args.db
+    sms_db.READER_POOL_SIZE = args.readers
+    if args.metrics_log:
+        metrics.open_log(args.metrics_log)
+    init_db()
+    # Stop on SIGTERM the same way as on Ctrl+C, so the databases close cleanly
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_db()
+        metrics.close_log()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""One database file per campus, behind the same calls as sms_db.
+
+    python sms_cli.py campus add North --path campuses/north.db
+    python sms_cli.py campus assign clerk1 North
+    python sms_cli.py --campus North list
+
+app.db keeps the logins and the list of campuses (see sms_db, Campuses); each campus's
+students live in a file of their own with the full schema (search index, stats, change
+log), so anything done for one campus opens only that file.
+
+ShardRouter answers the desktop app's data-layer calls over a set of campuses. A login
+limited to a campus gets a router over that file alone; an admin gets every campus as
+one roster. Reads fan out over a thread pool and the sorted answers are merged, whole
+views are merged as they stream in, and each write goes to the campus holding the row.
+Roll numbers and login links are unique per file, and every write or import through a
+router is also checked against every other campus in app.db's registry, including the
+ones a login limited to its own campus never reads.
+"""
+import heapq
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import sms_db
+from sms_db import (STUDENT_COLUMNS, SEARCH_LIMIT, PAGE_SIZE, MAX_LOADED_PAGES, STREAM_BATCH,
+                    ConnectionManager, bind_db, sort_key)
+
+# Where `campus add` puts a new campus file, next to app.db
+CAMPUS_DIR = "campuses"
+# Threads answering one fanned-out call; more campuses than this just queue
+FANOUT_WORKERS = 8
+# Batches a campus may read ahead of the merge when a whole view is streamed
+STREAM_AHEAD = 4
+# roll_no -> campus entries remembered from reads, so edits skip the lookup
+MAX_OWNERS = 100000
+# How often a blocked stream checks whether the reader went away (seconds)
+POLL_SECONDS = 0.1
+
+
+def _rank(row):
+    # search rows carry the FTS rank last (ranked=True)
+    return row[-1]
+
+
+def _descending(sort):
+    return bool(sort and sort[1])
+
+
+def _taken(roll_no, username, campus):
+    return sqlite3.IntegrityError(f"Roll No {roll_no} or login {username or '-'} "
+                                  f"already belongs to a student at {campus}")
+
+
+# ------------------------ Campuses ------------------------
+class Campus:
+    """A campus and its database; the file is opened (and migrated) on first use."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def db(self):
+        with self._lock:
+            if self._db is None:
+                manager = ConnectionManager(self.path)
+                with bind_db(manager):
+                    sms_db.init_db()
+                self._db = manager
+            return self._db
+
+    def call(self, fn, *args, **kwargs):
+        # fn (an sms_db function, or anything calling them) run against this campus's file
+        with bind_db(self.db()):
+            return fn(*args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def add_campus(name, path=None):
+    # Register a campus (its file is created on first use); returns the stored path
+    path = path or os.path.join(CAMPUS_DIR, f"{name.lower().replace(' ', '_')}.db")
+    os.makedirs(os.path.dirname(sms_db.campus_file(path)), exist_ok=True)
+    sms_db.db_add_campus(name, path)
+    return path
+
+
+# ------------------------ Router ------------------------
+class ShardRouter:
+    """Same call signatures as the sms_db functions the desktop app uses, over campuses."""
+
+    # Names the desktop app rebinds to this router (as with sms_client.ServiceClient)
+    DATA_API = ("count_students", "fetch_student_page", "fetch_student", "fetch_student_range",
+                "search_students", "db_insert_student", "db_update_student", "db_delete_student",
+                "db_apply_writes", "roster_stats", "db_rebuild_stats", "db_merge_students")
+
+    def __init__(self, campuses, registry=None):
+        self.campuses = list(campuses)
+        if not self.campuses:
+            raise ValueError("No campuses")
+        self._by_name = {c.name: c for c in self.campuses}
+        # Campus new students (and imports, scans, backups) go to when there are several
+        self.insert_campus = self.campuses[0].name if len(self.campuses) == 1 else None
+        self._owners = {}
+        self._owners_lock = threading.Lock()
+        # app.db, for the list of every campus; the ones outside this router are opened
+        # only to check that a new roll number or login isn't theirs
+        self._registry = registry
+        self._peers = {}
+        self._peers_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(FANOUT_WORKERS, thread_name_prefix="campus")
+
+    @classmethod
+    def for_login(cls, campus=None):
+        # Router for a login: its own campus, or every campus for an unrestricted login.
+        # None if no campuses are set up (the app keeps using app.db as one database).
+        rows = sms_db.list_campuses()
+        if not rows:
+            return None
+        if campus is not None:
+            rows = [r for r in rows if r[0] == campus]
+            if not rows:
+                raise ValueError(f"Unknown campus {campus}")
+        return cls((Campus(name, sms_db.campus_file(path)) for name, path in rows), sms_db.get_db())
+
+    @property
+    def names(self):
+        return [c.name for c in self.campuses]
+
+    def campus(self, name=None):
+        # The named campus, or the one chosen for new students
+        name = name or self.insert_campus
+        if name is None:
+            raise ValueError("Choose a campus first")
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise ValueError(f"Unknown campus {name}") from None
+
+    @contextmanager
+    def bound(self, name=None):
+        # sms_db calls in the block go to one campus's file (imports, scans, backups)
+        with bind_db(self.campus(name).db()) as manager:
+            yield manager
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for c in self.campuses + list(self._peers.values()):
+            c.close()
+
+    # ---- fan-out ----
+    def _fanout(self, fn, *args, campuses=None, **kwargs):
+        # fn on every campus at once; results in campus order
+        campuses = self.campuses if campuses is None else campuses
+        if len(campuses) == 1:
+            return [campuses[0].call(fn, *args, **kwargs)]
+        futures = [self._pool.submit(c.call, fn, *args, **kwargs) for c in campuses]
+        return [f.result() for f in futures]
+
+    def _merge(self, answers, key, reverse=False):
+        # Sorted row lists, one per campus -> rows in one sorted order, owners remembered.
+        # A roll number two files both hold (joined before writes were checked across
+        # campuses) is kept once, from the first campus, so callers never see it twice.
+        tagged = [[(row, c) for row in rows] for c, rows in zip(self.campuses, answers)]
+        merged = []
+        seen = set()
+        for row, c in heapq.merge(*tagged, key=lambda t: key(t[0]), reverse=reverse):
+            if row[0] not in seen:
+                seen.add(row[0])
+                merged.append((row, c))
+        self._remember((row[0], c) for row, c in merged)
+        return [row for row, _ in merged]
+
+    def _remember(self, pairs):
+        with self._owners_lock:
+            if len(self._owners) > MAX_OWNERS:
+                self._owners.clear()
+            for roll_no, c in pairs:
+                self._owners[roll_no] = c
+
+    def locate(self, roll_no):
+        # Campus holding roll_no, or None (with one campus, that one: its file has the last word)
+        with self._owners_lock:
+            c = self._owners.get(roll_no)
+        if c is not None or len(self.campuses) == 1:
+            return c or self.campuses[0]
+        found = self._fanout(sms_db.fetch_student, roll_no)
+        for c, row in zip(self.campuses, found):
+            if row is not None:
+                self._remember([(roll_no, c)])
+                return c
+        return None
+
+    # ---- reads ----
+    def count_students(self, where="", params=()):
+        return sum(self._fanout(sms_db.count_students, where, params))
+
+    def count_view(self, where="", params=(), search=None):
+        return sum(self._fanout(sms_db.count_view, where, params, search))
+
+    def fetch_student_page(self, where="", params=(), after=None, before=None, limit=PAGE_SIZE, sort=None):
+        # Each campus's page on either side of the key, merged; the page is the limit
+        # rows nearest to the key
+        answers = self._fanout(sms_db.fetch_student_page, where, params, after, before, limit, sort)
+        rows = self._merge(answers, sort_key(sort), _descending(sort))
+        return rows[-limit:] if before is not None and after is None else rows[:limit]
+
+    def fetch_student(self, roll_no, where="", params=()):
+        with self._owners_lock:
+            c = self._owners.get(roll_no)
+        if c is not None:
+            row = c.call(sms_db.fetch_student, roll_no, where, params)
+            if row is not None:
+                return row
+        for c, row in zip(self.campuses, self._fanout(sms_db.fetch_student, roll_no, where, params)):
+            if row is not None:
+                self._remember([(roll_no, c)])
+                return row
+        return None
+
+    def fetch_student_range(self, where="", params=(), low=None, high=None,
+                            limit=PAGE_SIZE * MAX_LOADED_PAGES, sort=None):
+        answers = self._fanout(sms_db.fetch_student_range, where, params, low, high, limit, sort)
+        return self._merge(answers, sort_key(sort), _descending(sort))[:limit]
+
+    def search_students(self, text, field=None, where="", params=(), limit=SEARCH_LIMIT, cancelled=None,
+                        sort=None, after=None, before=None):
+        # Each campus's best `limit` hits, merged by rank. bm25 weighs terms by how rare they
+        # are in each file, so the order is close to, not always exactly, one big file's.
+        # With a sort, each campus's page of hits merged as fetch_student_page merges.
+        answers = self._fanout(sms_db.search_students, text, field, where, params, limit, cancelled, True,
+                               sort, after, before)
+        if any(a is None for a in answers):
+            return None
+        if sort is None:
+            rows = self._merge([a[0] for a in answers], _rank)[:limit]
+        else:
+            rows = self._merge([a[0] for a in answers], sort_key(sort), _descending(sort))
+            rows = rows[-limit:] if before is not None and after is None else rows[:limit]
+        totals = [a[1] for a in answers]
+        return [r[:-1] for r in rows], None if None in totals else sum(totals)
+
+    def roster_stats(self):
+        stats = {}
+        for part in self._fanout(sms_db.roster_stats):
+            for stat, values in part.items():
+                into = stats.setdefault(stat, {})
+                for value, n in values.items():
+                    into[value] = into.get(value, 0) + n
+        return stats
+
+    def db_rebuild_stats(self):
+        self._fanout(sms_db.db_rebuild_stats)
+
+    def iter_view(self, where="", params=(), search=None, columns=STUDENT_COLUMNS, batch=STREAM_BATCH,
+                  cancelled=None, sort=None):
+        """Stream a view over every campus in one order, as sms_db.iter_view does for one file.
+
+        Each campus reads its sorted rows on a thread of its own, at most STREAM_AHEAD
+        batches ahead, and the k-way merge hands out each batch as soon as every campus
+        has delivered rows past it; memory stays at a few batches per campus.
+        """
+        bad = [c for c in columns if c not in STUDENT_COLUMNS]
+        if bad or not columns:
+            raise ValueError(f"Unknown columns: {bad}")
+        # Full rows are merged (the order needs name and roll_no) and cut down on the way out
+        pick = [STUDENT_COLUMNS.index(c) for c in columns]
+        stop = threading.Event()
+        streams = [self._stream(c, where, params, search, batch, cancelled, sort, stop) for c in self.campuses]
+        if search and sort is None:
+            order = {"key": _rank}
+        else:
+            order = {"key": sort_key(sort), "reverse": _descending(sort)}
+        try:
+            out = []
+            for row in heapq.merge(*streams, **order):
+                out.append(tuple(row[i] for i in pick))
+                if len(out) >= batch:
+                    yield out
+                    out = []
+            if out:
+                yield out
+        finally:
+            stop.set()
+
+    def _stream(self, campus, where, params, search, batch, cancelled, sort, stop):
+        # One campus's rows, read on a thread of its own. Not the fan-out pool: the merge
+        # needs every campus flowing at once, and a stream parks its thread while it waits.
+        q = queue.Queue(STREAM_AHEAD)
+        done = object()
+
+        def offer(item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                # Bound for the whole read: the generator opens its connection on first use
+                with bind_db(campus.db()):
+                    for rows in sms_db.iter_view(where, params, search, STUDENT_COLUMNS, batch,
+                                                 cancelled, ranked=True, sort=sort):
+                        if not offer(rows):
+                            return
+            except BaseException as e:
+                offer(e)
+            offer(done)
+
+        threading.Thread(target=read, name=f"campus-{campus.name}", daemon=True).start()
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
+
+    # ---- writes ----
+    def _others(self, campus):
+        # Every registered campus but this one, whether or not this router reads it
+        if self._registry is None:
+            return [c for c in self.campuses if c is not campus]
+        with bind_db(self._registry):
+            rows = [(name, sms_db.campus_file(path)) for name, path in sms_db.list_campuses()]
+        others = []
+        with self._peers_lock:
+            for name, path in rows:
+                if name == campus.name:
+                    continue
+                c = self._by_name.get(name) or self._peers.get(name)
+                if c is None:
+                    c = self._peers[name] = Campus(name, path)
+                others.append(c)
+        return others
+
+    def _claims(self, campus, roll_nos=(), usernames=()):
+        # -> ({roll_no: campus name}, {username: campus name}) held at any other campus
+        rolls, users = {}, {}
+        others = self._others(campus)
+        if others and (roll_nos or usernames):
+            found = self._fanout(sms_db.student_keys, roll_nos, usernames, campuses=others)
+            for c, (held_rolls, held_users) in zip(others, found):
+                rolls.update(dict.fromkeys(held_rolls - rolls.keys(), c.name))
+                users.update({u: c.name for u in held_users if u not in users})
+        return rolls, users
+
+    def _check_unique(self, campus, row, roll_no=True):
+        # roll_no and the login link are unique per file; across campuses the router checks
+        username = row[STUDENT_COLUMNS.index("username")]
+        rolls, users = self._claims(campus, [row[0]] if roll_no else [], [username] if username else [])
+        held = rolls.get(row[0]) or users.get(username)
+        if held:
+            raise _taken(row[0], username, held)
+
+    def claimed_elsewhere(self, rows, campus=None):
+        """{roll_no: reason} for the student rows whose roll number or login a student at
+        another campus already has; imports into campus (default: the one chosen for new
+        students) skip them as conflicts."""
+        campus = self.campus(campus)
+        at = STUDENT_COLUMNS.index("username")
+        rolls, users = self._claims(campus, [r[0] for r in rows], [r[at] for r in rows if r[at]])
+        return {r[0]: str(_taken(r[0], r[at], rolls.get(r[0]) or users.get(r[at])))
+                for r in rows if r[0] in rolls or r[at] in users}
+
+    def _target(self, kind, payload, placed):
+        # Campus a queued write goes to (None: no such student, nothing to do).
+        # placed: roll_no -> campus (or None once deleted) for writes earlier in the group.
+        roll_no = payload if kind == "delete" else payload[0]
+        if kind == "insert":
+            if placed.get(roll_no) is not None:
+                raise sqlite3.IntegrityError(f"UNIQUE constraint failed: students.roll_no "
+                                             f"({placed[roll_no].name})")
+            holder = self.campus()
+            # The new campus's own file has the last word on its rows; a roll number
+            # deleted earlier in the group is free wherever it was
+            self._check_unique(holder, payload, roll_no=roll_no not in placed)
+        else:
+            holder = placed[roll_no] if roll_no in placed else self.locate(roll_no)
+            if kind == "update" and holder is not None:
+                self._check_unique(holder, payload, roll_no=False)
+        placed[roll_no] = None if kind == "delete" else holder
+        return holder
+
+    def db_apply_writes(self, ops):
+        """Apply [(kind, payload), ...] as sms_db.db_apply_writes does, each campus's share
+        of the group in one transaction of its own file. Returns None or the exception per write."""
+        results = [None] * len(ops)
+        groups = {}
+        placed = {}
+        for i, (kind, payload) in enumerate(ops):
+            try:
+                c = self._target(kind, payload, placed)
+            except (sqlite3.Error, ValueError) as e:
+                results[i] = e
+                continue
+            if c is not None:
+                groups.setdefault(c.name, (c, []))[1].append(i)
+        futures = [(c, idx, self._pool.submit(c.call, sms_db.db_apply_writes, [ops[i] for i in idx]))
+                   for c, idx in groups.values()]
+        for c, idx, future in futures:
+            for i, result in zip(idx, future.result()):
+                results[i] = result
+                if result is None:
+                    kind, payload = ops[i]
+                    if kind == "delete":
+                        with self._owners_lock:
+                            self._owners.pop(payload, None)
+                    else:
+                        self._remember([(payload[0], c)])
+        return results
+
+    def _write(self, kind, payload):
+        error = self.db_apply_writes([(kind, payload)])[0]
+        if error is not None:
+            raise error
+
+    def db_insert_student(self, row):
+        self._write("insert", row)
+
+    def db_update_student(self, row):
+        self._write("update", row)
+
+    def db_delete_student(self, roll_no):
+        self._write("delete", roll_no)
+
+    def db_merge_students(self, keep, drop):
+        # Both records must be at one campus; a merge never moves a student between files
+        c, other = self.locate(keep), self.locate(drop)
+        if c is None or c is not other:
+            raise ValueError(f"Can't merge {drop} into {keep}: both must be existing students "
+                             f"of the same campus")
+        return c.call(sms_db.db_merge_students, keep, drop)
@@ -0,0 +1,297 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+# How often the Tk loop drains finished tasks while any are outstanding
+POLL_MS = 30
+WORKERS = 2
+
+# Write-behind: how long the first queued edit waits for company, and the largest group
+GROUP_COMMIT_MS = 200
+MAX_GROUP = 500
+
+_PROGRESS = object()
+
+
+# ------------------------ Background Tasks ------------------------
+class Task:
+    __slots__ = ("key", "on_done", "on_error", "on_progress", "_cancel", "_results")
+
+    def __init__(self, key, on_done, on_error, on_progress, results):
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self._cancel = threading.Event()
+        self._results = results
+
+    def report(self, *progress):
+        # Called from the worker; on_progress(*progress) runs later on the Tk thread
+        if self.on_progress is not None:
+            self._results.put((self, _PROGRESS, progress))
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        # Passed down to the data layer, which aborts SQLite statements once this is true
+        return self._cancel.is_set()
+
+
+class TaskRunner:
+    """Runs data-layer calls on worker threads and hands results back to the Tk thread.
+
+    Workers never touch widgets: finished tasks go on a queue that the main loop drains
+    with root.after(), so on_done/on_error always run on the Tk thread. Submitting with a
+    key cancels the previous task under that key (a new search supersedes the old one).
+    """
+
+    def __init__(self, root, workers=WORKERS, on_busy=None):
+        self.root = root
+        self.on_busy = on_busy
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms-worker")
+        self._results = queue.Queue()
+        self._latest = {}
+        self._pending = 0
+        self._polling = False
+        self._closed = False
+
+    def submit(self, fn, on_done=None, on_error=None, key=None, on_progress=None):
+        # fn(task) runs on a worker; check task.cancelled() in long loops, task.report() progress
+        task = Task(key, on_done, on_error, on_progress, self._results)
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._latest[key] = task
+        self._pending += 1
+        if self._pending == 1 and self.on_busy:
+            self.on_busy(True)
+        self._pool.submit(self._run, task, fn)
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+        return task
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def cancel(self, key):
+        task = self._latest.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def _run(self, task, fn):
+        try:
+            if task.cancelled():
+                self._results.put((task, None, None))
+                return
+            self._results.put((task, fn(task), None))
+        except BaseException as exc:
+            self._results.put((task, None, exc))
+
+    def _poll(self):
+        if self._closed:
+            return
+        while True:
+            try:
+                task, result, exc = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result is _PROGRESS:
+                # Progress messages carry their arguments in the error slot
+                if not task.cancelled():
+                    self._call(task.on_progress, *exc)
+                continue
+            self._pending -= 1
+            if task.key is not None and self._latest.get(task.key) is task:
+                del self._latest[task.key]
+            if task.cancelled():
+                continue
+            if exc is not None and task.on_error is None:
+                self._report(exc)
+            elif exc is not None:
+                self._call(task.on_error, exc)
+            elif task.on_done:
+                self._call(task.on_done, result)
+
+        if self._pending:
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+            if self.on_busy:
+                self.on_busy(False)
+
+    def _call(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as err:
+            self._report(err)
+
+    def _report(self, err):
+        # Same path Tk uses for a failing callback; keeps the poll loop alive
+        self.root.report_callback_exception(type(err), err, err.__traceback__)
+
+    def shutdown(self):
+        self._closed = True
+        for task in self._latest.values():
+            task.cancel()
+        self._latest.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------ Write-Behind Queue ------------------------
+class PendingWrite:
+    __slots__ = ("kind", "payload", "on_done", "on_error")
+
+    def __init__(self, kind, payload, on_done, on_error):
+        self.kind = kind
+        self.payload = payload
+        self.on_done = on_done
+        self.on_error = on_error
+
+
+class WriteQueue:
+    """Accepts edits at once and commits them in groups on a writer thread.
+
+    The first queued edit waits up to interval_ms (or until max_group are waiting) so
+    edits made in quick succession share one transaction. apply_fn(ops) commits a group
+    and returns one result per edit, None or the exception it raised (see
+    sms_db.db_apply_writes). on_done/on_error come back on the Tk thread as with
+    TaskRunner; on_change(pending) reports how many edits are still unsaved.
+    """
+
+    def __init__(self, root, apply_fn, interval_ms=GROUP_COMMIT_MS, max_group=MAX_GROUP, on_change=None):
+        self.root = root
+        self.apply_fn = apply_fn
+        self.interval = interval_ms / 1000
+        self.max_group = max_group
+        self.on_change = on_change
+        self._cond = threading.Condition()
+        self._queue = []
+        self._unsaved = 0        # queued or committing (writer side)
+        self._flushing = False
+        self._closed = False
+        self._results = queue.Queue()
+        self._pending = 0        # callbacks not yet delivered (Tk side)
+        self._polling = False
+        self._thread = threading.Thread(target=self._run, name="sms-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, kind, payload, on_done=None, on_error=None):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write queue is closed.")
+            self._queue.append(PendingWrite(kind, payload, on_done, on_error))
+            self._unsaved += 1
+            self._cond.notify_all()
+        self._pending += 1
+        self._changed()
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Linger for more edits unless someone is waiting on a flush
+                deadline = time.monotonic() + self.interval
+                while len(self._queue) < self.max_group and not (self._flushing or self._closed):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                group = self._queue[:self.max_group]
+                del self._queue[:self.max_group]
+            try:
+                results = self.apply_fn([(w.kind, w.payload) for w in group])
+            except Exception as e:
+                results = [e] * len(group)
+            for write, result in zip(group, results):
+                self._results.put((write, result))
+            with self._cond:
+                self._unsaved -= len(group)
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        # Block until every edit submitted so far is committed (or has failed), then run
+        # their callbacks; returns False on timeout
+        saved = self.wait(timeout)
+        self._deliver()
+        return saved
+
+    def wait(self, timeout=None):
+        # flush() for a worker thread: blocks the same way, but leaves the callbacks to
+        # the Tk thread's poll
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            saved = self._cond.wait_for(lambda: self._unsaved == 0, timeout)
+            self._flushing = False
+        return saved
+
+    def close(self):
+        # Flush-on-exit: everything accepted is written before this returns
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._deliver()
+
+    def _poll(self):
+        self._deliver()
+        if self._pending:
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _deliver(self):
+        delivered = False
+        while True:
+            try:
+                write, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            delivered = True
+            if result is None:
+                if write.on_done:
+                    self._call(write.on_done)
+            elif write.on_error:
+                self._call(write.on_error, result)
+            else:
+                self._report(result)
+        if delivered:
+            self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self._call(self.on_change, self._pending)
+
+    def _call(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as err:
+            self._report(err)
+
+    def _report(self, err):
+        self.root.report_callback_exception(type(err), err, err.__traceback__)
+
+
+# ------------------------ Worker Processes ------------------------
+def spawn_context():
+    # multiprocessing context for work handed to other processes (PDF parts, duplicate
+    # scans). spawn, not fork: the parent is a threaded Tk process, and a forked child
+    # would inherit whatever locks those threads held at that moment.
+    return get_context("spawn")
@@ -0,0 +1,135 @@
+"""Light and dark looks for the desktop app as ttk themes, built once per Tk interpreter.
+
+Widgets ask for a look by style name ("Danger.TButton", "Muted.TLabel", "Card.TFrame"),
+never by colour. Both palettes are registered up front as themes derived from "clam"
+with the same fonts, paddings and reliefs, so a switch is one theme_use(): Tk restyles
+every ttk widget itself, nothing changes size and nothing is walked in Python.
+
+The few classic Tk widgets that have no ttk version (the windows themselves and Text
+boxes) are registered with track() and recoloured on a switch; there are a handful of
+them however big the dashboard gets.
+"""
+from tkinter import ttk
+
+PALETTES = {
+    "light": {"window": "white", "backdrop": "#ecf0f1", "bg": "white", "fg": "black",
+              "muted": "#7f8c8d", "field": "white", "button": "#ecf0f1", "active": "#dfe6e9",
+              "border": "#bdc3c7", "title": "#34495e", "heading": "#ecf0f1", "select": "#3498db"},
+    "dark": {"window": "#1f2937", "backdrop": "#0f172a", "bg": "#111827", "fg": "white",
+             "muted": "#9ca3af", "field": "#0b1220", "button": "#374151", "active": "#4b5563",
+             "border": "#4b5563", "title": "#0f172a", "heading": "#1f2937", "select": "#2563eb"},
+}
+# Coloured buttons look the same in both themes: style "<name>.TButton" -> background
+ACCENTS = {"Primary": "#2980b9", "Success": "#27ae60", "Danger": "#c0392b", "Warning": "#e67e22",
+           "Accent": "#8e44ad", "Info": "#16a085", "Dark": "#34495e"}
+BUTTON_FONT = ("Arial", 10)
+
+
+def _shade(colour, factor=0.85):
+    r, g, b = (int(colour[i:i + 2], 16) for i in (1, 3, 5))
+    return "#%02x%02x%02x" % (int(r * factor), int(g * factor), int(b * factor))
+
+
+def _settings(p):
+    # theme_create() settings for one palette. A derived theme borrows clam's layouts and
+    # elements but not its style options, so every style used is spelled out here.
+    settings = {
+        ".": {"configure": {"background": p["bg"], "foreground": p["fg"], "bordercolor": p["border"],
+                            "lightcolor": p["bg"], "darkcolor": p["bg"], "troughcolor": p["button"],
+                            "fieldbackground": p["field"], "insertcolor": p["fg"],
+                            "selectbackground": p["select"], "selectforeground": "white",
+                            "selectborderwidth": 0, "font": "TkDefaultFont"},
+              "map": {"background": [("disabled", p["bg"])], "foreground": [("disabled", p["muted"])]}},
+        "Card.TFrame": {"configure": {"borderwidth": 4, "relief": "ridge"}},
+        "Title.TLabel": {"configure": {"background": p["title"], "foreground": "white", "anchor": "center"}},
+        "Muted.TLabel": {"configure": {"foreground": p["muted"]}},
+        "TButton": {"configure": {"background": p["button"], "lightcolor": p["button"],
+                                  "darkcolor": p["button"], "font": BUTTON_FONT, "anchor": "center",
+                                  "padding": 3, "relief": "raised"},
+                    "map": {"background": [("disabled", p["bg"]), ("pressed", p["border"]),
+                                           ("active", p["active"])]}},
+        "TEntry": {"configure": {"padding": 1, "insertwidth": 1},
+                   "map": {"fieldbackground": [("disabled", p["bg"]), ("readonly", p["bg"])],
+                           "bordercolor": [("focus", p["select"])]}},
+        "TCombobox": {"configure": {"padding": 1, "background": p["button"], "arrowcolor": p["fg"]},
+                      "map": {"fieldbackground": [("readonly", p["field"])],
+                              "foreground": [("readonly", p["fg"])],
+                              "selectbackground": [("readonly", p["field"])],
+                              "selectforeground": [("readonly", p["fg"])],
+                              "background": [("active", p["active"])],
+                              "bordercolor": [("focus", p["select"])]}},
+        "Treeview": {"configure": {"background": p["field"], "fieldbackground": p["field"],
+                                   "foreground": p["fg"]},
+                     "map": {"background": [("selected", p["select"])], "foreground": [("selected", "white")]}},
+        "Heading": {"configure": {"background": p["heading"], "foreground": p["fg"], "font": "TkHeadingFont",
+                                  "relief": "raised", "padding": 3},
+                    "map": {"background": [("active", p["active"])]}},
+        "TProgressbar": {"configure": {"background": p["select"], "troughcolor": p["button"]}},
+        "TScrollbar": {"configure": {"background": p["button"], "troughcolor": p["bg"], "arrowcolor": p["fg"]},
+                       "map": {"background": [("active", p["active"])]}},
+    }
+    for name in ("TCheckbutton", "TRadiobutton"):
+        settings[name] = {"configure": {"indicatorbackground": p["field"], "indicatorforeground": p["fg"],
+                                        "indicatormargin": (1, 1, 4, 1), "padding": 2},
+                          "map": {"background": [("active", p["bg"])],
+                                  "indicatorbackground": [("pressed", p["button"]), ("disabled", p["bg"])]}}
+    for name, colour in ACCENTS.items():
+        settings[f"{name}.TButton"] = {
+            "configure": {"background": colour, "foreground": "white", "lightcolor": colour, "darkcolor": colour},
+            "map": {"background": [("disabled", p["border"]), ("pressed", _shade(colour, 0.7)),
+                                   ("active", _shade(colour))],
+                    "foreground": [("disabled", p["muted"])]}}
+    return settings
+
+
+# ------------------------ Themes ------------------------
+class Themes:
+    """The app's looks on one Tk interpreter; use() switches every window at once."""
+
+    def __init__(self, root, name="light"):
+        self.root = root
+        self.style = ttk.Style(root)
+        known = self.style.theme_names()
+        for key, palette in PALETTES.items():
+            if f"sms-{key}" not in known:
+                self.style.theme_create(f"sms-{key}", parent="clam", settings=_settings(palette))
+        self._plain = []    # [(widget, kind)] classic Tk widgets to recolour
+        self.name = None
+        self.use(name)
+
+    @property
+    def dark(self):
+        return self.name == "dark"
+
+    def use(self, name):
+        self.name = name
+        self.style.theme_use(f"sms-{name}")
+        p = PALETTES[name]
+        # Combobox drop-down lists are plain Listboxes, made on first open from these
+        for option, key in (("background", "field"), ("foreground", "fg"), ("selectBackground", "select")):
+            self.root.option_add(f"*TCombobox*Listbox.{option}", p[key])
+        self._prune()
+        for widget, kind in self._plain:
+            self._paint(widget, kind)
+
+    def track(self, widget, kind="window"):
+        # A Tk/Toplevel window ("window"), a window behind a card ("backdrop", the login) or
+        # a Text box ("text"): coloured now and on every switch
+        self._prune()
+        self._plain.append((widget, kind))
+        self._paint(widget, kind)
+        return widget
+
+    def _prune(self):
+        self._plain = [(w, kind) for w, kind in self._plain if w.winfo_exists()]
+
+    def _paint(self, widget, kind):
+        p = PALETTES[self.name]
+        if kind == "text":
+            widget.config(bg=p["field"], fg=p["fg"], insertbackground=p["fg"], selectbackground=p["select"],
+                          selectforeground="white", highlightbackground=p["border"],
+                          highlightcolor=p["select"])
+        elif kind == "backdrop":
+            widget.config(bg=p["backdrop"])
+        else:
+            widget.config(bg=p["window"] if widget is self.root else p["bg"])